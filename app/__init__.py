@@ -11,6 +11,24 @@ from flask_restx import Api
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 from neomodel import config
 
+from .cache import cache
+from .events import broker
+from .explore import explore
+from .facets import facet_index
+from .idempotency import idempotency
+from .like_buffer import like_buffer
+from .liked_cache import liked_cache
+from .metrics import metrics
+from .notifications import notifications
+from .profiler import profiler
+from .purge import purger
+from .repository import repository
+from .skills import skill_catalog
+from .timeline import timeline
+from .traffic import recorder
+from .trending import trending
+from .typeahead import user_typeahead
+
 authorizations = {
     "Bearer Auth": {"type": "apiKey", "in": "header", "name": "Authorization"}
 }
@@ -47,15 +65,40 @@ def create_app(config_object):
     with app.app_context():
         api.init_app(app)
         jwt.init_app(app)
+        cache.init_app(app)
+        broker.init_app(app)
+        explore.init_app(app)
+        facet_index.init_app(app)
+        idempotency.init_app(app)
+        like_buffer.init_app(app)
+        liked_cache.init_app(app)
+        metrics.init_app(app)
+        notifications.init_app(app)
+        profiler.init_app(app)
+        purger.init_app(app)
+        repository.init_app(app)
+        skill_catalog.init_app(app)
+        timeline.init_app(app)
+        trending.init_app(app)
+        user_typeahead.init_app(app)
+        recorder.init_app(app)
         if app.config.get("ENABLE_CORS", True):
             cors.init_app(app)
 
     from .routes.comment_routes import comment_nc
+    from .routes.event_routes import events_nc
+    from .routes.notification_routes import notifications_nc
+    from .routes.ops_routes import ops_nc
     from .routes.post_routes import post_nc
+    from .routes.skill_routes import skills_nc
     from .routes.user_routes import user_nc
 
     api.add_namespace(post_nc)
     api.add_namespace(user_nc)
     api.add_namespace(comment_nc)
+    api.add_namespace(ops_nc)
+    api.add_namespace(events_nc)
+    api.add_namespace(skills_nc)
+    api.add_namespace(notifications_nc)
 
     return app
@@ -0,0 +1,313 @@
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock, local
+
+
+class MemoryBackend:
+    """
+    In-process LRU cache with per-entry TTL. Tag invalidation times are kept
+    apart from the LRU so an evicted tag can never make a stale entry valid.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl):
+        """Set ``key`` unless it holds a live value. True if it was set."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[1] > time.time():
+                return False
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_tags(self, tags):
+        with self._lock:
+            return {tag: self._tags.get(tag, 0.0) for tag in tags}
+
+    def touch_tags(self, tags, now):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = now
+
+    def prune_tags(self, older_than):
+        with self._lock:
+            self._tags = {
+                tag: at for tag, at in self._tags.items() if at >= older_than
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """
+    Local key-value store in a sqlite file, shared by every worker process
+    on the host. Values are pickled.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tags ("
+                "tag TEXT PRIMARY KEY, invalidated_at REAL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        if row[1] <= time.time():
+            self.delete(key)
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at) "
+            "VALUES (?, ?, ?)",
+            (key, pickle.dumps(value), time.time() + ttl),
+        )
+
+    def add(self, key, value, ttl):
+        """Set ``key`` unless it holds a live value. True if it was set."""
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO entries (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+            "expires_at = excluded.expires_at WHERE expires_at <= ?",
+            (key, pickle.dumps(value), now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def get_tags(self, tags):
+        tags = list(tags)
+        found = dict.fromkeys(tags, 0.0)
+        if tags:
+            placeholders = ",".join("?" * len(tags))
+            rows = self._connection().execute(
+                "SELECT tag, invalidated_at FROM tags "
+                f"WHERE tag IN ({placeholders})",
+                tags,
+            )
+            found.update(rows)
+        return found
+
+    def touch_tags(self, tags, now):
+        self._connection().executemany(
+            "INSERT OR REPLACE INTO tags (tag, invalidated_at) VALUES (?, ?)",
+            [(tag, now) for tag in tags],
+        )
+
+    def prune_tags(self, older_than):
+        conn = self._connection()
+        conn.execute(
+            "DELETE FROM tags WHERE invalidated_at < ?", (older_than,)
+        )
+        conn.execute(
+            "DELETE FROM entries WHERE expires_at <= ?", (time.time(),)
+        )
+        conn.execute(
+            "DELETE FROM entries WHERE key NOT IN ("
+            "SELECT key FROM entries ORDER BY expires_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM tags")
+
+    def __len__(self):
+        return (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM entries")
+            .fetchone()[0]
+        )
+
+
+class ResultCache:
+    """
+    Read-through cache for model read methods.
+
+    Every entry remembers when its load started and which tags it depends on
+    (``post:<uuid>``, ``follows:<uuid>``, ...). Write paths call
+    ``invalidate`` with the tags they touched; an entry loaded before the
+    latest invalidation of any of its tags is treated as a miss.
+    """
+
+    def __init__(self, backend=None, default_ttl=60, enabled=True):
+        self.backend = MemoryBackend() if backend is None else backend
+        self.default_ttl = default_ttl
+        self.max_ttl = default_ttl
+        self.enabled = enabled
+        self._stats_lock = Lock()
+        self._last_prune = time.time()
+        self.reset_stats()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("CACHE_ENABLED", True)
+        self.default_ttl = config.get("CACHE_DEFAULT_TTL", 60)
+        self.max_ttl = max(self.default_ttl, config.get("CACHE_MAX_TTL", 0))
+
+        backend = config.get("CACHE_BACKEND", "memory")
+        max_entries = config.get("CACHE_MAX_ENTRIES", 10000)
+        if backend == "sqlite":
+            self.backend = SqliteBackend(
+                config.get("CACHE_SQLITE_PATH", "cache.sqlite3"), max_entries
+            )
+        elif backend == "memory":
+            self.backend = MemoryBackend(max_entries)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND '{backend}'")
+
+        app.extensions["result_cache"] = self
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                "hits": 0,
+                "misses": 0,
+                "stale": 0,
+                "invalidations": 0,
+                "served_age_total": 0.0,
+                "served_age_max": 0.0,
+            }
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get_or_load(self, key, loader, tags=(), ttl=None):
+        """
+        Return the cached value for ``key`` or call ``loader`` and store its
+        result. ``tags`` may be a list or a callable receiving the loaded
+        value, for entries whose dependencies are only known after loading.
+        """
+        if not self.enabled:
+            return loader()
+
+        now = time.time()
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, entry_tags, loaded_at = entry
+            current = self.backend.get_tags(entry_tags)
+            if all(current[tag] < loaded_at for tag in entry_tags):
+                age = now - loaded_at
+                with self._stats_lock:
+                    self._stats["hits"] += 1
+                    self._stats["served_age_total"] += age
+                    self._stats["served_age_max"] = max(
+                        self._stats["served_age_max"], age
+                    )
+                return value
+            self._count("stale")
+            self.backend.delete(key)
+
+        self._count("misses")
+        value = loader()
+        entry_tags = sorted(set(tags(value) if callable(tags) else tags))
+        ttl = min(ttl or self.default_ttl, self.max_ttl)
+        self.backend.set(key, (value, entry_tags, now), ttl)
+        return value
+
+    def invalidate(self, *tags):
+        if not tags:
+            return
+        now = time.time()
+        self.backend.touch_tags(tags, now)
+        self._count("invalidations", len(tags))
+
+        if now - self._last_prune > self.max_ttl:
+            self._last_prune = now
+            self.backend.prune_tags(now - self.max_ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        served_age_total = stats.pop("served_age_total")
+        stats.update(
+            {
+                "backend": type(self.backend).__name__,
+                "entries": len(self.backend),
+                "hit_ratio": (
+                    round(stats["hits"] / lookups, 4) if lookups else 0.0
+                ),
+                "served_age_avg": (
+                    round(served_age_total / stats["hits"], 3)
+                    if stats["hits"]
+                    else 0.0
+                ),
+                "served_age_max": round(stats["served_age_max"], 3),
+            }
+        )
+        return stats
+
+
+cache = ResultCache()
@@ -0,0 +1,23 @@
+import hashlib
+
+from flask import Response, json, request
+
+
+def make_etag(stamp):
+    """Weak ETag value for a version stamp returned by a model."""
+    raw = json.dumps(stamp, default=str, sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def not_modified(etag):
+    """A 304 response if the client already holds ``etag``, else None."""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    return response
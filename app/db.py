@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+from flask import current_app, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from neomodel import config as neomodel_config
+from neomodel import db
+from neomodel.util import TransactionProxy
+
+READ = "READ"
+WRITE = "WRITE"
+
+
+class BookmarkStore:
+    """
+    Keeps the last Neo4j bookmark seen by each user session, so that a read
+    issued after a write by the same user is routed to a cluster member that
+    has already caught up with that write.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._bookmarks = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            bookmarks = self._bookmarks.get(key)
+            if bookmarks is not None:
+                self._bookmarks.move_to_end(key)
+            return bookmarks
+
+    def set(self, key, bookmarks):
+        if key is None or not bookmarks:
+            return
+        with self._lock:
+            self._bookmarks[key] = bookmarks
+            self._bookmarks.move_to_end(key)
+            while len(self._bookmarks) > self.max_size:
+                self._bookmarks.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._bookmarks.clear()
+
+
+bookmark_store = BookmarkStore()
+
+
+def session_key():
+    """The identity bookmarks are tracked under, or None outside a JWT request."""
+    if not has_request_context():
+        return None
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+def _bookmarks_enabled():
+    if not has_request_context():
+        return False
+    return current_app.config.get("NEO4J_CAUSAL_BOOKMARKS", True)
+
+
+@contextmanager
+def transaction(access_mode):
+    """
+    Runs the enclosed neomodel calls in one explicit transaction with the
+    given access mode. Nested calls join the transaction already in progress,
+    so a read helper used inside a write block stays on the write session.
+    """
+    if db._active_transaction is not None:
+        yield
+        return
+
+    key = session_key() if _bookmarks_enabled() else None
+    proxy = TransactionProxy(db, access_mode=access_mode)
+    proxy.bookmarks = bookmark_store.get(key)
+    with proxy:
+        yield
+    bookmark_store.set(key, getattr(proxy, "last_bookmark", None))
+
+
+def read_transaction():
+    return transaction(READ)
+
+
+def write_transaction():
+    return transaction(WRITE)
+
+
+def read_query(query, params=None):
+    with read_transaction():
+        return db.cypher_query(query, params)
+
+
+def write_query(query, params=None):
+    with write_transaction():
+        return db.cypher_query(query, params)
+
+
+def stream_query(query, params=None, fetch_size=500):
+    """
+    Iterate over the rows of a read query as the driver pulls them, at most
+    ``fetch_size`` records per round trip, instead of materializing the
+    whole result like ``db.cypher_query`` does.
+
+    The session is opened lazily on first iteration, so the returned
+    generator can be handed to a streaming response. Bookmarks are resolved
+    up front while the request context is still available.
+    """
+    key = session_key() if _bookmarks_enabled() else None
+    bookmarks = bookmark_store.get(key)
+
+    def rows():
+        if not db.url:
+            db.set_connection(neomodel_config.DATABASE_URL)
+        with db.driver.session(
+            database=db._database_name,
+            default_access_mode=READ,
+            fetch_size=fetch_size,
+            bookmarks=bookmarks,
+        ) as session:
+            for record in session.run(query, params or {}):
+                yield record.values()
+
+    return rows()
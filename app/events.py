@@ -0,0 +1,128 @@
+import itertools
+import json
+import logging
+import queue
+import time
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    """
+    One SSE connection. Events are buffered in a bounded queue; when the
+    client reads slower than events arrive, new events are dropped and the
+    client is told to resync instead of the worker buffering without bound.
+    """
+
+    def __init__(self, topics, queue_size):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._overflowed = False
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            self._overflowed = True
+
+    def next_message(self, timeout):
+        """The next message, a resync notice after drops, or None on timeout."""
+        if self._overflowed and self.queue.empty():
+            self._overflowed = False
+            return ("resync", {"dropped": self.dropped}, None)
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """
+    In-process pub/sub between the write paths and the SSE stream. Each
+    worker process has its own broker, so clients only see events from
+    writes handled by the worker they are connected to.
+    """
+
+    def __init__(self, max_subscribers=200, queue_size=100, heartbeat=15):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._subscribers = {}
+        self._listeners = []
+        self._lock = Lock()
+        self._ids = itertools.count(1)
+
+    def init_app(self, app):
+        config = app.config
+        self.max_subscribers = config.get("EVENTS_MAX_SUBSCRIBERS", 200)
+        self.queue_size = config.get("EVENTS_QUEUE_SIZE", 100)
+        self.heartbeat = config.get("EVENTS_HEARTBEAT", 15)
+        app.extensions["event_broker"] = self
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(
+                    f"Event stream limit of {self.max_subscribers} reached"
+                )
+            self._subscribers[id(subscription)] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.pop(id(subscription), None)
+
+    def listen(self, callback):
+        """Call ``callback(event, data)`` for every event published."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def publish(self, event, data, *topics):
+        """Queue ``event`` for every subscriber of any of ``topics``."""
+        for callback in self._listeners:
+            try:
+                callback(event, data)
+            except Exception:
+                logger.exception("Event listener failed on %s", event)
+        message = (event, data, next(self._ids))
+        topics = set(topics)
+        with self._lock:
+            subscribers = [
+                subscription
+                for subscription in self._subscribers.values()
+                if subscription.topics & topics
+            ]
+        for subscription in subscribers:
+            subscription.offer(message)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, subscription):
+        """Generator of SSE frames for ``subscription`` until disconnected."""
+        try:
+            yield f"retry: {int(self.heartbeat * 1000)}\n\n"
+            while True:
+                message = subscription.next_message(self.heartbeat)
+                if message is None:
+                    yield f": keep-alive {int(time.time())}\n\n"
+                    continue
+                event, data, event_id = message
+                frame = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event_id is not None:
+                    frame = f"id: {event_id}\n" + frame
+                yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+
+broker = EventBroker()
@@ -0,0 +1,176 @@
+import heapq
+import logging
+from threading import Lock, Thread
+
+from app.db import read_query
+from app.events import broker
+from app.models.post import Post
+from app.models.user import CREATOR_CARD
+from app.pagination import post_cursor
+
+logger = logging.getLogger(__name__)
+
+
+class ExploreBuffer:
+    """
+    Fixed-size ring buffer of the latest posts across the network, for the
+    explore timeline.
+
+    Every post gets the next sequence number and lives in slot
+    ``seq % size`` until ``size`` newer posts overwrite it, so adding a post
+    is O(1); reading a page picks the newest posts older than the cursor
+    out of the buffer. Cursors are ``post_cursor`` positions rather than
+    sequence numbers, which differ between workers, so a cursor from one
+    worker pages on through another's buffer. Deleted posts leave an empty
+    slot behind. Creator cards are kept apart from the posts so a profile
+    edit updates all of them.
+
+    The buffer is per worker: it is filled from post creation on this
+    worker and seeded on start from the newest posts in the database.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self._slots = [None] * size
+        self._next_seq = 1
+        self._seqs = {}
+        self._creators = {}
+        self._lock = Lock()
+        self._loader = None
+
+    def init_app(self, app):
+        config = app.config
+        size = config.get("EXPLORE_BUFFER_SIZE", 1000)
+        if size != self.size:
+            self.size = size
+            self._slots = [None] * size
+        app.extensions["explore"] = self
+
+        broker.listen(self._on_event)
+        if config.get("EXPLORE_LOAD_ON_START", True) and self._loader is None:
+            self._loader = Thread(
+                target=self._load, name="explore", daemon=True
+            )
+            self._loader.start()
+
+    def _on_event(self, event, data):
+        if event == "post.deleted":
+            self.remove(data["uuid"])
+
+    def _load(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Loading the explore buffer failed")
+
+    def load(self):
+        """Seed the buffer with the newest posts, before any added since."""
+        # The created_at range index serves this ordered seek without
+        # sorting the Post label.
+        results, _ = read_query(
+            f"""
+            MATCH (post:Post)
+            WHERE post.created_at IS NOT NULL
+            WITH post
+            ORDER BY post.created_at DESC
+            LIMIT $size
+            MATCH (post)<-[:CREATED_POST]-(creator:User)
+            RETURN post, creator {CREATOR_CARD}
+            ORDER BY post.created_at
+            """,
+            {"size": self.size},
+        )
+        with self._lock:
+            added = [entry for entry, _ in self._live()]
+            added_uuids = {post.uuid for post, _ in added}
+            self._slots = [None] * self.size
+            self._next_seq = 1
+            self._seqs = {}
+            for node, creator in results:
+                self._creators.setdefault(creator["uuid"], creator)
+                post = Post.inflate(node)
+                if post.uuid not in added_uuids:
+                    self._append((post, creator["uuid"]))
+            for entry in added:
+                self._append(entry)
+
+    # Writes
+
+    def add(self, post, creator):
+        """Append ``post``, just created by the user ``creator``."""
+        with self._lock:
+            self._creators[creator.uuid] = self._creator_card(creator)
+            self._append((post, creator.uuid))
+
+    def _append(self, entry):
+        seq = self._next_seq
+        self._next_seq += 1
+        slot = seq % self.size
+        evicted = self._slots[slot]
+        if evicted is not None:
+            self._seqs.pop(evicted[1][0].uuid, None)
+        self._slots[slot] = (seq, entry, post_cursor(entry[0]))
+        self._seqs[entry[0].uuid] = seq
+
+    def update(self, post):
+        """Replace a buffered post with its edited version."""
+        with self._lock:
+            seq = self._seqs.get(post.uuid)
+            if seq is not None:
+                slot = seq % self.size
+                _, (_, creator_uuid), key = self._slots[slot]
+                self._slots[slot] = (seq, (post, creator_uuid), key)
+
+    def update_creator(self, user):
+        with self._lock:
+            if user.uuid in self._creators:
+                self._creators[user.uuid] = self._creator_card(user)
+
+    def remove(self, post_uuid):
+        with self._lock:
+            seq = self._seqs.pop(post_uuid, None)
+            if seq is not None:
+                self._slots[seq % self.size] = None
+
+    @staticmethod
+    def _creator_card(user):
+        return {
+            "uuid": user.uuid,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "profile_image": user.profile_image,
+            "title": user.title,
+        }
+
+    # Reads
+
+    def _live(self):
+        """``(entry, post_cursor)`` of the buffered posts, oldest first."""
+        start = max(1, self._next_seq - self.size)
+        live = []
+        for seq in range(start, self._next_seq):
+            item = self._slots[seq % self.size]
+            if item is not None and item[0] == seq:
+                live.append(item[1:])
+        return live
+
+    def page(self, cursor=None, limit=10):
+        """
+        Up to ``limit`` posts older than the ``post_cursor`` ``cursor``
+        (None for the newest), newest first with their ``_creator`` card
+        set, and the cursor of the next page.
+        """
+        with self._lock:
+            live = self._live()
+            if cursor is not None:
+                live = [item for item in live if item[1] < cursor]
+            items = heapq.nlargest(limit + 1, live, key=lambda item: item[1])
+            posts = []
+            for (post, creator_uuid), _ in items[:limit]:
+                post._creator = self._creators.get(creator_uuid)
+                posts.append(post)
+        next_cursor = items[limit - 1][1] if len(items) > limit else None
+        return posts, next_cursor
+
+
+explore = ExploreBuffer()
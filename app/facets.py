@@ -0,0 +1,184 @@
+import heapq
+import logging
+import re
+import time
+from array import array
+from bisect import bisect_left
+from threading import Lock, Thread
+
+from app.db import read_query
+
+logger = logging.getLogger(__name__)
+
+TITLE_STOPWORDS = frozenset(
+    {"a", "an", "and", "at", "for", "in", "of", "on", "the", "to", "with"}
+)
+
+
+def title_keywords(title):
+    words = (
+        word.strip(".")
+        for word in re.findall(r"[\w+#.]+", (title or "").casefold())
+    )
+    return {
+        word for word in words if len(word) > 1 and word not in TITLE_STOPWORDS
+    }
+
+
+def intersection_size(a, b):
+    """Size of the intersection of two sorted integer arrays."""
+    if len(a) > len(b):
+        a, b = b, a
+    count = lo = 0
+    n = len(b)
+    for value in a:
+        lo = bisect_left(b, value, lo)
+        if lo == n:
+            break
+        if b[lo] == value:
+            count += 1
+            lo += 1
+    return count
+
+
+class FacetIndex:
+    """
+    Skill and title keyword postings for people search facets.
+
+    Every user gets a dense integer ordinal, and each skill and title
+    keyword a sorted ``array`` of the ordinals of its users, so the facet
+    count of a value over a result set is an intersection of two sorted
+    arrays. The index is built in the background on first use (counts are
+    empty until it is ready) and rebuilt after ``ttl`` seconds or an
+    ``invalidate``; stale counts are served meanwhile. An ``invalidate``
+    during a build leaves the index stale, so it is rebuilt again.
+    """
+
+    def __init__(self, ttl=300, top=10):
+        self.ttl = ttl
+        self.top = top
+        self._ordinals = {}
+        self._skills = {}
+        self._skill_names = {}
+        self._keywords = {}
+        self._built_at = None
+        self._stale = False
+        self._lock = Lock()
+        self._rebuilding = False
+
+    def init_app(self, app):
+        config = app.config
+        self.ttl = config.get("FACETS_TTL", 300)
+        self.top = config.get("FACETS_TOP", 10)
+        app.extensions["facet_index"] = self
+
+    def invalidate(self):
+        self._stale = True
+
+    def build(self):
+        started = time.time()
+        # Writes from here on are not guaranteed to be in this build.
+        self._stale = False
+        results, _ = read_query("""
+            MATCH (u:User)
+            RETURN u.uuid, u.title, [
+                (u)-[:HAS_SKILL]->(s:Skill) WHERE s.key IS NOT NULL
+                | [s.key, s.name]
+            ]
+            """)
+        ordinals = {}
+        skills = {}
+        skill_names = {}
+        keywords = {}
+        for ordinal, (uuid, title, user_skills) in enumerate(results):
+            ordinals[uuid] = ordinal
+            for key, name in user_skills:
+                skills.setdefault(key, array("I")).append(ordinal)
+                skill_names[key] = name
+            for keyword in title_keywords(title):
+                keywords.setdefault(keyword, array("I")).append(ordinal)
+
+        with self._lock:
+            self._ordinals = ordinals
+            self._skills = skills
+            self._skill_names = skill_names
+            self._keywords = keywords
+            self._built_at = started
+
+    def _ensure_current(self):
+        if self._built_at is not None:
+            expired = time.time() - self._built_at >= self.ttl
+            if not (expired or self._stale):
+                return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        Thread(target=self._rebuild, name="facets", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Rebuilding the facet index failed")
+        finally:
+            self._rebuilding = False
+
+    def counts(self, user_uuids=None, exclude=None):
+        """
+        Top skill and title keyword counts over ``user_uuids``, or over every
+        user when None. ``exclude`` is left out of the counts.
+        """
+        self._ensure_current()
+        with self._lock:
+            ordinals = self._ordinals
+            skills = self._skills
+            skill_names = self._skill_names
+            keywords = self._keywords
+
+        excluded = ordinals.get(exclude)
+        if user_uuids is None:
+
+            def count(posting):
+                if excluded is None:
+                    return len(posting)
+                i = bisect_left(posting, excluded)
+                own = i < len(posting) and posting[i] == excluded
+                return len(posting) - own
+
+        else:
+            result = array(
+                "I",
+                sorted(
+                    ordinals[uuid]
+                    for uuid in user_uuids
+                    if uuid in ordinals and uuid != exclude
+                ),
+            )
+
+            def count(posting):
+                return intersection_size(result, posting)
+
+        return {
+            "skills": [
+                {"name": skill_names[key], "count": n}
+                for n, key in self._top(skills, count)
+            ],
+            "title_keywords": [
+                {"keyword": keyword, "count": n}
+                for n, keyword in self._top(keywords, count)
+            ],
+        }
+
+    def _top(self, postings, count):
+        counted = (
+            (count(posting), value) for value, posting in postings.items()
+        )
+        return heapq.nlargest(
+            self.top,
+            ((n, value) for n, value in counted if n),
+            key=lambda item: item[0],
+        )
+
+
+facet_index = FacetIndex()
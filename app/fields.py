@@ -0,0 +1,18 @@
+def parse_fields(raw, allowed, default=None):
+    """
+    Parse a ``?fields=a,b`` sparse fieldset. Returns ``default`` (or every
+    allowed field) when the parameter is absent; ``uuid`` is always kept.
+    Raises ValueError on unknown field names.
+    """
+    if not raw:
+        return tuple(allowed if default is None else default)
+
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(sorted(unknown))}. "
+            f"Allowed: {', '.join(allowed)}"
+        )
+    requested.add("uuid")
+    return tuple(name for name in allowed if name in requested)
@@ -0,0 +1,169 @@
+import hashlib
+import time
+from functools import wraps
+
+from flask import Response, json, request
+from flask_jwt_extended import get_jwt_identity
+
+from app.cache import MemoryBackend, SqliteBackend
+from app.metrics import metrics
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# Stored under a key while the request that claimed it runs.
+PENDING = "pending"
+
+
+class IdempotencyStore:
+    """
+    Response snapshots of write requests sent with an ``Idempotency-Key``
+    header, so a client retrying a timed-out create gets the original
+    response back instead of a duplicate post, comment or like.
+
+    Keys are scoped to the user and endpoint and remembered for ``ttl``
+    seconds, at most ``max_keys`` of them, in memory or in a local sqlite
+    file shared by the workers of a host. A replay is answered from the
+    snapshot without running the handler. A key reused with a different
+    body is rejected, as is a retry arriving while the first request is
+    still running: the first request claims the key by adding a pending
+    marker to the backend, so with sqlite the claim holds across the
+    workers of the host. A claim left by a crashed worker expires after
+    ``pending_ttl`` seconds. Server errors are not remembered, so the
+    request can be retried with the same key.
+    """
+
+    def __init__(self, enabled=True, ttl=86400, pending_ttl=60, backend=None):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.backend = MemoryBackend() if backend is None else backend
+        self._last_prune = time.time()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("IDEMPOTENCY_ENABLED", True)
+        self.ttl = config.get("IDEMPOTENCY_TTL", 86400)
+        self.pending_ttl = config.get("IDEMPOTENCY_PENDING_TTL", 60)
+
+        backend = config.get("IDEMPOTENCY_BACKEND", "memory")
+        max_keys = config.get("IDEMPOTENCY_MAX_KEYS", 10000)
+        if backend == "sqlite":
+            self.backend = SqliteBackend(
+                config.get("IDEMPOTENCY_SQLITE_PATH", "idempotency.sqlite3"),
+                max_keys,
+            )
+        elif backend == "memory":
+            self.backend = MemoryBackend(max_keys)
+        else:
+            raise ValueError(f"Unknown IDEMPOTENCY_BACKEND '{backend}'")
+
+        app.extensions["idempotency"] = self
+
+    def begin(self, key):
+        """
+        The stored snapshot of ``key``, PENDING if another request holds
+        it, or None after claiming it for this request.
+        """
+        while not self.backend.add(key, PENDING, self.pending_ttl):
+            snapshot = self.backend.get(key)
+            # None: released or expired since the add, so claim it again.
+            if snapshot is not None:
+                return snapshot
+        return None
+
+    def finish(self, key, snapshot):
+        """
+        Replace the claim on ``key`` with ``snapshot``, or release it if
+        ``snapshot`` is None.
+        """
+        if snapshot is None:
+            self.backend.delete(key)
+            return
+        self.backend.set(key, snapshot, self.ttl)
+        self._prune()
+
+    def _prune(self):
+        # The sqlite backend only drops expired and surplus rows when asked.
+        now = time.time()
+        if now - self._last_prune > 60:
+            self._last_prune = now
+            self.backend.prune_tags(now)
+
+
+idempotency = IdempotencyStore()
+
+
+def idempotent(fn):
+    """
+    Replay the response of an earlier request with the same
+    ``Idempotency-Key`` header. Goes below ``jwt_guard``.
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        client_key = request.headers.get(HEADER)
+        if not idempotency.enabled or client_key is None:
+            return fn(*args, **kwargs)
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            return Response(
+                json.dumps(
+                    {
+                        "error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH}"
+                        " characters"
+                    }
+                ),
+                status=400,
+            )
+
+        key = (
+            f"idempotency:{get_jwt_identity()}:{request.method}:"
+            f"{request.path}:{client_key}"
+        )
+        fingerprint = hashlib.sha1(request.get_data()).hexdigest()
+        snapshot = idempotency.begin(key)
+        if snapshot == PENDING:
+            return Response(
+                json.dumps(
+                    {
+                        "error": "A request with this Idempotency-Key is"
+                        " still in progress"
+                    }
+                ),
+                status=409,
+            )
+        if snapshot is not None:
+            if snapshot["fingerprint"] != fingerprint:
+                return Response(
+                    json.dumps(
+                        {
+                            "error": "Idempotency-Key was already used with"
+                            " a different request"
+                        }
+                    ),
+                    status=422,
+                )
+            metrics.inc("idempotent_replays_total", request.endpoint)
+            response = Response(
+                snapshot["body"],
+                status=snapshot["status"],
+                content_type=snapshot["content_type"],
+            )
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        snapshot = None
+        try:
+            response = fn(*args, **kwargs)
+            if isinstance(response, Response) and response.status_code < 500:
+                snapshot = {
+                    "fingerprint": fingerprint,
+                    "status": response.status_code,
+                    "content_type": response.content_type,
+                    "body": response.get_data(),
+                }
+            return response
+        finally:
+            idempotency.finish(key, snapshot)
+
+    return wrapper
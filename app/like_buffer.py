@@ -0,0 +1,206 @@
+import atexit
+import copy
+import logging
+import signal
+import sys
+from collections import defaultdict
+from threading import Event, Lock, Thread, current_thread, main_thread
+
+from app.cache import cache
+from app.db import read_query, write_query
+from app.liked_cache import liked_cache
+
+logger = logging.getLogger(__name__)
+
+
+class LikeBuffer:
+    """
+    Optional write-behind mode for post likes.
+
+    Likes and unlikes are acknowledged into an in-memory buffer keyed by
+    ``(user_uuid, post_uuid)``, so repeated toggles by one user collapse into
+    their final state, and are written as one ``UNWIND`` transaction every
+    ``flush_interval`` seconds or ``max_ops`` buffered operations. Entries
+    stay visible to reads until their flush has committed, and whatever is
+    left is flushed when the process exits. The liked cache learns of a
+    like once its flush has committed.
+    """
+
+    def __init__(self, enabled=False, flush_interval=0.2, max_ops=500):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_ops = max_ops
+        self._pending = {}
+        self._in_flight = {}
+        self._versions = defaultdict(int)
+        self._flushes = 0
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wake = Event()
+        self._thread = None
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("LIKE_BUFFER_ENABLED", False)
+        self.flush_interval = config.get("LIKE_BUFFER_FLUSH_MS", 200) / 1000
+        self.max_ops = config.get("LIKE_BUFFER_MAX_OPS", 500)
+        app.extensions["like_buffer"] = self
+        if self.enabled and self._thread is None:
+            self._thread = Thread(
+                target=self._run, name="like-buffer", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+            _exit_on_sigterm()
+
+    def set_like(self, user_uuid, post_uuid, liked):
+        """
+        Buffer a like (``liked``) or unlike of the post unless the user's
+        buffered or committed state already is ``liked``. True if buffered,
+        False if not needed, None if the post does not exist.
+        """
+        key = (user_uuid, post_uuid)
+        while True:
+            flushes = self._flushes
+            committed = self._committed(user_uuid, post_uuid)
+            if committed is None:
+                return None
+            with self._lock:
+                current = self._pending.get(key, self._in_flight.get(key))
+                if current is None:
+                    if flushes != self._flushes:
+                        # A flush committed since the read; read again.
+                        continue
+                    current = committed
+                if current == liked:
+                    return False
+                self._pending[key] = liked
+                self._versions[post_uuid] += 1
+                full = len(self._pending) >= self.max_ops
+            if full:
+                self._wake.set()
+            return True
+
+    @staticmethod
+    def _committed(user_uuid, post_uuid):
+        """Whether the stored graph has the like, None without the post."""
+        results, _ = read_query(
+            """
+            MATCH (p:Post {uuid: $post})
+            RETURN EXISTS { (:User {uuid: $user})-[:LIKES]->(p) }
+            """,
+            {"post": post_uuid, "user": user_uuid},
+        )
+        return results[0][0] if results else None
+
+    def state(self, user_uuid, post_uuid):
+        """The buffered like state of a user for a post, or None."""
+        key = (user_uuid, post_uuid)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            return self._in_flight.get(key)
+
+    def version(self, post_uuid):
+        """Number of likes buffered for ``post_uuid`` since its last flush."""
+        with self._lock:
+            return self._versions.get(post_uuid, 0)
+
+    def overlay(self, post, user_uuid):
+        """
+        ``post`` as ``user_uuid`` should see it, with their own buffered like
+        applied. Returns a copy when it differs, since ``post`` may be shared
+        by the result cache.
+        """
+        if not self.enabled or post is None or not hasattr(post, "_liked"):
+            return post
+        liked = self.state(user_uuid, post.uuid)
+        if liked is None or liked == post._liked:
+            return post
+
+        post = copy.copy(post)
+        post._liked = liked
+        if hasattr(post, "_likes_count"):
+            post._likes_count += 1 if liked else -1
+        return post
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered likes failed")
+
+    def flush(self):
+        """Write every buffered operation in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                self._in_flight = batch
+
+            likes = [
+                {"user": user_uuid, "post": post_uuid}
+                for (user_uuid, post_uuid), liked in batch.items()
+                if liked
+            ]
+            unlikes = [
+                {"user": user_uuid, "post": post_uuid}
+                for (user_uuid, post_uuid), liked in batch.items()
+                if not liked
+            ]
+            try:
+                write_query(
+                    """
+                    CALL {
+                        UNWIND $likes AS row
+                        MATCH (u:User {uuid: row.user})
+                        MATCH (p:Post {uuid: row.post})
+                        MERGE (u)-[:LIKES]->(p)
+                    }
+                    CALL {
+                        UNWIND $unlikes AS row
+                        MATCH (:User {uuid: row.user})
+                            -[r:LIKES]->(:Post {uuid: row.post})
+                        DELETE r
+                    }
+                    """,
+                    {"likes": likes, "unlikes": unlikes},
+                )
+            except Exception:
+                # Put the batch back unless a newer toggle replaced it.
+                with self._lock:
+                    self._pending = {**batch, **self._pending}
+                    self._in_flight = {}
+                raise
+
+            for (user_uuid, post_uuid), liked in batch.items():
+                liked_cache.record(user_uuid, post_uuid, liked)
+            post_uuids = {post_uuid for _, post_uuid in batch}
+            cache.invalidate(
+                *(f"post:{post_uuid}" for post_uuid in post_uuids)
+            )
+            with self._lock:
+                self._in_flight = {}
+                self._flushes += 1
+                buffered = {post_uuid for _, post_uuid in self._pending}
+                for post_uuid in post_uuids - buffered:
+                    # The stored counts and like flags now carry the change.
+                    self._versions.pop(post_uuid, None)
+
+
+def _exit_on_sigterm():
+    """
+    Turn SIGTERM into a normal interpreter exit so ``atexit`` flushes the
+    buffer, unless a server such as gunicorn already handles the signal.
+    """
+    if current_thread() is not main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+
+like_buffer = LikeBuffer()
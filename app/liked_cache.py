@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from app.db import read_query
+
+
+class LikedSet:
+    def __init__(self, uuids, loaded_at):
+        # None when the user has too many likes to cache.
+        self.uuids = None if uuids is None else OrderedDict.fromkeys(uuids)
+        self.loaded_at = loaded_at
+        self.version = 0
+
+    def __contains__(self, uuid):
+        return uuid in self.uuids
+
+
+class LikedSetCache:
+    """
+    Per-user set of the post and comment uuids a user has liked, so list
+    endpoints can resolve ``liked`` for a whole page with set lookups instead
+    of expanding the viewer's like edges for every card.
+
+    Sets are loaded on first use and kept up to date by the like and unlike
+    endpoints of this worker. Users are evicted least recently used first
+    and reloaded after ``ttl`` seconds to pick up likes made through other
+    workers. Users with more than ``max_likes`` likes are not cached; their
+    queries keep expanding like edges.
+    """
+
+    def __init__(self, enabled=True, max_users=10000, max_likes=1000, ttl=60):
+        self.enabled = enabled
+        self.max_users = max_users
+        self.max_likes = max_likes
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("LIKED_CACHE_ENABLED", True)
+        self.max_users = config.get("LIKED_CACHE_MAX_USERS", 10000)
+        self.max_likes = config.get("LIKED_CACHE_MAX_LIKES", 1000)
+        self.ttl = config.get("LIKED_CACHE_TTL", 60)
+        app.extensions["liked_cache"] = self
+
+    def get(self, user_uuid):
+        """The liked set of ``user_uuid``, or None if it cannot be cached."""
+        if not self.enabled or not user_uuid:
+            return None
+        with self._lock:
+            entry = self._users.get(user_uuid)
+            if entry is not None:
+                self._users.move_to_end(user_uuid)
+        if (
+            isinstance(entry, LikedSet)
+            and time.time() - entry.loaded_at < self.ttl
+        ):
+            return entry if entry.uuids is not None else None
+        return self._load(user_uuid, entry)
+
+    def for_fields(self, user_uuid, fields):
+        """Like ``get``, but None when ``fields`` does not include ``liked``."""
+        if fields is not None and "liked" not in fields:
+            return None
+        return self.get(user_uuid)
+
+    def _load(self, user_uuid, previous):
+        now = time.time()
+        previous_version = getattr(previous, "version", None)
+        results, _ = read_query(
+            """
+            MATCH (:User {uuid: $uuid})-[:LIKES]->(n)
+            RETURN n.uuid
+            LIMIT $limit
+            """,
+            {"uuid": user_uuid, "limit": self.max_likes + 1},
+        )
+        if len(results) > self.max_likes:
+            entry = LikedSet(None, now)
+        else:
+            entry = LikedSet((row[0] for row in results), now)
+
+        with self._lock:
+            current = self._users.get(user_uuid)
+            if current is not previous or (
+                getattr(current, "version", None) != previous_version
+            ):
+                # A like was recorded while loading and the loaded set may
+                # predate it; let this request fall back to the query.
+                return None
+            self._store(user_uuid, entry)
+        return entry if entry.uuids is not None else None
+
+    def _store(self, user_uuid, entry):
+        # Caller holds the lock.
+        self._users[user_uuid] = entry
+        self._users.move_to_end(user_uuid)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def record(self, user_uuid, uuid, liked):
+        """Apply a committed like or unlike of ``uuid`` by ``user_uuid``."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._users.get(user_uuid)
+            if not isinstance(entry, LikedSet) or entry.uuids is None:
+                # Mark the user so a load already in flight is not stored.
+                # Markers take a place in the LRU like loaded sets.
+                self._store(user_uuid, object())
+                return
+            entry.version += 1
+            if liked:
+                entry.uuids[uuid] = None
+                entry.uuids.move_to_end(uuid)
+                if len(entry.uuids) > self.max_likes:
+                    self._users[user_uuid] = object()
+            else:
+                entry.uuids.pop(uuid, None)
+
+
+liked_cache = LikedSetCache()
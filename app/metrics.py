@@ -0,0 +1,371 @@
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock, Thread
+
+from flask import Response, g, has_request_context, request
+from neomodel import db
+from neomodel.util import Database
+
+from app.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+# name: (type, help, label names, buckets). Gauges are summed over live
+# workers only; counters and histograms over every worker that has run.
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram",
+        "Request latency by flask-restx resource and method.",
+        ("resource", "method"),
+        LATENCY_BUCKETS,
+    ),
+    "http_requests_total": (
+        "counter",
+        "Requests by resource, method and status code.",
+        ("resource", "method", "status"),
+        None,
+    ),
+    "http_requests_in_flight": (
+        "gauge",
+        "Requests being handled.",
+        (),
+        None,
+    ),
+    "db_round_trips_per_request": (
+        "histogram",
+        "Cypher queries sent to Neo4j while handling one request.",
+        ("resource", "method"),
+        ROUND_TRIP_BUCKETS,
+    ),
+    "neo4j_query_duration_seconds": (
+        "histogram",
+        "Cypher query latency by the app function that issued it.",
+        ("query",),
+        LATENCY_BUCKETS,
+    ),
+    "neo4j_pool_connections": (
+        "gauge",
+        "Connections in the Neo4j driver pool.",
+        ("state",),
+        None,
+    ),
+    "neo4j_pool_max_size": (
+        "gauge",
+        "Configured maximum size of the Neo4j driver pool.",
+        (),
+        None,
+    ),
+    "result_cache_lookups_total": (
+        "counter",
+        "Result cache lookups by outcome (hit, miss, stale).",
+        ("outcome",),
+        None,
+    ),
+    "jwt_verification_failures_total": (
+        "counter",
+        "Rejected access and refresh tokens by reason.",
+        ("reason",),
+        None,
+    ),
+    "idempotent_replays_total": (
+        "counter",
+        "Write requests answered from an Idempotency-Key snapshot.",
+        ("resource",),
+        None,
+    ),
+}
+
+
+def _caller():
+    """The first ``app`` function outside this module and ``app.db``."""
+    frame = sys._getframe(2)
+    for _ in range(30):
+        if frame is None:
+            break
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.") and module not in ("app.db", __name__):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "other"
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    """
+    Prometheus metrics served at ``/metrics``.
+
+    Updates are dictionary increments under one lock. With
+    ``METRICS_MULTIPROC_DIR`` set, every worker writes its totals to
+    ``<dir>/<pid>.json`` every ``METRICS_FLUSH_INTERVAL`` seconds and before
+    answering a scrape, and the answering worker sums all the files, so the
+    scrape is the same whichever worker takes it.
+    """
+
+    def __init__(self, enabled=True, directory=None, flush_interval=5):
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._values = {name: {} for name in METRICS}
+        self._lock = Lock()
+        self._thread = None
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("METRICS_ENABLED", True)
+        self.directory = config.get("METRICS_MULTIPROC_DIR")
+        self.flush_interval = config.get("METRICS_FLUSH_INTERVAL", 5)
+        app.extensions["metrics"] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self.serve)
+        # ``db`` is a thread local: patch the class so queries sent from
+        # every request thread are metered, not only this one's.
+        if not getattr(Database.cypher_query, "_metered", False):
+            Database.cypher_query = self._meter(Database.cypher_query)
+        if self.directory and self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = Thread(
+                target=self._run, name="metrics", daemon=True
+            )
+            self._thread.start()
+
+    # Recording
+
+    def inc(self, name, *labels, amount=1):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def set(self, name, value, *labels):
+        with self._lock:
+            self._values[name][labels] = value
+
+    def observe(self, name, value, *labels):
+        buckets = METRICS[name][3]
+        with self._lock:
+            series = self._values[name]
+            counts = series.get(labels)
+            if counts is None:
+                # One count per bucket plus +Inf, then sum and count.
+                counts = series[labels] = [0] * (len(buckets) + 3)
+            counts[bisect_left(buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def _meter(self, cypher_query):
+        @wraps(cypher_query)
+        def metered(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return cypher_query(*args, **kwargs)
+            finally:
+                self.observe(
+                    "neo4j_query_duration_seconds",
+                    time.perf_counter() - started,
+                    _caller(),
+                )
+                if has_request_context():
+                    g.db_round_trips = g.get("db_round_trips", 0) + 1
+
+        metered._metered = True
+        return metered
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.db_round_trips = 0
+        self.inc("http_requests_in_flight")
+
+    def _after_request(self, response):
+        started = g.get("metrics_started")
+        if started is None:
+            return response
+        resource = request.url_rule.endpoint if request.url_rule else "none"
+        self.observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - started,
+            resource,
+            request.method,
+        )
+        self.observe(
+            "db_round_trips_per_request",
+            g.get("db_round_trips", 0),
+            resource,
+            request.method,
+        )
+        self.inc(
+            "http_requests_total",
+            resource,
+            request.method,
+            str(response.status_code),
+        )
+        return response
+
+    def _teardown_request(self, exc):
+        if g.pop("metrics_started", None) is not None:
+            self.inc("http_requests_in_flight", amount=-1)
+
+    def _collect(self):
+        """Refresh the values read from other components."""
+        stats = cache.stats()
+        for outcome, key in (("hit", "hits"), ("miss", "misses")):
+            self.set("result_cache_lookups_total", stats[key], outcome)
+        self.set("result_cache_lookups_total", stats["stale"], "stale")
+
+        pool = getattr(db.driver, "_pool", None) if db.url else None
+        if pool is None:
+            return
+        try:
+            total = sum(len(c) for c in list(pool.connections.values()))
+            in_use = sum(
+                pool.in_use_connection_count(address)
+                for address in list(pool.connections)
+            )
+            max_size = pool.pool_config.max_connection_pool_size
+        except AttributeError:
+            return
+        self.set("neo4j_pool_connections", in_use, "in_use")
+        self.set("neo4j_pool_connections", total - in_use, "idle")
+        self.set("neo4j_pool_max_size", max_size)
+
+    # Exposition
+
+    def snapshot(self):
+        self._collect()
+        with self._lock:
+            return {
+                name: [
+                    [list(labels), list(v) if isinstance(v, list) else v]
+                    for labels, v in series.items()
+                ]
+                for name, series in self._values.items()
+            }
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing metrics snapshot failed")
+
+    def flush(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as out:
+            json.dump(self.snapshot(), out)
+        os.replace(f"{path}.tmp", path)
+
+    def _merged(self):
+        if not self.directory:
+            return self.snapshot()
+
+        self.flush()
+        merged = {name: {} for name in METRICS}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                pid = int(os.path.basename(path)[: -len(".json")])
+                with open(path) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+            except (ValueError, OSError):
+                continue
+            alive = _alive(pid)
+            for name, rows in snapshot.items():
+                if name not in METRICS or (
+                    METRICS[name][0] == "gauge" and not alive
+                ):
+                    continue
+                series = merged[name]
+                for labels, value in rows:
+                    labels = tuple(labels)
+                    if isinstance(value, list):
+                        total = series.setdefault(labels, [0] * len(value))
+                        series[labels] = [a + b for a, b in zip(total, value)]
+                    else:
+                        series[labels] = series.get(labels, 0) + value
+        return {
+            name: [[list(k), v] for k, v in series.items()]
+            for name, series in merged.items()
+        }
+
+    def render(self):
+        lines = []
+        for name, rows in self._merged().items():
+            kind, help_text, label_names, buckets = METRICS[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(rows):
+                if kind != "histogram":
+                    lines.append(
+                        f"{name}{_labels(label_names, labels)} {value}"
+                    )
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, "+Inf"), value[:-2]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(
+                        f"{name}_bucket"
+                        f"{_labels(label_names, labels, le)} {cumulative}"
+                    )
+                lines.append(
+                    f"{name}_sum{_labels(label_names, labels)} {value[-2]}"
+                )
+                lines.append(
+                    f"{name}_count{_labels(label_names, labels)} {value[-1]}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def serve(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+metrics = Metrics()
@@ -1,3 +1,7 @@
+import math
+import time
+from uuid import uuid4
+
 from neomodel import (
     DateTimeProperty,
     RelationshipFrom,
@@ -5,11 +9,38 @@ from neomodel import (
     StringProperty,
     StructuredNode,
     UniqueIdProperty,
-    db,
 )
 
+from app.cache import cache
+from app.db import read_query, write_query
+from app.liked_cache import liked_cache
+
 from app.models.post import Post
-from app.models.user import User
+from app.models.user import CREATOR_CARD, User
+
+COMMENT_CARD_FIELDS = (
+    "uuid",
+    "text",
+    "created_at",
+    "created_by",
+    "likes_count",
+    "replies_count",
+    "liked",
+)
+REPLY_CARD_FIELDS = tuple(
+    f for f in COMMENT_CARD_FIELDS if f != "replies_count"
+)
+
+# Deleted content is relabelled until it is purged. A comment is hidden
+# once it, its post or its parent comment has been deleted.
+VISIBLE_COMMENT = """
+NOT EXISTS { (c)-[:ON]->(:DeletedPost) }
+AND NOT EXISTS { (c)-[:REPLY_TO]->(:DeletedComment) }
+AND NOT EXISTS { (c)-[:REPLY_TO]->(:Comment)-[:ON]->(:DeletedPost) }
+"""
+
+# Replies created after a ``reply_cursor``.
+REPLY_AFTER_CURSOR = "c.created_at * 1000000 > $after"
 
 
 class Comment(StructuredNode):
@@ -32,146 +63,244 @@ class Comment(StructuredNode):
         current_user_uuid,
         page=1,
         page_size=10,
+        fields=None,
+        include_replies=0,
     ):
+        """
+        One page of the comments on a post or replies to a comment. With
+        ``include_replies`` every comment also carries its first replies
+        and a ``_replies_cursor`` for the rest, from the same query.
+        """
         if not post_uuid and not comment_uuid:
             raise ValueError(
                 "Either post_uuid or comment_uuid must be provided."
             )
 
-        skip = (page - 1) * page_size
-
-        match_clause = ""
-        params = {
-            "skip": skip,
-            "limit": page_size,
-            "current_user_uuid": current_user_uuid,
-        }
-
+        fields = COMMENT_CARD_FIELDS if fields is None else fields
         if post_uuid:
-            match_clause = "MATCH (p:Post {uuid: $uuid})<-[:ON]-(c:Comment)<-[:CREATED_COMMENT]-(creator:User)"
-            params["uuid"] = post_uuid
-        elif comment_uuid:
-            match_clause = "MATCH (parent:Comment {uuid: $uuid})<-[:REPLY_TO]-(c:Comment)<-[:CREATED_COMMENT]-(creator:User)"
-            params["uuid"] = comment_uuid
+            parent_tag = f"comments:{post_uuid}"
+            match_clause = "MATCH (:Post {uuid: $uuid})<-[:ON]-(c:Comment)"
+        else:
+            parent_tag = f"replies:{comment_uuid}"
+            match_clause = (
+                "MATCH (:Comment {uuid: $uuid})<-[:REPLY_TO]-(c:Comment)"
+            )
 
-        query = f"""
-        {match_clause}
-        OPTIONAL MATCH (c)<-[:LIKES]-(liker:User)
-        OPTIONAL MATCH (reply:Comment)-[:REPLY_TO]->(c)
-        OPTIONAL MATCH (cu:User {{uuid: $current_user_uuid}})-[like_rel:LIKES]->(c)
-
-        WITH c, creator,
-            COUNT(DISTINCT liker) AS likes_count,
-            COUNT(DISTINCT reply) AS replies_count,
-            COUNT(like_rel) > 0 AS liked
-        
-        ORDER BY c.created_at DESC
-
-        WITH COLLECT({{
-            comment: c,
-            creator: {{
-                uuid: creator.uuid,
-                first_name: creator.first_name,
-                last_name: creator.last_name,
-                profile_image: creator.profile_image,
-                title: creator.title
-            }},
-            likes_count: likes_count,
-            replies_count: replies_count,
-            liked: liked
-        }}) AS all_comments, SIZE(COLLECT(c)) AS total
-
-        RETURN all_comments[$skip..$skip+$limit] AS paginated_comments, total
-        """
-
-        results, _ = db.cypher_query(query, params)
-
-        paginated_comments_raw = results[0][0]
-        total = results[0][1]
-
-        comments = []
-        for item in paginated_comments_raw:
-            comment = cls.inflate(item["comment"])
-            comment._creator = item["creator"]
-            comment._likes_count = item["likes_count"]
-            comment._replies_count = item["replies_count"]
-            comment._liked = item["liked"]
-            comments.append(comment)
-
-        return {
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "results": comments,
-        }
+        return cache.get_or_load(
+            f"list:{parent_tag}:{current_user_uuid}:{page}:{page_size}:"
+            f"{include_replies}:" + _fields_key(fields),
+            lambda: _paginated_comments(
+                match_clause,
+                "DESC",
+                {
+                    "uuid": post_uuid or comment_uuid,
+                    "current_user_uuid": current_user_uuid,
+                },
+                page,
+                page_size,
+                fields,
+                include_replies,
+            ),
+            tags=lambda data: _comment_page_tags(parent_tag, data),
+        )
 
+    @classmethod
     def get_replies(
-        self, *, current_user_uuid: str, page: int = 1, page_size: int = 10
+        cls,
+        comment_uuid,
+        *,
+        current_user_uuid: str,
+        page: int = 1,
+        page_size: int = 10,
+        fields=None,
+        after=None,
     ):
-        skip = (page - 1) * page_size
-
-        query = """
-        MATCH (reply:Comment)-[:REPLY_TO]->(parent:Comment {uuid: $uuid})
-        MATCH (reply)<-[:CREATED_COMMENT]-(creator:User)
-        OPTIONAL MATCH (reply)<-[:LIKES]-(liker:User)
-        OPTIONAL MATCH (cu:User {uuid: $current_user_uuid})-[like_rel:LIKES]->(reply)
-
-        WITH reply, creator,
-            COUNT(DISTINCT liker) AS likes_count,
-            COUNT(like_rel) > 0 AS liked
-
-        ORDER BY reply.created_at ASC
-
-        WITH COLLECT({
-            comment: reply,
-            creator: {
-                uuid: creator.uuid,
-                first_name: creator.first_name,
-                last_name: creator.last_name,
-                profile_image: creator.profile_image,
-                title: creator.title
-            },
-            likes_count: likes_count,
-            liked: liked
-        }) AS all_replies, SIZE(COLLECT(reply)) AS total
+        """
+        Replies oldest first. ``after`` is a ``_replies_cursor`` or
+        ``next_cursor``: the replies after it instead of ``page``, with the
+        cursor of the following ones as ``next_cursor``.
+        """
+        fields = REPLY_CARD_FIELDS if fields is None else fields
+        match_clause = (
+            "MATCH (c:Comment)-[:REPLY_TO]->(:Comment {uuid: $uuid})"
+        )
+        params = {"uuid": comment_uuid, "current_user_uuid": current_user_uuid}
+        if after is not None:
+            match_clause += f"\nWHERE {REPLY_AFTER_CURSOR}"
+            params["after"] = after
+            page = 1
+        return cache.get_or_load(
+            f"replies:{comment_uuid}:{current_user_uuid}:{page}:{page_size}:"
+            f"{after}:" + _fields_key(fields),
+            lambda: _paginated_comments(
+                match_clause, "ASC", params, page, page_size, fields
+            ),
+            tags=lambda data: _comment_page_tags(
+                f"replies:{comment_uuid}", data
+            ),
+        )
 
-        RETURN all_replies[$skip..$skip+$limit] AS paginated_replies, total
+    @classmethod
+    def find_by_uuid(cls, comment_uuid, current_user_uuid, version=None):
         """
+        The comment detail in one query: the comment with its creator card,
+        parent and post summaries, counts and the viewer's ``liked`` flag.
+        None if it is not visible. As in ``Post.find_by_uuid``, a
+        ``version`` is part of the cache key.
+        """
+        return cache.get_or_load(
+            f"comment:{comment_uuid}:{current_user_uuid}:{version}",
+            lambda: cls._query_by_uuid(comment_uuid, current_user_uuid),
+            tags=lambda comment: [f"comment:{comment_uuid}"]
+            + (_comment_detail_tags(comment) if comment else []),
+        )
 
-        results, _ = db.cypher_query(
+    @classmethod
+    def _query_by_uuid(cls, comment_uuid, current_user_uuid):
+        liked = liked_cache.get(current_user_uuid)
+        liked_query = "EXISTS { (me)-[:LIKES]->(c) }"
+        query = f"""
+        MATCH (c:Comment {{uuid: $uuid}})<-[:CREATED_COMMENT]-(u:User)
+        WHERE {VISIBLE_COMMENT}
+        OPTIONAL MATCH (me:User {{uuid: $current_user_uuid}})
+        RETURN {{
+            comment: c,
+            creator: u {CREATOR_CARD},
+            parent: [(c)-[:REPLY_TO]->(parent:Comment)
+                | parent {{.uuid, .text}}][0],
+            post: [(c)-[:ON]->(post:Post) | post {{.uuid, .text}}][0],
+            likes_count: COUNT {{ (c)<-[:LIKES]-() }},
+            replies_count: COUNT {{ (c)<-[:REPLY_TO]-(:Comment) }},
+            liked: {liked_query if liked is None else "null"}
+        }}
+        """
+        results, _ = read_query(
             query,
+            {"uuid": comment_uuid, "current_user_uuid": current_user_uuid},
+        )
+        if not results:
+            return None
+
+        row = results[0][0]
+        comment = _inflate_comment_card(row)
+        if liked is not None:
+            comment._liked = comment_uuid in liked
+        comment._parent = row["parent"]
+        comment._post = row["post"]
+        return comment
+
+    @classmethod
+    def is_visible(cls, comment_uuid):
+        """Whether the comment exists and is visible, without loading it."""
+        query = f"""
+        MATCH (c:Comment {{uuid: $uuid}})
+        WHERE {VISIBLE_COMMENT}
+        RETURN count(c) > 0
+        """
+        results, _ = read_query(query, {"uuid": comment_uuid})
+        return results[0][0]
+
+    @classmethod
+    def like(cls, comment_uuid, user_uuid):
+        """
+        Like the comment. True if this created the like, False if it
+        already existed, None if the comment does not exist.
+        """
+        # As in ``Post.like``: of two concurrent likes only the one that
+        # created the relationship sees its own token on it.
+        results, _ = write_query(
+            """
+            MATCH (u:User {uuid: $user_uuid})
+            MATCH (c:Comment {uuid: $uuid})
+            MERGE (u)-[l:LIKES]->(c)
+            ON CREATE SET l.token = $token
+            WITH l, coalesce(l.token = $token, false) AS created
+            REMOVE l.token
+            RETURN created
+            """,
             {
-                "uuid": self.uuid,
-                "current_user_uuid": current_user_uuid,
-                "skip": skip,
-                "limit": page_size,
+                "uuid": comment_uuid,
+                "user_uuid": user_uuid,
+                "token": uuid4().hex,
             },
         )
+        return results[0][0] if results else None
+
+    @classmethod
+    def unlike(cls, comment_uuid, user_uuid):
+        """
+        Remove the like. True if there was one, False if not, None if the
+        comment does not exist.
+        """
+        results, _ = write_query(
+            """
+            MATCH (c:Comment {uuid: $uuid})
+            OPTIONAL MATCH (:User {uuid: $user_uuid})-[l:LIKES]->(c)
+            WITH l, l IS NOT NULL AS removed
+            DELETE l
+            RETURN removed
+            """,
+            {"uuid": comment_uuid, "user_uuid": user_uuid},
+        )
+        return results[0][0] if results else None
 
-        paginated_replies_raw = results[0][0]
-        total = results[0][1]
+    @classmethod
+    def get_visible(cls, comment_uuid):
+        """The comment, or None if it or what it belongs to was deleted."""
+        query = f"""
+        MATCH (c:Comment {{uuid: $uuid}})
+        WHERE {VISIBLE_COMMENT}
+        RETURN c
+        """
+        results, _ = read_query(query, {"uuid": comment_uuid})
+        return cls.inflate(results[0][0]) if results else None
 
-        replies = []
-        for item in paginated_replies_raw:
-            comment = Comment.inflate(item["comment"])
-            comment._creator = item["creator"]
-            comment._likes_count = item["likes_count"]
-            comment._liked = item["liked"]
-            replies.append(comment)
+    @classmethod
+    def mark_deleted(cls, comment_uuid):
+        """
+        Hide a comment and its replies from every read; the purge worker
+        removes them later.
+        """
+        write_query(
+            """
+            MATCH (c:Comment {uuid: $uuid})
+            REMOVE c:Comment
+            SET c:DeletedComment, c.deleted_at = $now
+            """,
+            {"uuid": comment_uuid, "now": time.time()},
+        )
 
-        return {
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "results": replies,
-        }
+    @classmethod
+    def get_version_stamp(cls, comment_uuid, viewer_email):
+        """
+        Cheap version of a comment detail. Comments are never edited, so
+        only counters, the viewer's like and the edit times of the creator
+        and post change it. None if the comment does not exist.
+        """
+        query = f"""
+        MATCH (c:Comment {{uuid: $uuid}})<-[:CREATED_COMMENT]-(u:User)
+        WHERE {VISIBLE_COMMENT}
+        OPTIONAL MATCH (c)-[:ON]->(p:Post)
+        OPTIONAL MATCH (me:User {{email: $viewer_email}})
+        RETURN [
+            u.updated_at,
+            p.updated_at,
+            COUNT {{ (c)<-[:LIKES]-() }},
+            COUNT {{ (c)<-[:REPLY_TO]-(:Comment) }},
+            EXISTS {{ (me)-[:LIKES]->(c) }}
+        ] AS stamp
+        """
+        results, _ = read_query(
+            query, {"uuid": comment_uuid, "viewer_email": viewer_email}
+        )
+        return results[0][0] if results else None
 
     def get_likes_count(self):
         query = """
         MATCH (c:Comment {uuid: $uuid})<-[:LIKES]-(:User)
         RETURN count(*) as like_count
         """
-        result, _ = db.cypher_query(query, {"uuid": self.uuid})
+        result, _ = read_query(query, {"uuid": self.uuid})
         return result[0][0]
 
     def get_replies_count(self):
@@ -179,5 +308,145 @@ class Comment(StructuredNode):
         MATCH (:Comment)-[:REPLY_TO]->(c:Comment {uuid: $uuid})
         RETURN count(*) AS replies_count
         """
-        result, _ = db.cypher_query(query, {"uuid": self.uuid})
+        result, _ = read_query(query, {"uuid": self.uuid})
         return result[0][0]
+
+
+def _comment_card_projection(fields, liked=None, c="c", include_replies=0):
+    entries = [f"comment: {c}"]
+    if "created_by" in fields:
+        entries.append(
+            f"creator: [({c})<-[:CREATED_COMMENT]-(creator:User)"
+            f" | creator {CREATOR_CARD}][0]"
+        )
+    if "likes_count" in fields:
+        entries.append(f"likes_count: COUNT {{ ({c})<-[:LIKES]-() }}")
+    if "replies_count" in fields:
+        entries.append(
+            f"replies_count: COUNT {{ ({c})<-[:REPLY_TO]-(:Comment) }}"
+        )
+    if "liked" in fields and liked is None:
+        entries.append(f"liked: EXISTS {{ (me)-[:LIKES]->({c}) }}")
+    if include_replies:
+        # One more than asked for, to tell whether a cursor is needed.
+        reply_fields = [f for f in fields if f in REPLY_CARD_FIELDS]
+        entries.append(f"""replies: COLLECT {{
+            MATCH ({c})<-[:REPLY_TO]-(reply:Comment)
+            WITH reply
+            ORDER BY reply.created_at ASC
+            LIMIT $include_replies + 1
+            RETURN {{{_comment_card_projection(reply_fields, liked, "reply")}}}
+        }}""")
+    return ", ".join(entries)
+
+
+def _paginated_comments(
+    match_clause, order, params, page, page_size, fields, include_replies=0
+):
+    liked = liked_cache.for_fields(params["current_user_uuid"], fields)
+    projection = _comment_card_projection(
+        fields, liked, include_replies=include_replies
+    )
+    query = f"""
+    {match_clause}
+    WITH DISTINCT c
+    ORDER BY c.created_at {order}
+    WITH COLLECT(c) AS rows
+    CALL {{
+        WITH rows
+        OPTIONAL MATCH (me:User {{uuid: $current_user_uuid}})
+        UNWIND rows[$skip..$skip+$limit] AS c
+        RETURN COLLECT({{{projection}}}) AS page
+    }}
+    RETURN page, SIZE(rows) AS total
+    """
+
+    params = dict(
+        params,
+        skip=(page - 1) * page_size,
+        limit=page_size,
+        include_replies=include_replies,
+    )
+    results, _ = read_query(query, params)
+    paginated_raw, total = results[0]
+
+    comments = []
+    for item in paginated_raw:
+        comment = _inflate_comment_card(item, liked)
+        if "replies" in item:
+            replies = [
+                _inflate_comment_card(reply, liked)
+                for reply in item["replies"]
+            ]
+            comment._replies = replies[:include_replies]
+            comment._replies_cursor = (
+                reply_cursor(comment._replies[-1])
+                if len(replies) > include_replies
+                else None
+            )
+        comments.append(comment)
+
+    data = {
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "results": comments,
+    }
+    if "after" in params:
+        # Keyset page: total counts the replies left after the cursor.
+        data["next_cursor"] = (
+            reply_cursor(comments[-1]) if total > len(comments) else None
+        )
+    return data
+
+
+def _inflate_comment_card(item, liked=None):
+    comment = Comment.inflate(item["comment"])
+    if "creator" in item:
+        comment._creator = item["creator"]
+    if "likes_count" in item:
+        comment._likes_count = item["likes_count"]
+    if "replies_count" in item:
+        comment._replies_count = item["replies_count"]
+    if "liked" in item:
+        comment._liked = item["liked"]
+    elif liked is not None:
+        comment._liked = comment.uuid in liked
+    return comment
+
+
+def reply_cursor(reply):
+    """
+    Cursor of the replies after ``reply``: its creation time in whole
+    microseconds, rounded up. ``REPLY_AFTER_CURSOR`` scales the stored time
+    the same way, so the reply itself never compares as after it.
+    """
+    return math.ceil(reply.created_at.timestamp() * 1000000)
+
+
+def _comment_detail_tags(comment):
+    tags = [f"user:{comment._creator['uuid']}"]
+    if comment._post:
+        tags.append(f"post:{comment._post['uuid']}")
+    return tags
+
+
+def _fields_key(fields):
+    return ",".join(sorted(fields))
+
+
+def _comment_page_tags(parent_tag, data):
+    tags = {parent_tag}
+    for comment in data["results"]:
+        tags.add(f"comment:{comment.uuid}")
+        creator = getattr(comment, "_creator", None)
+        if creator:
+            tags.add(f"user:{creator['uuid']}")
+        for reply in getattr(comment, "_replies", ()):
+            tags.add(f"comment:{reply.uuid}")
+            creator = getattr(reply, "_creator", None)
+            if creator:
+                tags.add(f"user:{creator['uuid']}")
+        if hasattr(comment, "_replies"):
+            tags.add(f"replies:{comment.uuid}")
+    return tags
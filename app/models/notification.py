@@ -0,0 +1,132 @@
+import time
+
+from neomodel import (
+    ArrayProperty,
+    BooleanProperty,
+    FloatProperty,
+    IntegerProperty,
+    RelationshipFrom,
+    StringProperty,
+    StructuredNode,
+    UniqueIdProperty,
+)
+
+from app.cache import cache
+from app.db import read_query, write_query
+
+from .user import User
+
+NOTIFICATION_ACTOR_CARD = "{.uuid, .first_name, .last_name, .profile_image}"
+
+
+class Notification(StructuredNode):
+    """
+    Activity on a user's content, aggregated per kind and target while
+    unread. Written in batches by ``app.notifications``.
+    """
+
+    uuid = UniqueIdProperty()
+    # "<kind>:<target uuid>", the aggregation key of unread notifications.
+    key = StringProperty(required=True)
+    kind = StringProperty(required=True)
+    target_uuid = StringProperty()
+    post_uuid = StringProperty()
+    # Distinct actors, and the three latest of them.
+    count = IntegerProperty(default=0)
+    actor_uuids = ArrayProperty(StringProperty())
+    all_actor_uuids = ArrayProperty(StringProperty())
+    unread = BooleanProperty(default=True)
+    created_at = FloatProperty()
+    updated_at = FloatProperty(index=True)
+
+    recipient = RelationshipFrom(User, "NOTIFIED")
+
+    @classmethod
+    def get_page(cls, user_uuid, before=None, limit=20):
+        """
+        Notifications of ``user_uuid`` updated before the ``before`` cursor,
+        most recently updated first, and the cursor of the next page.
+        """
+        query = f"""
+        MATCH (:User {{uuid: $uuid}})-[:NOTIFIED]->(n:Notification)
+        WHERE $before IS NULL OR n.updated_at < $before
+        WITH n
+        ORDER BY n.updated_at DESC
+        LIMIT $limit + 1
+        RETURN n, [
+            actor_uuid IN n.actor_uuids |
+            [(a:User {{uuid: actor_uuid}}) | a {NOTIFICATION_ACTOR_CARD}][0]
+        ] AS actors
+        """
+        results, _ = read_query(
+            query,
+            {
+                "uuid": user_uuid,
+                "before": None if before is None else before / 1e6,
+                "limit": limit,
+            },
+        )
+        notifications = []
+        for node, actors in results[:limit]:
+            notification = cls.inflate(node)
+            notification._actors = [actor for actor in actors if actor]
+            notifications.append(notification)
+        next_cursor = None
+        if len(results) > limit:
+            next_cursor = int(notifications[-1].updated_at * 1e6)
+        return notifications, next_cursor
+
+    @classmethod
+    def get_unread_count(cls, user_uuid):
+        return cache.get_or_load(
+            f"unread_notifications:{user_uuid}",
+            lambda: cls._query_unread_count(user_uuid),
+            tags=[f"notifications:{user_uuid}"],
+        )
+
+    @classmethod
+    def _query_unread_count(cls, user_uuid):
+        results, _ = read_query(
+            """
+            MATCH (:User {uuid: $uuid})-[:NOTIFIED]->(n:Notification)
+            WHERE n.unread
+            RETURN count(n)
+            """,
+            {"uuid": user_uuid},
+        )
+        return results[0][0]
+
+    @classmethod
+    def mark_read(cls, user_uuid, uuids=None):
+        """Mark ``uuids``, or every notification, of ``user_uuid`` read."""
+        results, _ = write_query(
+            """
+            MATCH (:User {uuid: $uuid})-[:NOTIFIED]->(n:Notification)
+            WHERE n.unread AND ($uuids IS NULL OR n.uuid IN $uuids)
+            SET n.unread = false, n.read_at = $now
+            RETURN count(n)
+            """,
+            {"uuid": user_uuid, "uuids": uuids, "now": time.time()},
+        )
+        cache.invalidate(f"notifications:{user_uuid}")
+        return results[0][0]
+
+
+def notification_to_dict(notification):
+    return {
+        "uuid": notification.uuid,
+        "kind": notification.kind,
+        "target_uuid": notification.target_uuid,
+        "post_uuid": notification.post_uuid,
+        "count": notification.count,
+        "actors": [
+            {
+                "uuid": actor["uuid"],
+                "name": f"{actor['first_name']} {actor['last_name']}",
+                "profile_image": actor.get("profile_image"),
+            }
+            for actor in notification._actors
+        ],
+        "read": not notification.unread,
+        "updated_at": notification.updated_at,
+    }
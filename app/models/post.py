@@ -1,3 +1,6 @@
+import time
+from uuid import uuid4
+
 from neomodel import (
     ArrayProperty,
     DateTimeProperty,
@@ -5,58 +8,94 @@ from neomodel import (
     StringProperty,
     StructuredNode,
     UniqueIdProperty,
-    db,
 )
 
-from .user import User
+from app.cache import cache
+from app.db import read_query, read_transaction, write_query
+from app.like_buffer import like_buffer
+from app.liked_cache import liked_cache
+
+from .user import CREATOR_CARD, User
+
+POST_CARD_FIELDS = (
+    "uuid",
+    "text",
+    "images",
+    "created_at",
+    "updated_at",
+    "created_by",
+    "comments_count",
+    "likes_count",
+    "liked",
+)
 
 
 class Post(StructuredNode):
     uuid = UniqueIdProperty()
     text = StringProperty(required=True)
     images = ArrayProperty(StringProperty())
-    created_at = DateTimeProperty(default_now=True)
+    created_at = DateTimeProperty(default_now=True, index=True)
     updated_at = DateTimeProperty(default_now=True)
 
     created_by = RelationshipFrom(User, "CREATED_POST")
     liked_by = RelationshipFrom("User", "LIKES")
 
     @classmethod
-    def find_by_uuid(cls, post_uuid: str, current_user_uuid: str):
-        query = """
-        MATCH (p:Post {uuid: $post_uuid})<-[:CREATED_POST]-(u:User)
-
-        // Comment count
-        OPTIONAL MATCH (p)<-[:ON]-(c:Comment)
-        WITH p, u, COUNT(DISTINCT c) AS comments_count
-
-        // Likes count
-        OPTIONAL MATCH (p)<-[:LIKES]-(l:User)
-        WITH p, u, comments_count, COUNT(DISTINCT l) AS likes_count
+    def find_by_uuid(
+        cls, post_uuid: str, current_user_uuid: str, version=None
+    ):
+        """
+        The post card as seen by ``current_user_uuid``. A ``version`` (the
+        ETag of a fresh version stamp) is part of the cache key, so a post
+        changed through another worker is reloaded rather than served
+        stale under the new ETag.
+        """
+        post = cache.get_or_load(
+            f"post:{post_uuid}:{current_user_uuid}:{version}",
+            lambda: cls._query_by_uuid(post_uuid, current_user_uuid),
+            tags=lambda post: [f"post:{post_uuid}"]
+            + ([f"user:{post._creator['uuid']}"] if post else []),
+        )
+        return like_buffer.overlay(post, current_user_uuid)
 
+    @classmethod
+    def _query_by_uuid(cls, post_uuid, current_user_uuid):
+        liked = liked_cache.get(current_user_uuid)
+        liked_query = """
         // Liked by current user
         CALL {
             WITH p
             MATCH (cu:User {uuid: $current_user_uuid})-[cl:LIKES]->(p)
             RETURN COUNT(cl) > 0 AS liked
         }
+        """
+        query = f"""
+        MATCH (p:Post {{uuid: $post_uuid}})<-[:CREATED_POST]-(u:User)
+
+        // Comment count
+        OPTIONAL MATCH (p)<-[:ON]-(c:Comment)
+        WITH p, u, COUNT(DISTINCT c) AS comments_count
 
-        RETURN {
+        // Likes count
+        OPTIONAL MATCH (p)<-[:LIKES]-(l:User)
+        WITH p, u, comments_count, COUNT(DISTINCT l) AS likes_count
+        {liked_query if liked is None else ""}
+        RETURN {{
             post: p,
             comments_count: comments_count,
             likes_count: likes_count,
-            liked: liked,
-            creator: {
+            liked: {"liked" if liked is None else "null"},
+            creator: {{
                 uuid: u.uuid,
                 first_name: u.first_name,
                 last_name: u.last_name,
                 profile_image: u.profile_image,
                 title: u.title
-            }
-        } AS result
+            }}
+        }} AS result
         """
 
-        results, _ = db.cypher_query(
+        results, _ = read_query(
             query,
             {
                 "post_uuid": post_uuid,
@@ -74,22 +113,126 @@ class Post(StructuredNode):
         post = Post.inflate(row["post"])
         post._comments_count = row["comments_count"]
         post._likes_count = row["likes_count"]
-        post._liked = row["liked"]
+        post._liked = row["liked"] if liked is None else post.uuid in liked
         post._creator = row["creator"]
 
         return post
 
+    @classmethod
+    def get_version_stamp(cls, post_uuid, viewer_email):
+        """
+        Cheap version of a post detail: edit time, degree based counters,
+        the creator's edit time, the viewer's like and any likes still
+        buffered for it. None if the post does not exist.
+        """
+        query = """
+        MATCH (p:Post {uuid: $post_uuid})<-[:CREATED_POST]-(u:User)
+        OPTIONAL MATCH (me:User {email: $viewer_email})
+        RETURN [
+            p.updated_at,
+            u.updated_at,
+            COUNT { (p)<-[:LIKES]-() },
+            COUNT { (p)<-[:ON]-(:Comment) },
+            EXISTS { (me)-[:LIKES]->(p) }
+        ] AS stamp
+        """
+        results, _ = read_query(
+            query, {"post_uuid": post_uuid, "viewer_email": viewer_email}
+        )
+        if not results:
+            return None
+        return results[0][0] + [like_buffer.version(post_uuid)]
+
+    @classmethod
+    def mark_deleted(cls, post_uuid):
+        """
+        Hide a post and everything under it from every read; the purge
+        worker removes its comments, replies and likes later.
+        """
+        write_query(
+            """
+            MATCH (p:Post {uuid: $uuid})
+            REMOVE p:Post
+            SET p:DeletedPost, p.deleted_at = $now
+            """,
+            {"uuid": post_uuid, "now": time.time()},
+        )
+
+    @classmethod
+    def like(cls, post_uuid, user_uuid):
+        """
+        Like the post. True if this created the like, False if it already
+        existed, None if the post does not exist.
+        """
+        # MERGE locks both nodes, so only the one of two concurrent likes
+        # that created the relationship sees its own token on it.
+        results, _ = write_query(
+            """
+            MATCH (u:User {uuid: $user_uuid})
+            MATCH (p:Post {uuid: $uuid})
+            MERGE (u)-[l:LIKES]->(p)
+            ON CREATE SET l.token = $token
+            WITH l, coalesce(l.token = $token, false) AS created
+            REMOVE l.token
+            RETURN created
+            """,
+            {"uuid": post_uuid, "user_uuid": user_uuid, "token": uuid4().hex},
+        )
+        return results[0][0] if results else None
+
+    @classmethod
+    def unlike(cls, post_uuid, user_uuid):
+        """
+        Remove the like. True if there was one, False if not, None if the
+        post does not exist.
+        """
+        results, _ = write_query(
+            """
+            MATCH (p:Post {uuid: $uuid})
+            OPTIONAL MATCH (:User {uuid: $user_uuid})-[l:LIKES]->(p)
+            WITH l, l IS NOT NULL AS removed
+            DELETE l
+            RETURN removed
+            """,
+            {"uuid": post_uuid, "user_uuid": user_uuid},
+        )
+        return results[0][0] if results else None
+
+    @classmethod
+    def find_cards(cls, post_uuids, current_user_uuid, fields=None):
+        """Cards of ``post_uuids`` in that order, skipping missing posts."""
+        if not post_uuids:
+            return []
+        liked = liked_cache.for_fields(current_user_uuid, fields)
+        query = f"""
+        UNWIND range(0, size($post_uuids) - 1) AS i
+        MATCH (post:Post {{uuid: $post_uuids[i]}})<-[:CREATED_POST]-(creator)
+        OPTIONAL MATCH (me:User {{uuid: $current_user_uuid}})
+        WITH i, post, creator, me
+        ORDER BY i
+        RETURN {{{post_card_projection(fields, liked=liked)}}}
+        """
+        results, _ = read_query(
+            query,
+            {
+                "post_uuids": list(post_uuids),
+                "current_user_uuid": current_user_uuid,
+            },
+        )
+        return [inflate_post_card(row[0], liked) for row in results]
+
     @classmethod
     def get_all_posts(cls, skip=0, limit=10):
-        all_posts = cls.nodes.order_by("-created_at")
-        return all_posts[skip : skip + limit]
+        with read_transaction():
+            all_posts = cls.nodes.order_by("-created_at")
+            return list(all_posts[skip : skip + limit])
 
     def get_comments_count(self):
         query = """
         MATCH (p:Post {uuid: $uuid})<-[:ON]-(c:Comment)
         RETURN COUNT(c) AS comments_count
         """
-        results, _ = db.cypher_query(query, {"uuid": self.uuid})
+        results, _ = read_query(query, {"uuid": self.uuid})
         return results[0][0] or 0
 
     def get_likes_count(self):
@@ -97,5 +240,70 @@ class Post(StructuredNode):
         MATCH (p:Post {uuid: $uuid})<-[:LIKES]-(:User)
         RETURN count(*) as like_count
         """
-        result, _ = db.cypher_query(query, {"uuid": self.uuid})
+        result, _ = read_query(query, {"uuid": self.uuid})
         return result[0][0]
+
+
+def post_card_projection(
+    fields=None, post="post", creator="creator", liked=None
+):
+    """
+    Entries of the map returned for each post card. Relationship based
+    fields are only expanded when ``fields`` asks for them; ``me`` must be
+    bound to the viewer when ``liked`` is requested and the viewer's
+    ``liked`` set is not known.
+    """
+    fields = POST_CARD_FIELDS if fields is None else fields
+    entries = [f"post: {post}"]
+    if "created_by" in fields:
+        entries.append(f"creator: {creator} {CREATOR_CARD}")
+    if "comments_count" in fields:
+        entries.append(
+            f"comments_count: COUNT {{ ({post})<-[:ON]-(:Comment) }}"
+        )
+    if "likes_count" in fields:
+        entries.append(f"likes_count: COUNT {{ ({post})<-[:LIKES]-() }}")
+    if "liked" in fields and liked is None:
+        entries.append(f"liked: EXISTS {{ (me)-[:LIKES]->({post}) }}")
+    return ", ".join(entries)
+
+
+def paginated_post_cards_query(match_clause, fields=None, liked=None):
+    """
+    Wrap a clause binding ``post`` and ``creator`` into a newest-first page
+    query. Cards are only projected for the requested page, and the query
+    always returns one ``(page, total)`` row.
+    """
+    projection = post_card_projection(fields, liked=liked)
+    return f"""
+    {match_clause}
+    WITH DISTINCT post, creator
+    ORDER BY post.created_at DESC
+    WITH COLLECT({{post: post, creator: creator}}) AS rows
+    CALL {{
+        WITH rows
+        OPTIONAL MATCH (me:User {{uuid: $current_user_uuid}})
+        UNWIND rows[$skip..$skip+$limit] AS row
+        WITH row.post AS post, row.creator AS creator, me
+        RETURN COLLECT({{{projection}}}) AS page
+    }}
+    RETURN page, SIZE(rows) AS total
+    """
+
+
+def inflate_post_card(item, liked=None):
+    """A post card from a projected map; ``liked`` is the viewer's set."""
+    post = Post.inflate(item["post"])
+    if "creator" in item:
+        post._creator = item["creator"]
+    if "comments_count" in item:
+        post._comments_count = item["comments_count"]
+    if "likes_count" in item:
+        post._likes_count = item["likes_count"]
+    if "liked" in item:
+        post._liked = item["liked"]
+    elif liked is not None:
+        post._liked = post.uuid in liked
+    if "priority" in item:
+        post._priority = item["priority"]
+    return post
@@ -1,4 +1,6 @@
+import json
 from datetime import datetime
+from uuid import uuid4
 
 from neomodel import (
     DateTimeProperty,
@@ -8,13 +10,74 @@ from neomodel import (
     StructuredNode,
     StructuredRel,
     UniqueIdProperty,
-    db,
+)
+
+from app.cache import cache
+from app.db import (
+    read_query,
+    read_transaction,
+    stream_query,
+    write_query,
+    write_transaction,
+)
+from app.facets import facet_index
+from app.like_buffer import like_buffer
+from app.liked_cache import liked_cache
+from app.skills import normalize_skill, skill_catalog
+from app.timeline import timeline
+from app.typeahead import user_typeahead
+
+# Map projection of the creator card embedded in post and comment results.
+CREATOR_CARD = "{.uuid, .first_name, .last_name, .profile_image, .title}"
+
+# Ids of a people search cached per filter and shared by all viewers. The
+# cap bounds an entry to about 40 KB of uuids; pages past it, and facets of
+# a truncated search, query the database directly.
+USER_SEARCH_TTL = 60
+USER_SEARCH_MAX_IDS = 1000
+
+USER_CARD_FIELDS = (
+    "uuid",
+    "first_name",
+    "last_name",
+    "profile_image",
+    "title",
+    "is_following",
+    "follows_me",
+    "skills",
+    "degree",
 )
 
 
 class Skill(StructuredNode):
     uuid = UniqueIdProperty()
     name = StringProperty(required=True)
+    # normalize_skill(name); skills that only differ in case or spacing
+    # are the same skill.
+    key = StringProperty(unique_index=True)
+
+    @classmethod
+    def find_by_name(cls, name):
+        with read_transaction():
+            return cls.nodes.get_or_none(key=normalize_skill(name))
+
+    @classmethod
+    def ensure(cls, name):
+        """The skill named ``name``, created on first use."""
+        key = normalize_skill(name)
+        uuid = uuid4().hex
+        results, _ = write_query(
+            """
+            MERGE (s:Skill {key: $key})
+            ON CREATE SET s.name = $name, s.uuid = $uuid
+            RETURN s
+            """,
+            {"key": key, "name": " ".join(name.split()), "uuid": uuid},
+        )
+        skill = cls.inflate(results[0][0])
+        if skill.uuid == uuid:
+            skill_catalog.invalidate()
+        return skill
 
 
 class HasSkillRel(StructuredRel):
@@ -29,6 +92,7 @@ class User(StructuredNode):
     password = StringProperty(required=True)
     title = StringProperty()
     profile_image = StringProperty()
+    updated_at = DateTimeProperty(default_now=True)
 
     follows = RelationshipTo("User", "FOLLOWS")
     followed_by = RelationshipFrom("User", "FOLLOWS")
@@ -39,24 +103,25 @@ class User(StructuredNode):
     skills = RelationshipTo("Skill", "HAS_SKILL", model=HasSkillRel)
 
     def get_skills(self) -> list[str]:
-        skill_nodes = self.skills.all()
         skill_pairs = []
 
-        for skill in skill_nodes:
-            rel = self.skills.relationship(skill)
-            skill_pairs.append(
-                (
-                    skill.name,
-                    rel.created_at if rel.created_at else datetime.min,
+        with read_transaction():
+            for skill in self.skills.all():
+                rel = self.skills.relationship(skill)
+                skill_pairs.append(
+                    (
+                        skill.name,
+                        rel.created_at if rel.created_at else datetime.min,
+                    )
                 )
-            )
 
         sorted_skills = sorted(skill_pairs, key=lambda x: x[1], reverse=True)
         return [name for name, _ in sorted_skills]
 
     @classmethod
     def find_by_email(cls, email):
-        user = cls.nodes.get_or_none(email=email)
+        with read_transaction():
+            user = cls.nodes.get_or_none(email=email)
         return user
 
     def get_connection_degree(self, target_user_uuid: str) -> int:
@@ -82,7 +147,7 @@ class User(StructuredNode):
             END AS degree
         """
 
-        result, _ = db.cypher_query(
+        result, _ = read_query(
             query,
             {
                 "me_uuid": self.uuid,
@@ -93,23 +158,116 @@ class User(StructuredNode):
 
     @classmethod
     def find_by_uuid(cls, uuid):
-        user = cls.nodes.get_or_none(uuid=uuid)
+        with read_transaction():
+            user = cls.nodes.get_or_none(uuid=uuid)
         return user
 
+    @classmethod
+    def get_version_stamp(cls, user_uuid, viewer_email):
+        """
+        Cheap version of a profile card: the node's ``updated_at`` and the
+        degree counts Neo4j keeps on the node, without the card's
+        aggregation. None if the user does not exist.
+        """
+        query = """
+        MATCH (u:User {uuid: $uuid})
+        OPTIONAL MATCH (me:User {email: $viewer_email})
+        RETURN [
+            u.updated_at,
+            COUNT { (u)<-[:FOLLOWS]-() },
+            COUNT { (u)-[:FOLLOWS]->() },
+            COUNT { (u)-[:HAS_SKILL]->() },
+            COUNT { (me)-[:FOLLOWS]->() },
+            EXISTS { (me)-[:FOLLOWS]->(u) },
+            EXISTS { (u)-[:FOLLOWS]->(me) }
+        ] AS stamp
+        """
+        results, _ = read_query(
+            query, {"uuid": user_uuid, "viewer_email": viewer_email}
+        )
+        return results[0][0] if results else None
+
     def is_following(self, user):
-        return self.follows.is_connected(user)
+        with read_transaction():
+            return self.follows.is_connected(user)
+
+    def get_following_uuids(self):
+        results, _ = read_query(
+            "MATCH (:User {uuid: $uuid})-[:FOLLOWS]->(u:User) RETURN u.uuid",
+            {"uuid": self.uuid},
+        )
+        return [row[0] for row in results]
+
+    def get_typeahead(self, q, limit=10):
+        """Name completions for ``q``, users this user follows first."""
+        following = cache.get_or_load(
+            f"following_uuids:{self.uuid}",
+            self.get_following_uuids,
+            tags=[f"follows:{self.uuid}"],
+        )
+        return user_typeahead.search(q, self.uuid, following, limit)
 
     def follow(self, user_to_follow):
-        if self != user_to_follow and not self.is_following(user_to_follow):
-            self.follows.connect(user_to_follow)
-            return True
-        return False
+        with write_transaction():
+            followed = self != user_to_follow and not self.is_following(
+                user_to_follow
+            )
+            if followed:
+                self.follows.connect(user_to_follow)
+                timeline.on_follow(self.uuid, user_to_follow.uuid)
+        if followed:
+            cache.invalidate(
+                f"follows:{self.uuid}", f"follows:{user_to_follow.uuid}"
+            )
+        return followed
 
     def unfollow(self, user_to_unfollow):
-        if self != user_to_unfollow and self.is_following(user_to_unfollow):
-            self.follows.disconnect(user_to_unfollow)
-            return True
-        return False
+        with write_transaction():
+            unfollowed = self != user_to_unfollow and self.is_following(
+                user_to_unfollow
+            )
+            if unfollowed:
+                self.follows.disconnect(user_to_unfollow)
+                timeline.on_unfollow(self.uuid, user_to_unfollow.uuid)
+        if unfollowed:
+            cache.invalidate(
+                f"follows:{self.uuid}", f"follows:{user_to_unfollow.uuid}"
+            )
+        return unfollowed
+
+    def get_profile(self, viewer, version=None):
+        """
+        Profile card of this user as seen by ``viewer``. See
+        ``Post.find_by_uuid`` for ``version``.
+        """
+        return cache.get_or_load(
+            f"profile:{self.uuid}:{viewer.uuid}:{version}",
+            lambda: self._query_profile(viewer),
+            # The degree also depends on 2nd/3rd degree follows, which are
+            # not tracked as tags and only refresh when the entry expires.
+            tags=[
+                f"user:{self.uuid}",
+                f"follows:{self.uuid}",
+                f"follows:{viewer.uuid}",
+            ],
+        )
+
+    def _query_profile(self, viewer):
+        with read_transaction():
+            return {
+                "uuid": self.uuid,
+                "first_name": self.first_name,
+                "last_name": self.last_name,
+                "email": self.email,
+                "profile_image": self.profile_image,
+                "title": self.title,
+                "followers_count": self.get_followers_count(),
+                "following_count": self.get_following_count(),
+                "is_following": viewer.is_following(self),
+                "follows_me": self.is_following(viewer),
+                "skills": [skill.name for skill in self.skills.all()],
+                "degree": viewer.get_connection_degree(self.uuid),
+            }
 
     def get_users_list(
         self,
@@ -121,14 +279,18 @@ class User(StructuredNode):
         q=None,
         sort_by="first_name",
         sort_dir="asc",
+        fields=None,
+        facets=False,
     ):
-        skip = (page - 1) * page_size
+        """
+        One page of the people search. With ``facets`` the result also
+        carries the top skills and title keywords of the whole result set.
 
-        params = {
-            "current_uuid": self.uuid,
-            "skip": skip,
-            "limit": page_size,
-        }
+        The matching user ids do not depend on the viewer and are cached
+        per normalized filter; only the page is expanded for the viewer.
+        """
+        fields = USER_CARD_FIELDS if fields is None else fields
+        skip = (page - 1) * page_size
 
         allowed_sort_fields = {
             "first_name",
@@ -141,241 +303,182 @@ class User(StructuredNode):
         if sort_dir not in {"asc", "desc"}:
             sort_dir = "asc"
 
-        match_clause = "MATCH (u:User)"
-        where_clauses = ["u.uuid <> $current_uuid"]
-
-        if title:
-            title = title.lower()
-            where_clauses.append("toLower(u.title) CONTAINS $title")
-            params["title"] = title
+        search = _user_search_filter(title, skills, name, q)
+        if search is None:
+            data = {
+                "page": page,
+                "page_size": page_size,
+                "total": 0,
+                "results": [],
+            }
+            if facets:
+                data["facets"] = {"skills": [], "title_keywords": []}
+            return data
+
+        matches = _search_users(search, sort_by, sort_dir)
+        ids = [uuid for uuid in matches["ids"] if uuid != self.uuid]
+        total = matches["total"]
+        if len(ids) < len(matches["ids"]) or (
+            matches["truncated"] and _matches_search(self.uuid, search)
+        ):
+            total -= 1
 
-        if name:
-            name = name.lower()
-            where_clauses.append(
-                "toLower(u.first_name + ' ' + u.last_name) CONTAINS $name"
-            )
-            params["name"] = name
-
-        skill_match = ""
-        if skills:
-            skills = [s.lower() for s in skills]
-            skill_match = "\nMATCH (u)-[:HAS_SKILL]->(s:Skill)"
-            where_clauses.append("toLower(s.name) IN $skills")
-            params["skills"] = skills
-
-        if q:
-            q = q.lower()
-            q_words = q.split()
-            params["q_words"] = q_words
-            where_clauses.append("""
-            (
-                ANY(term IN $q_words WHERE
-                    toLower(u.first_name) CONTAINS term OR
-                    toLower(u.last_name) CONTAINS term OR
-                    toLower(u.title) CONTAINS term
-                )
-                OR EXISTS {
-                    MATCH (u)-[:HAS_SKILL]->(sx:Skill)
-                    WHERE ANY(term IN $q_words WHERE toLower(sx.name) CONTAINS term)
-                }
+        params = {
+            "current_uuid": self.uuid,
+            **search["params"],
+        }
+        if skip + page_size <= len(ids) or not matches["truncated"]:
+            params["uuids"] = ids[skip : skip + page_size]
+            page_source = """
+            UNWIND range(0, size($uuids) - 1) AS i
+            MATCH (u:User {uuid: $uuids[i]})
+            WITH u
+            ORDER BY i
+            """
+        else:
+            # Beyond the cached ids: page through the search itself, in the
+            # same order, uuid breaking ties, as the cached ids.
+            params["skip"] = skip
+            params["limit"] = page_size
+            page_source = f"""
+            {search["match"]}
+            {_where(["u.uuid <> $current_uuid", *search["where"]])}
+            WITH DISTINCT u
+            ORDER BY u.{sort_by} {sort_dir}, u.uuid
+            SKIP $skip
+            LIMIT $limit
+            """
+
+        # Only the page is expanded, and only for the requested fields.
+        card = []
+        if "is_following" in fields:
+            card.append("is_following: EXISTS { (me)-[:FOLLOWS]->(u) }")
+        if "follows_me" in fields:
+            card.append("follows_me: EXISTS { (u)-[:FOLLOWS]->(me) }")
+        if "skills" in fields:
+            card.append(
+                "skills: [(u)-[:HAS_SKILL]->(skill:Skill) | skill.name]"
             )
-            """)
+        if "degree" in fields:
+            card.append("""degree: CASE
+                WHEN EXISTS { (me)-[:FOLLOWS]->(u) } THEN 1
+                WHEN EXISTS { (me)-[:FOLLOWS]->()-[:FOLLOWS]->(u) } THEN 2
+                WHEN EXISTS {
+                    (me)-[:FOLLOWS]->()-[:FOLLOWS]->()-[:FOLLOWS]->(u)
+                } THEN 3
+                ELSE 4
+            END""")
 
         query = f"""
-        {match_clause}
-        {skill_match}
-        WHERE {" AND ".join(where_clauses)}
-
-        WITH u
+        {page_source}
         OPTIONAL MATCH (me:User {{uuid: $current_uuid}})
-
-        OPTIONAL MATCH (me)-[r1:FOLLOWS]->(u)
-        WITH u, me, COUNT(r1) > 0 AS is_deg1
-        OPTIONAL MATCH (me)-[:FOLLOWS]->()-[r2:FOLLOWS]->(u)
-        WITH u, me, is_deg1, COUNT(r2) > 0 AS is_deg2
-        OPTIONAL MATCH (me)-[:FOLLOWS]->()-[:FOLLOWS]->()-[r3:FOLLOWS]->(u)
-        WITH u, me, is_deg1, is_deg2, COUNT(r3) > 0 AS is_deg3
-
-        WITH u, 
-            CASE 
-                WHEN is_deg1 THEN 1 
-                WHEN is_deg2 THEN 2 
-                WHEN is_deg3 THEN 3 
-                ELSE 4 
-            END AS degree,
-            me
-
-        OPTIONAL MATCH (me)-[f:FOLLOWS]->(u)
-        OPTIONAL MATCH (u)-[f2:FOLLOWS]->(me)
-        OPTIONAL MATCH (u)-[:HAS_SKILL]->(skill:Skill)
-
-        WITH u, collect(DISTINCT skill.name) AS skill_names,
-            COUNT(DISTINCT f) > 0 AS is_following,
-            COUNT(DISTINCT f2) > 0 AS follows_me,
-            degree
-
-        ORDER BY u.{sort_by} {sort_dir}
-        SKIP $skip
-        LIMIT $limit
-        RETURN u, is_following, follows_me, skill_names, degree
+        RETURN u, {{{", ".join(card)}}} AS card
         """
 
-        count_query = f"""
-        {match_clause}
-        {skill_match}
-        WHERE {" AND ".join(where_clauses)}
-        RETURN count(DISTINCT u) AS total
-        """
-
-        results, _ = db.cypher_query(query, params)
-        count_result, _ = db.cypher_query(count_query, params)
-        total = count_result[0][0]
+        results = []
+        if "uuids" not in params or params["uuids"]:
+            results, _ = read_query(query, params)
 
         users = []
-        for (
-            user_node,
-            is_following,
-            follows_me,
-            skills_list,
-            degree,
-        ) in results:
+        for user_node, card in results:
             user = User.inflate(user_node)
+            data = {
+                "uuid": user.uuid,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "profile_image": user.profile_image,
+                "title": user.title,
+                **card,
+            }
             users.append(
-                {
-                    "uuid": user.uuid,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "profile_image": user.profile_image,
-                    "title": user.title,
-                    "is_following": is_following,
-                    "follows_me": follows_me,
-                    "skills": skills_list,
-                    "degree": degree,
-                }
+                {key: data[key] for key in USER_CARD_FIELDS if key in fields}
             )
 
-        return {
+        data = {
             "page": page,
             "page_size": page_size,
             "total": total,
             "results": users,
         }
+        if facets:
+            # Facets need every matching user; without filters that is
+            # every user.
+            if not search["where"]:
+                matched = None
+            elif not matches["truncated"]:
+                matched = ids
+            else:
+                matched = _search_user_uuids(search)
+            data["facets"] = facet_index.counts(matched, exclude=self.uuid)
+        return data
 
     def get_followers(self, user_uuid, page=1, page_size=10):
-        skip = (page - 1) * page_size
-
-        query = """
-        MATCH (target:User {uuid: $uuid})
-        MATCH (follower:User)-[:FOLLOWS]->(target)
-        OPTIONAL MATCH (follower)<-[:FOLLOWS]-(x)  // followers of follower
-        WITH follower, COUNT(DISTINCT x) AS followers_count
-
-        OPTIONAL MATCH (follower)-[:FOLLOWS]->(y)  // who follower is following
-        WITH follower, followers_count, COUNT(DISTINCT y) AS following_count
-
-        OPTIONAL MATCH (me:User {uuid: $current_user_uuid})
-        OPTIONAL MATCH (me)-[:FOLLOWS]->(follower)
-        WITH follower, followers_count, following_count, COUNT(*) > 0 AS is_following
-
-        OPTIONAL MATCH (follower)-[:FOLLOWS]->(me)
-        WITH follower, followers_count, following_count, is_following, COUNT(*) > 0 AS follows_me
-
-        RETURN collect({
-            user: follower,
-            followers_count: followers_count,
-            following_count: following_count,
-            is_following: is_following,
-            follows_me: follows_me
-        })[$skip..$skip+$limit] AS paginated, COUNT(*) AS total
-        """
-
-        params = {
-            "uuid": user_uuid,
-            "current_user_uuid": self.uuid,
-            "skip": skip,
-            "limit": page_size,
-        }
-        results, _ = db.cypher_query(query, params)
-
-        paginated_raw = results[0][0]
-        total = results[0][1]
-
-        followers = []
-        for item in paginated_raw:
-            user = User.inflate(item["user"])
-            user._followers_count = item["followers_count"]
-            user._following_count = item["following_count"]
-            user._is_following = item["is_following"]
-            user._follows_me = item["follows_me"]
-            followers.append(user)
+        return cache.get_or_load(
+            f"followers:{user_uuid}:{self.uuid}:{page}:{page_size}",
+            lambda: self._query_followers(user_uuid, page, page_size),
+            tags=lambda data: _follow_page_tags(user_uuid, self.uuid, data),
+        )
 
-        return {
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "results": followers,
-        }
+    def _query_followers(self, user_uuid, page, page_size):
+        return _paginated_follows(
+            "(target)<-[:FOLLOWS]-(user:User)",
+            user_uuid,
+            self.uuid,
+            page,
+            page_size,
+        )
 
     def get_following(self, user_uuid, page=1, page_size=10):
-        skip = (page - 1) * page_size
-
-        query = """
-        MATCH (source:User {uuid: $uuid})
-        MATCH (source)-[:FOLLOWS]->(following:User)
-        OPTIONAL MATCH (following)<-[:FOLLOWS]-(x)
-        WITH following, COUNT(DISTINCT x) AS followers_count
+        return cache.get_or_load(
+            f"following:{user_uuid}:{self.uuid}:{page}:{page_size}",
+            lambda: self._query_following(user_uuid, page, page_size),
+            tags=lambda data: _follow_page_tags(user_uuid, self.uuid, data),
+        )
 
-        OPTIONAL MATCH (following)-[:FOLLOWS]->(y)
-        WITH following, followers_count, COUNT(DISTINCT y) AS following_count
+    def _query_following(self, user_uuid, page, page_size):
+        return _paginated_follows(
+            "(target)-[:FOLLOWS]->(user:User)",
+            user_uuid,
+            self.uuid,
+            page,
+            page_size,
+        )
 
+    def export_followers(self, user_uuid, fetch_size=500):
+        """
+        Every follower of ``user_uuid`` as a lazily pulled stream of users
+        carrying the same attributes as ``get_followers`` results.
+        """
+        query = """
         OPTIONAL MATCH (me:User {uuid: $current_user_uuid})
-        OPTIONAL MATCH (me)-[:FOLLOWS]->(following)
-        WITH following, followers_count, following_count, COUNT(*) > 0 AS is_following
-
-        OPTIONAL MATCH (following)-[:FOLLOWS]->(me)
-        WITH following, followers_count, following_count, is_following, COUNT(*) > 0 AS follows_me
-
-        RETURN collect({
-            user: following,
-            followers_count: followers_count,
-            following_count: following_count,
-            is_following: is_following,
-            follows_me: follows_me
-        })[$skip..$skip+$limit] AS paginated, COUNT(*) AS total
+        MATCH (:User {uuid: $uuid})<-[:FOLLOWS]-(follower:User)
+        RETURN
+            follower,
+            COUNT { (follower)<-[:FOLLOWS]-() } AS followers_count,
+            COUNT { (follower)-[:FOLLOWS]->() } AS following_count,
+            EXISTS { (me)-[:FOLLOWS]->(follower) } AS is_following,
+            EXISTS { (follower)-[:FOLLOWS]->(me) } AS follows_me
         """
-
-        params = {
-            "uuid": user_uuid,
-            "current_user_uuid": self.uuid,
-            "skip": skip,
-            "limit": page_size,
-        }
-        results, _ = db.cypher_query(query, params)
-
-        paginated_raw = results[0][0]
-        total = results[0][1]
-
-        following = []
-        for item in paginated_raw:
-            user = User.inflate(item["user"])
-            user._followers_count = item["followers_count"]
-            user._following_count = item["following_count"]
-            user._is_following = item["is_following"]
-            user._follows_me = item["follows_me"]
-            following.append(user)
-
-        return {
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "results": following,
-        }
+        rows = stream_query(
+            query,
+            {"uuid": user_uuid, "current_user_uuid": self.uuid},
+            fetch_size,
+        )
+        for node, followers, following, is_following, follows_me in rows:
+            user = User.inflate(node)
+            user._followers_count = followers
+            user._following_count = following
+            user._is_following = is_following
+            user._follows_me = follows_me
+            yield user
 
     def get_followers_count(self):
-        return len(self.followed_by)
+        with read_transaction():
+            return len(self.followed_by)
 
     def get_following_count(self):
-        return len(self.follows)
+        with read_transaction():
+            return len(self.follows)
 
     def get_suggested_friends(self, page=1, page_size=10):
         skip = (page - 1) * page_size
@@ -411,7 +514,7 @@ class User(StructuredNode):
         RETURN all_suggestions[$skip..$skip+$limit] AS paginated_suggestions, SIZE(all_suggestions) AS total
         """
 
-        results, _ = db.cypher_query(
+        results, _ = read_query(
             query, {"user_uuid": self.uuid, "skip": skip, "limit": page_size}
         )
 
@@ -438,180 +541,180 @@ class User(StructuredNode):
 
     @classmethod
     def get_user_posts(
-        cls, user_uuid, current_user_uuid, page=1, page_size=10
+        cls, user_uuid, current_user_uuid, page=1, page_size=10, fields=None
     ):
-        skip = (page - 1) * page_size
+        from .post import paginated_post_cards_query
 
-        query = """
-        MATCH (u:User {uuid: $user_uuid})-[:CREATED_POST]->(p:Post)
-        OPTIONAL MATCH (p)<-[:ON]-(c:Comment)
-        OPTIONAL MATCH (p)<-[:LIKES]-(l:User)
-        OPTIONAL MATCH (cu:User {uuid: $current_user_uuid}), (cu)-[cl:LIKES]->(p)
-        WITH p, u, COUNT(DISTINCT c) AS comments_count, COUNT(DISTINCT l) AS likes_count, COUNT(cl) > 0 AS liked
-        ORDER BY p.created_at DESC
-        WITH COLLECT({
-            post: p, 
-            comments_count: comments_count, 
-            likes_count: likes_count,
-            liked: liked,
-            creator: {
-                uuid: u.uuid,
-                first_name: u.first_name,
-                last_name: u.last_name,
-                profile_image: u.profile_image,
-                title: u.title
-            }
-        }) AS all_posts, SIZE(COLLECT(p)) AS total
-        RETURN all_posts[$skip..$skip+$limit] AS paginated_posts, total
-        """
+        liked = liked_cache.for_fields(current_user_uuid, fields)
+        query = paginated_post_cards_query(
+            "MATCH (creator:User {uuid: $user_uuid})-[:CREATED_POST]->(post:Post)",
+            fields,
+            liked,
+        )
 
-        results, _ = db.cypher_query(
+        return _paginated_posts(
             query,
             {
                 "user_uuid": user_uuid,
                 "current_user_uuid": current_user_uuid,
-                "skip": skip,
-                "limit": page_size,
             },
+            page,
+            page_size,
+            liked,
         )
 
-        paginated_raw = results[0][0]
-        total = results[0][1]
-
-        from .post import Post
-
-        posts = []
-        for item in paginated_raw:
-            post = Post.inflate(item["post"])
-            post._comments_count = item["comments_count"]
-            post._likes_count = item["likes_count"]
-            post._creator = item["creator"]
-            post._liked = item["liked"]
-            posts.append(post)
-
-        return {
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "results": posts,
-        }
-
-    def get_posts_from_following(self, page=1, page_size=10):
-        skip = (page - 1) * page_size
+    @classmethod
+    def export_posts(
+        cls, user_uuid, current_user_uuid, fields=None, fetch_size=500
+    ):
+        """
+        Every post of ``user_uuid``, newest first, as a lazily pulled stream
+        of post cards.
+        """
+        from .post import inflate_post_card, post_card_projection
 
-        query = """
-        MATCH (me:User {uuid: $user_uuid})
-        MATCH (creator:User)
-        WHERE (me)-[:FOLLOWS]->(creator) OR creator.uuid = $user_uuid
-        MATCH (post:Post)<-[:CREATED_POST]-(creator)
-        OPTIONAL MATCH (post)<-[:ON]-(c:Comment)
-        OPTIONAL MATCH (post)<-[:LIKES]-(l:User)
-        OPTIONAL MATCH (me)-[ml:LIKES]->(post)
-        WITH post, creator, COUNT(DISTINCT c) AS comments_count, COUNT(DISTINCT l) AS likes_count, COUNT(ml) > 0 AS liked
+        query = f"""
+        OPTIONAL MATCH (me:User {{uuid: $current_user_uuid}})
+        MATCH (creator:User {{uuid: $user_uuid}})-[:CREATED_POST]->(post:Post)
+        WITH me, creator, post
         ORDER BY post.created_at DESC
-        WITH COLLECT({
-            post: post, 
-            comments_count: comments_count, 
-            likes_count: likes_count,
-            liked: liked,
-            creator: {
-                uuid: creator.uuid,
-                first_name: creator.first_name,
-                last_name: creator.last_name,
-                profile_image: creator.profile_image,
-                title: creator.title
-            }
-        }) AS all_posts, SIZE(COLLECT(post)) AS total
-        RETURN all_posts[$skip..$skip+$limit] AS paginated_posts, total
+        RETURN {{{post_card_projection(fields)}}} AS item
         """
+        rows = stream_query(
+            query,
+            {"user_uuid": user_uuid, "current_user_uuid": current_user_uuid},
+            fetch_size,
+        )
+        for (item,) in rows:
+            yield inflate_post_card(item)
+
+    def get_posts_from_following(self, page=1, page_size=10, fields=None):
+        from .post import paginated_post_cards_query
+
+        # Posts of regular authors were pushed into the TIMELINE; those of
+        # followed celebrities come from their recent-post index. Only the
+        # latest TIMELINE_BACKFILL posts from before a follow are included,
+        # by design, so ``total`` counts the timeline, not every post. Users
+        # whose timeline was never built (see ``FeedTimeline.rebuild``) get
+        # every post of the authors they follow instead.
+        liked = liked_cache.for_fields(self.uuid, fields)
+        query = paginated_post_cards_query(
+            """
+            MATCH (me:User {uuid: $current_user_uuid})
+            CALL {
+                WITH me
+                MATCH (me)-[:TIMELINE]->(post:Post)
+                WHERE me.timeline_built_at IS NOT NULL
+                RETURN post
+                UNION
+                WITH me
+                MATCH (me)-[:FOLLOWS]->(:User)-[:CREATED_POST]->(post:Post)
+                WHERE me.timeline_built_at IS NULL
+                RETURN post
+                UNION
+                WITH me
+                MATCH (me)-[:CREATED_POST]->(post:Post)
+                RETURN post
+                UNION
+                UNWIND $pulled_posts AS post_uuid
+                MATCH (post:Post {uuid: post_uuid})
+                RETURN post
+            }
+            MATCH (post)<-[:CREATED_POST]-(creator:User)
+            """,
+            fields,
+            liked,
+        )
 
-        results, meta = db.cypher_query(
+        return _paginated_posts(
             query,
             {
-                "user_uuid": self.uuid,
-                "skip": skip,
-                "limit": page_size,
+                "current_user_uuid": self.uuid,
+                "pulled_posts": timeline.pulled_post_uuids(self.uuid),
             },
+            page,
+            page_size,
+            liked,
         )
 
-        paginated_raw = results[0][0]
-        total = results[0][1]
-
-        from .post import Post
-
-        posts = []
-        for item in paginated_raw:
-            post = Post.inflate(item["post"])
-            post._comments_count = item["comments_count"]
-            post._likes_count = item["likes_count"]
-            post._creator = item["creator"]
-            post._liked = item["liked"]
-            posts.append(post)
-
-        return {
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "results": posts,
-        }
-
-    def get_posts_from_second_degree_connections(self, page=1, page_size=10):
-        skip = (page - 1) * page_size
-        query = """
-        MATCH (me:User {uuid: $user_uuid})
-        MATCH (me)-[:FOLLOWS]->(friend:User)-[:FOLLOWS]->(friend_of_friend:User)
-        WHERE NOT (me)-[:FOLLOWS]->(friend_of_friend) AND me <> friend_of_friend
-        MATCH (post:Post)<-[:CREATED_POST]-(friend_of_friend)
-        OPTIONAL MATCH (post)<-[:ON]-(c:Comment)
-        OPTIONAL MATCH (post)<-[:LIKES]-(l:User)
-        OPTIONAL MATCH (me)-[ml:LIKES]->(post)
-        WITH post, friend_of_friend, COUNT(DISTINCT c) AS comments_count, COUNT(DISTINCT l) AS likes_count, COUNT(ml) > 0 AS liked
-        ORDER BY post.created_at DESC
-        WITH COLLECT({
-            post: post, 
-            comments_count: comments_count, 
-            likes_count: likes_count,
-            creator: {
-                uuid: friend_of_friend.uuid,
-                first_name: friend_of_friend.first_name,
-                last_name: friend_of_friend.last_name,
-                profile_image: friend_of_friend.profile_image,
-                title: friend_of_friend.title
+    def get_posts_from_following_since(self, since, limit=10, fields=None):
+        return _posts_since(
+            """
+            CALL {
+                WITH me
+                RETURN me AS creator
+                UNION
+                WITH me
+                MATCH (me)-[:FOLLOWS]->(creator:User)
+                RETURN creator
             }
-        }) AS all_posts, SIZE(COLLECT(post)) AS total
-        RETURN all_posts[$skip..$skip+$limit] AS paginated_posts, total
-        """
-
-        results, _ = db.cypher_query(
-            query,
-            {"user_uuid": self.uuid, "skip": skip, "limit": page_size},
+            """,
+            "",
+            self.uuid,
+            since,
+            limit,
+            fields,
         )
 
-        paginated_raw = results[0][0]
-        total = results[0][1]
+    def get_posts_from_second_degree_connections(
+        self, page=1, page_size=10, fields=None
+    ):
+        from .post import paginated_post_cards_query
+
+        liked = liked_cache.for_fields(self.uuid, fields)
+        query = paginated_post_cards_query(
+            """
+            MATCH (me:User {uuid: $current_user_uuid})
+            MATCH (me)-[:FOLLOWS]->(friend:User)-[:FOLLOWS]->(creator:User)
+            WHERE NOT (me)-[:FOLLOWS]->(creator) AND me <> creator
+            MATCH (post:Post)<-[:CREATED_POST]-(creator)
+            """,
+            fields,
+            liked,
+        )
 
-        from .post import Post
+        return _paginated_posts(
+            query, {"current_user_uuid": self.uuid}, page, page_size, liked
+        )
 
-        posts = []
-        for item in paginated_raw:
-            post = Post.inflate(item["post"])
-            post._comments_count = item["comments_count"]
-            post._likes_count = item["likes_count"]
-            post._creator = item["creator"]
-            post._liked = item["liked"]
-            posts.append(post)
+    def get_feed_since(self, since, limit=10, fields=None):
+        """Feed posts after the ``since`` cursor, ranked like ``get_feed``."""
+        return _posts_since(
+            """
+            CALL {
+                WITH me
+                RETURN me AS creator, 99 AS relationship_score
+                UNION
+                WITH me
+                MATCH (me)-[:FOLLOWS]->(creator:User)
+                RETURN creator, 100 AS relationship_score
+                UNION
+                WITH me
+                MATCH (me)-[:FOLLOWS]->(:User)-[:FOLLOWS]->(creator:User)
+                WHERE creator <> me AND NOT (me)-[:FOLLOWS]->(creator)
+                RETURN creator, 98 AS relationship_score
+            }
+            """,
+            """,
+            toFloat(relationship_score)
+                - (toFloat(datetime().epochSeconds - post.created_at) / 120.0)
+                AS priority
+            """,
+            self.uuid,
+            since,
+            limit,
+            fields,
+            ranked=True,
+        )
 
-        return {
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "results": posts,
-        }
+    def get_feed(self, page=1, page_size=10, fields=None):
+        from .post import inflate_post_card, post_card_projection
 
-    def get_feed(self, page=1, page_size=10):
         skip = (page - 1) * page_size
+        liked = liked_cache.for_fields(self.uuid, fields)
+        projection = post_card_projection(fields, liked=liked)
 
-        query = """
+        creators_query = """
         MATCH (me:User {uuid: $user_uuid})
 
         CALL {
@@ -637,101 +740,41 @@ class User(StructuredNode):
 
         MATCH (creator:User {uuid: creator_uuid})
         MATCH (post:Post)<-[:CREATED_POST]-(creator)
-        OPTIONAL MATCH (post)<-[:ON]-(c:Comment)
-        OPTIONAL MATCH (post)<-[:LIKES]-(l:User)
-        OPTIONAL MATCH (me)-[ml:LIKES]->(post)
-
-        WITH
-            post,
-            creator,
-            relationship_score,
-            COUNT(DISTINCT c) AS comments_count,
-            COUNT(DISTINCT l) AS likes_count,
-            COUNT(ml) > 0 AS liked,
-            datetime().epochSeconds - post.created_at AS age_seconds
+        """
 
-        WITH
+        # Cards are only projected for the page, after ranking.
+        query = f"""
+        {creators_query}
+        WITH DISTINCT
+            me,
             post,
             creator,
-            relationship_score,
-            comments_count,
-            likes_count,
-            liked,
-            age_seconds,
-            toFloat(relationship_score) - (toFloat(age_seconds) / 120.0) AS priority
+            toFloat(relationship_score)
+                - (toFloat(datetime().epochSeconds - post.created_at) / 120.0)
+                AS priority
 
         ORDER BY priority DESC
         SKIP $skip
         LIMIT $page_size
 
-        RETURN post, creator, comments_count, likes_count, liked, priority
+        RETURN {{{projection}, priority: priority}} AS item
         """
 
-        results, _ = db.cypher_query(
+        results, _ = read_query(
             query,
             {"user_uuid": self.uuid, "skip": skip, "page_size": page_size},
         )
+        posts = [
+            like_buffer.overlay(inflate_post_card(row[0], liked), self.uuid)
+            for row in results
+        ]
 
-        from .post import Post
-
-        posts = []
-        for row in results:
-            (
-                post_data,
-                creator_data,
-                comments_count,
-                likes_count,
-                liked,
-                priority,
-            ) = row
-
-            post = Post.inflate(post_data)
-            post._comments_count = comments_count
-            post._likes_count = likes_count
-            post._creator = {
-                "uuid": creator_data.get("uuid"),
-                "first_name": creator_data.get("first_name"),
-                "last_name": creator_data.get("last_name"),
-                "profile_image": creator_data.get("profile_image"),
-                "title": creator_data.get("title"),
-            }
-            post._liked = liked
-            post._priority = priority
-            posts.append(post)
-
-        count_query = """
-        MATCH (me:User {uuid: $user_uuid})
-
-        CALL {
-            WITH me
-            MATCH (creator:User)
-            OPTIONAL MATCH (me)-[:FOLLOWS]->(f1:User)-[:FOLLOWS]->(creator)
-            OPTIONAL MATCH (me)-[:FOLLOWS]->(creator)
-            WITH creator, me,
-                CASE
-                    WHEN creator.uuid = me.uuid THEN 99
-                    WHEN (me)-[:FOLLOWS]->(creator) THEN 100
-                    WHEN (me)-[:FOLLOWS]->(:User)-[:FOLLOWS]->(creator)
-                        AND NOT (me)-[:FOLLOWS]->(creator)
-                        AND creator <> me THEN 98
-                    WHEN f1 IS NOT NULL AND creator <> me
-                        AND NOT (me)-[:FOLLOWS]->(creator)
-                        AND NOT (me)-[:FOLLOWS]->(:User)-[:FOLLOWS]->(creator) THEN 90
-                    ELSE NULL
-                END AS relationship_score
-            WHERE relationship_score IS NOT NULL
-            RETURN creator.uuid AS creator_uuid
-        }
-
-        MATCH (creator:User {uuid: creator_uuid})
-        MATCH (post:Post)<-[:CREATED_POST]-(creator)
-        RETURN COUNT(post) AS total
+        count_query = f"""
+        {creators_query}
+        RETURN COUNT(DISTINCT post) AS total
         """
 
-        count_result, _ = db.cypher_query(
-            count_query,
-            {"user_uuid": self.uuid},
-        )
+        count_result, _ = read_query(count_query, {"user_uuid": self.uuid})
         total = count_result[0][0]
 
         return {
@@ -742,15 +785,278 @@ class User(StructuredNode):
         }
 
 
-def user_to_dict(user) -> dict:
+def _posts_since(
+    creators, columns, user_uuid, since, limit, fields, ranked=False
+):
+    """
+    The ``limit`` oldest posts after the ``since`` cursor, a ``post_cursor``
+    position whose uuid may be None to take every post after its time, by
+    the ``creator`` rows of ``creators``. Posts are ordered by that same
+    ``(created_at, uuid)`` position, so a client advancing its watermark
+    neither skips nor repeats posts that share a creation time. The
+    ``watermark`` is the position of the newest post returned, or None.
+
+    ``columns`` are added to ``me, post, creator``, like the ``priority``
+    needed when ``ranked``. Results are returned newest first, or by
+    ``priority``.
+    """
+    from .post import inflate_post_card, post_card_projection
+
+    liked = liked_cache.for_fields(user_uuid, fields)
+    projection = post_card_projection(fields, liked=liked)
+    projection += ", cursor: cursor"
+    if ranked:
+        projection += ", priority: priority"
+
+    # Starts from the creators, so the cost follows their posts rather than
+    # every post in the network.
+    query = f"""
+    MATCH (me:User {{uuid: $current_user_uuid}})
+    {creators}
+    MATCH (creator)-[:CREATED_POST]->(post:Post)
+    WITH *, round(post.created_at * 1000000) AS cursor
+    WHERE cursor > $since OR (cursor = $since AND post.uuid > $since_uuid)
+    WITH me, post, creator, cursor {columns}
+    ORDER BY cursor, post.uuid
+    LIMIT $limit
+    RETURN {{{projection}}} AS item
+    """
+
+    micros, since_uuid = since
+    results, _ = read_query(
+        query,
+        {
+            "current_user_uuid": user_uuid,
+            "since": micros,
+            "since_uuid": since_uuid,
+            "limit": limit + 1,
+        },
+    )
+    posts = []
+    for (item,) in results[:limit]:
+        post = like_buffer.overlay(inflate_post_card(item, liked), user_uuid)
+        post._cursor = (int(item["cursor"]), post.uuid)
+        posts.append(post)
+    has_more = len(results) > limit
+
+    watermark = posts[-1]._cursor if posts else None
+    if ranked:
+        posts.sort(key=lambda post: post._priority, reverse=True)
+    else:
+        posts.reverse()
+
+    return {
+        "since": since,
+        "watermark": watermark,
+        "has_more": has_more,
+        "results": posts,
+    }
+
+
+def _paginated_posts(query, params, page, page_size, liked=None):
+    from .post import inflate_post_card
+
+    params = dict(params, skip=(page - 1) * page_size, limit=page_size)
+    results, _ = read_query(query, params)
+    paginated_raw, total = results[0]
+
+    return {
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "results": [
+            like_buffer.overlay(
+                inflate_post_card(item, liked), params["current_user_uuid"]
+            )
+            for item in paginated_raw
+        ],
+    }
+
+
+def _paginated_follows(pattern, user_uuid, viewer_uuid, page, page_size):
+    """
+    One page of a follow list. Only the requested slice of the adjacency is
+    expanded and projected, and the total comes from the relationship
+    count, so pages of accounts with huge follower lists stay cheap.
+    """
+    total_pattern = pattern.replace("(user:User)", "()")
+    query = f"""
+    MATCH (target:User {{uuid: $uuid}})
+    OPTIONAL MATCH (me:User {{uuid: $current_user_uuid}})
+    CALL {{
+        WITH target, me
+        MATCH {pattern}
+        WITH user, me
+        SKIP $skip
+        LIMIT $limit
+        RETURN COLLECT({{
+            user: user,
+            followers_count: COUNT {{ (user)<-[:FOLLOWS]-() }},
+            following_count: COUNT {{ (user)-[:FOLLOWS]->() }},
+            is_following: EXISTS {{ (me)-[:FOLLOWS]->(user) }},
+            follows_me: EXISTS {{ (user)-[:FOLLOWS]->(me) }}
+        }}) AS page
+    }}
+    RETURN page, COUNT {{ {total_pattern} }} AS total
+    """
+
+    params = {
+        "uuid": user_uuid,
+        "current_user_uuid": viewer_uuid,
+        "skip": (page - 1) * page_size,
+        "limit": page_size,
+    }
+    results, _ = read_query(query, params)
+    paginated_raw, total = results[0] if results else ([], 0)
+
+    users = []
+    for item in paginated_raw:
+        user = User.inflate(item["user"])
+        user._followers_count = item["followers_count"]
+        user._following_count = item["following_count"]
+        user._is_following = item["is_following"]
+        user._follows_me = item["follows_me"]
+        users.append(user)
+
     return {
-        "uuid": user.uuid,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "title": user.title,
-        "email": user.email,
-        "followers_count": user.get_followers_count(),
-        "following_count": user.get_following_count(),
-        "profile_image": user.profile_image,
-        "skills": [skill.name for skill in user.skills.all()],
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "results": users,
     }
+
+
+def _follow_page_tags(user_uuid, viewer_uuid, data):
+    tags = {f"follows:{user_uuid}", f"follows:{viewer_uuid}"}
+    for user in data["results"]:
+        tags.add(f"user:{user.uuid}")
+        tags.add(f"follows:{user.uuid}")
+    return tags
+
+
+def _user_search_filter(title, skills, name, q):
+    """
+    The people search filters in a canonical form: lower-cased values,
+    resolved skill ids and deduplicated query words. None when none of
+    ``skills`` exists, so nothing can match.
+    """
+    where = []
+    params = {}
+    match = "MATCH (u:User)"
+
+    title = (title or "").strip().lower()
+    if title:
+        where.append("toLower(u.title) CONTAINS $title")
+        params["title"] = title
+
+    name = (name or "").strip().lower()
+    if name:
+        where.append(
+            "toLower(u.first_name + ' ' + u.last_name) CONTAINS $name"
+        )
+        params["name"] = name
+
+    if skills:
+        # Resolved up front, so the query seeks the skill nodes instead
+        # of comparing names over every HAS_SKILL edge.
+        skill_ids = sorted(set(skill_catalog.resolve(skills)))
+        if not skill_ids:
+            return None
+        match += "\nMATCH (u)-[:HAS_SKILL]->(s:Skill)"
+        where.append("elementId(s) IN $skill_ids")
+        params["skill_ids"] = skill_ids
+
+    q_words = sorted(set((q or "").lower().split()))
+    if q_words:
+        params["q_words"] = q_words
+        where.append("""
+        (
+            ANY(term IN $q_words WHERE
+                toLower(u.first_name) CONTAINS term OR
+                toLower(u.last_name) CONTAINS term OR
+                toLower(u.title) CONTAINS term
+            )
+            OR EXISTS {
+                MATCH (u)-[:HAS_SKILL]->(sx:Skill)
+                WHERE ANY(term IN $q_words WHERE sx.key CONTAINS term)
+            }
+        )
+        """)
+
+    return {"match": match, "where": where, "params": params}
+
+
+def _where(clauses):
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+def _search_users(search, sort_by, sort_dir):
+    """
+    Uuids of the users matching ``search`` in result order, the first
+    USER_SEARCH_MAX_IDS of them, and their total, shared by all viewers.
+    Profile and skill writes invalidate the ``user_search`` tag.
+    """
+    key = json.dumps([sort_by, sort_dir, search["params"]], sort_keys=True)
+    return cache.get_or_load(
+        f"user_search:{key}",
+        lambda: _query_user_search(search, sort_by, sort_dir),
+        tags=["user_search"],
+        ttl=USER_SEARCH_TTL,
+    )
+
+
+def _query_user_search(search, sort_by, sort_dir):
+    results, _ = read_query(
+        f"""
+        {search["match"]}
+        {_where(search["where"])}
+        WITH DISTINCT u
+        ORDER BY u.{sort_by} {sort_dir}, u.uuid
+        WITH COLLECT(u.uuid) AS ids
+        RETURN ids[..$max_ids], size(ids)
+        """,
+        {**search["params"], "max_ids": USER_SEARCH_MAX_IDS},
+    )
+    ids, total = results[0]
+    return {"ids": ids, "total": total, "truncated": len(ids) < total}
+
+
+def _search_user_uuids(search):
+    """Every uuid matching ``search``, for facets over truncated results."""
+    results, _ = read_query(
+        f"""
+        {search["match"]}
+        {_where(search["where"])}
+        RETURN COLLECT(DISTINCT u.uuid)
+        """,
+        search["params"],
+    )
+    return results[0][0]
+
+
+def _matches_search(user_uuid, search):
+    match = search["match"].replace("(u:User)", "(u:User {uuid: $uuid})", 1)
+    results, _ = read_query(
+        f"""
+        {match}
+        {_where(search["where"])}
+        RETURN count(u) > 0
+        """,
+        {**search["params"], "uuid": user_uuid},
+    )
+    return results[0][0]
+
+
+def user_to_dict(user) -> dict:
+    with read_transaction():
+        return {
+            "uuid": user.uuid,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "title": user.title,
+            "email": user.email,
+            "followers_count": user.get_followers_count(),
+            "following_count": user.get_following_count(),
+            "profile_image": user.profile_image,
+            "skills": [skill.name for skill in user.skills.all()],
+        }
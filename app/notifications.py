@@ -0,0 +1,190 @@
+import atexit
+import logging
+import queue
+import time
+from threading import Event, Lock, Thread
+from uuid import uuid4
+
+from app.cache import cache
+from app.db import write_query
+
+logger = logging.getLogger(__name__)
+
+# kind: pattern binding the recipient ``r`` from ``row.target``.
+RECIPIENTS = {
+    "post_like": "(:Post {uuid: row.target})<-[:CREATED_POST]-(r:User)",
+    "comment": "(:Post {uuid: row.target})<-[:CREATED_POST]-(r:User)",
+    "comment_like": (
+        "(:Comment {uuid: row.target})<-[:CREATED_COMMENT]-(r:User)"
+    ),
+    "reply": "(:Comment {uuid: row.target})<-[:CREATED_COMMENT]-(r:User)",
+    "follow": "(r:User {uuid: row.target})",
+}
+
+# Notifications of one batch, merged into the recipient's unread entry for
+# the same kind and target. Actors are distinct and the newest first; the
+# entry counts every distinct actor, so liking, unliking and liking again
+# counts once, and keeps the three latest.
+MERGE_NOTIFICATION = """
+UNWIND $rows AS row
+MATCH {pattern}
+WITH row, r, [a IN row.actors WHERE a <> r.uuid] AS actors
+WHERE size(actors) > 0
+MERGE (r)-[:NOTIFIED]->(n:Notification {{key: row.key, unread: true}})
+ON CREATE SET
+    n.uuid = row.uuid,
+    n.kind = row.kind,
+    n.target_uuid = row.target,
+    n.post_uuid = row.post,
+    n.count = 0,
+    n.actor_uuids = [],
+    n.all_actor_uuids = [],
+    n.created_at = row.at
+WITH row, r, n, actors, coalesce(n.all_actor_uuids, n.actor_uuids) AS seen
+WITH row, r, n, actors, seen, [a IN actors WHERE NOT a IN seen] AS new_actors
+SET
+    n.all_actor_uuids = seen + new_actors,
+    n.count = n.count + size(new_actors),
+    n.actor_uuids = reduce(
+        latest = [], a IN actors + n.actor_uuids |
+        CASE WHEN a IN latest OR size(latest) >= 3
+            THEN latest ELSE latest + a END
+    ),
+    n.updated_at = row.at
+RETURN r.uuid AS recipient
+"""
+
+
+class NotificationQueue:
+    """
+    In-process queue of activity notifications (likes, comments, replies,
+    follows).
+
+    Request handlers only enqueue; a background writer drains the queue
+    every ``flush_interval`` seconds, or once ``max_batch`` events are
+    waiting, collapses events on the same target into one row and merges
+    the rows into each recipient's unread notifications in a single
+    transaction. 500 likes on a post become one entry with a count of 500.
+    When the queue is full new events are dropped rather than slowing the
+    request down. Unread counts are cached and invalidated per recipient
+    after every batch.
+    """
+
+    def __init__(
+        self, enabled=True, flush_interval=0.5, max_batch=1000, size=10000
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=size)
+        self._flush_lock = Lock()
+        self._wake = Event()
+        self._thread = None
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("NOTIFICATIONS_ENABLED", True)
+        self.flush_interval = config.get("NOTIFICATIONS_FLUSH_MS", 500) / 1000
+        self.max_batch = config.get("NOTIFICATIONS_MAX_BATCH", 1000)
+        self._queue = queue.Queue(
+            maxsize=config.get("NOTIFICATIONS_QUEUE_SIZE", 10000)
+        )
+        app.extensions["notifications"] = self
+        if self.enabled and self._thread is None:
+            self._thread = Thread(
+                target=self._run, name="notifications", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def notify(self, kind, actor_uuid, target_uuid, post_uuid=None):
+        """
+        Queue ``kind`` of activity by ``actor_uuid`` on ``target_uuid``, the
+        post, comment or user it is about. The recipient is the target's
+        creator, or the target itself for follows.
+        """
+        if not self.enabled:
+            return
+        if kind not in RECIPIENTS:
+            raise ValueError(f"Unknown notification kind '{kind}'")
+        try:
+            self._queue.put_nowait(
+                (kind, actor_uuid, target_uuid, post_uuid, time.time())
+            )
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= self.max_batch:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing notifications failed")
+
+    def flush(self):
+        """Write the queued notifications, a batch at a time."""
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _write(self, batch):
+        rows = {}
+        for kind, actor_uuid, target_uuid, post_uuid, at in batch:
+            key = f"{kind}:{target_uuid}"
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {
+                    "key": key,
+                    "uuid": uuid4().hex,
+                    "kind": kind,
+                    "target": target_uuid,
+                    "post": post_uuid,
+                    "actors": [],
+                }
+            if actor_uuid in row["actors"]:
+                row["actors"].remove(actor_uuid)
+            row["actors"].insert(0, actor_uuid)
+            row["at"] = at
+
+        by_pattern = {}
+        for row in rows.values():
+            by_pattern.setdefault(RECIPIENTS[row["kind"]], []).append(row)
+        branches = []
+        params = {}
+        for i, (pattern, pattern_rows) in enumerate(by_pattern.items()):
+            branches.append(
+                MERGE_NOTIFICATION.replace("$rows", f"$rows{i}").format(
+                    pattern=pattern
+                )
+            )
+            params[f"rows{i}"] = pattern_rows
+
+        results, _ = write_query(
+            f"""
+            CALL {{
+                {" UNION ".join(branches)}
+            }}
+            RETURN DISTINCT recipient
+            """,
+            params,
+        )
+        cache.invalidate(
+            *(f"notifications:{recipient}" for (recipient,) in results)
+        )
+
+
+notifications = NotificationQueue()
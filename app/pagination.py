@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+from flask import current_app, request
+
+
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def pagination_args(default_page_size=10):
+    """
+    ``page`` and ``page_size`` from the query string. Unparsable values fall
+    back to the defaults and ``page_size`` is capped at ``MAX_PAGE_SIZE``,
+    so a client cannot make one request collect an unbounded page.
+    """
+    max_page_size = current_app.config.get("MAX_PAGE_SIZE", 100)
+    page = max(1, _int_arg("page", 1))
+    page_size = _int_arg("page_size", default_page_size)
+    return page, min(max(1, page_size), max_page_size)
+
+
+def parse_since(raw):
+    """
+    Watermark of an incremental refresh as a ``post_cursor`` position: a
+    previous ``watermark``, or epoch seconds or an ISO 8601 timestamp (UTC
+    unless it carries an offset), which take every post after that time
+    and have no uuid. Raises ValueError.
+    """
+    if "_" in raw:
+        try:
+            return parse_post_cursor(raw)
+        except ValueError:
+            pass
+    else:
+        try:
+            return round(float(raw) * 1000000), None
+        except (ValueError, OverflowError):
+            pass
+        try:
+            since = datetime.fromisoformat(raw)
+        except ValueError:
+            pass
+        else:
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return round(since.timestamp() * 1000000), None
+    raise ValueError(
+        "'since' must be a watermark, epoch seconds or an ISO 8601 timestamp"
+    )
+
+
+def post_cursor(post):
+    """
+    Position of ``post`` in a newest-first list of posts: its creation time
+    in whole microseconds, then its uuid to order posts created together.
+    """
+    return round(post.created_at.timestamp() * 1000000), post.uuid
+
+
+def format_post_cursor(cursor):
+    return None if cursor is None else "%d_%s" % cursor
+
+
+def parse_post_cursor(raw):
+    """
+    A ``post_cursor`` from a previous ``next_cursor``. Raises ValueError.
+    """
+    micros, _, uuid = raw.partition("_")
+    try:
+        micros = int(micros)
+    except ValueError:
+        uuid = ""
+    if not uuid:
+        raise ValueError("'cursor' must be a 'next_cursor' from a response")
+    return micros, uuid
+
+
+def parse_cursor(raw):
+    """A ``cursor`` from a previous ``next_cursor``. Raises ValueError."""
+    try:
+        cursor = int(raw)
+    except ValueError:
+        cursor = 0
+    if cursor < 1:
+        raise ValueError("'cursor' must be a 'next_cursor' from a response")
+    return cursor
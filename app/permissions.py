@@ -10,6 +10,8 @@ from flask_jwt_extended.exceptions import (
 )
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 
+from app.metrics import metrics
+
 
 def jwt_guard(fn):
     @wraps(fn)
@@ -25,6 +27,7 @@ def jwt_guard(fn):
             InvalidTokenError,
             ExpiredSignatureError,
         ) as e:
+            metrics.inc("jwt_verification_failures_total", type(e).__name__)
             return {"error": str(e)}, 401
         return fn(*args, **kwargs)
 
@@ -37,6 +40,7 @@ def jwt_refresh_guard(fn):
         try:
             verify_jwt_in_request(refresh=True)
         except Exception as e:
+            metrics.inc("jwt_verification_failures_total", type(e).__name__)
             return {"error": str(e)}, 401
 
         return fn(*args, **kwargs)
@@ -0,0 +1,182 @@
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from threading import Event, Lock, Thread, get_ident
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Samples with a Neo4j driver frame anywhere on the stack count as database
+# wait: the driver's socket reads (which bottom out in socket, ssl or
+# selectors), plus its decoding of what it received.
+DB_MODULE = "neo4j"
+
+
+class Profile:
+    def __init__(self):
+        self.stacks = Counter()
+        self.db = 0
+        self.cpu = 0
+
+    def add(self, frame):
+        labels = []
+        kind = "cpu"
+        while frame is not None:
+            module = _module(frame)
+            if module.split(".", 1)[0] == DB_MODULE:
+                kind = "db-wait"
+            labels.append(f"{module}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        if kind == "db-wait":
+            self.db += 1
+        else:
+            self.cpu += 1
+        labels.append(kind)
+        self.stacks[";".join(reversed(labels))] += 1
+
+
+def _module(frame):
+    return frame.f_globals.get("__name__") or "?"
+
+
+class RequestProfiler:
+    """
+    Opt-in sampling profiler for single requests. A request is profiled
+    when it carries ``PROFILER_HEADER`` set to ``PROFILER_TOKEN``, or at
+    random with probability ``PROFILER_SAMPLE_RATE``. While any request is
+    profiled, a background thread samples its stack every
+    ``PROFILER_INTERVAL_MS``; the samples are appended in collapsed-stack
+    format (``flamegraph.pl``, speedscope) to one file per route, with
+    ``db-wait`` or ``cpu`` as the root frame. Unprofiled requests only pay
+    for the header check.
+
+    Sampling is not free: each tick calls ``sys._current_frames()``, which
+    is proportional to the number of threads in the process, and walks the
+    profiled stacks while holding the GIL. At the default 5 ms interval
+    that is a few percent of one core while a profile is running. To bound
+    it, at most ``PROFILER_MAX_CONCURRENT`` requests are profiled at once
+    (further requests run unprofiled) and the interval is never shorter
+    than ``MIN_INTERVAL``; the thread sleeps whenever nothing is profiled.
+    """
+
+    MIN_INTERVAL = 0.001
+
+    def __init__(
+        self,
+        sample_rate=0.0,
+        token=None,
+        header="X-Profile",
+        interval=0.005,
+        output_dir="/tmp/social-media-profiles",
+        max_concurrent=4,
+    ):
+        self.sample_rate = sample_rate
+        self.token = token
+        self.header = header
+        self.interval = max(interval, self.MIN_INTERVAL)
+        self.max_concurrent = max_concurrent
+        self.output_dir = output_dir
+        self._profiles = {}
+        self._lock = Lock()
+        self._file_lock = Lock()
+        self._active = Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.sample_rate or self.token)
+
+    def init_app(self, app):
+        config = app.config
+        self.sample_rate = config.get("PROFILER_SAMPLE_RATE", 0.0)
+        self.token = config.get("PROFILER_TOKEN")
+        self.header = config.get("PROFILER_HEADER", "X-Profile")
+        self.interval = max(
+            config.get("PROFILER_INTERVAL_MS", 5) / 1000, self.MIN_INTERVAL
+        )
+        self.max_concurrent = config.get("PROFILER_MAX_CONCURRENT", 4)
+        self.output_dir = config.get(
+            "PROFILER_OUTPUT_DIR", "/tmp/social-media-profiles"
+        )
+        app.extensions["profiler"] = self
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+
+    def _requested(self):
+        value = request.headers.get(self.header)
+        if value and self.token:
+            return hmac.compare_digest(value, self.token)
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def _before_request(self):
+        if not self._requested():
+            return
+        profile = Profile()
+        with self._lock:
+            if len(self._profiles) >= self.max_concurrent:
+                return
+            self._profiles[get_ident()] = profile
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._thread.start()
+        g.profile = profile
+        g.profile_started = time.perf_counter()
+        self._active.set()
+
+    def _after_request(self, response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        with self._lock:
+            self._profiles.pop(get_ident(), None)
+            if not self._profiles:
+                self._active.clear()
+
+        elapsed = (time.perf_counter() - g.profile_started) * 1000
+        response.headers["X-Profile-Samples"] = (
+            f"db-wait={profile.db}; cpu={profile.cpu}; wall-ms={elapsed:.1f}"
+        )
+        if request.url_rule is not None:
+            try:
+                self._write(request.method, request.url_rule.rule, profile)
+            except OSError:
+                logger.exception("Writing request profile failed")
+        return response
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            with self._lock:
+                profiles = dict(self._profiles)
+            frames = sys._current_frames()
+            for ident, profile in profiles.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    profile.add(frame)
+            del frames
+            time.sleep(self.interval)
+
+    def path_for(self, method, route):
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", f"{method}{route}").strip("_")
+        return os.path.join(self.output_dir, f"{slug}.collapsed")
+
+    def _write(self, method, route, profile):
+        lines = "".join(
+            f"{stack} {count}\n" for stack, count in profile.stacks.items()
+        )
+        with self._file_lock:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(self.path_for(method, route), "a") as out:
+                out.write(lines)
+
+
+profiler = RequestProfiler()
@@ -0,0 +1,213 @@
+import logging
+import time
+from threading import Event, Lock, Thread
+
+from app.db import read_query, write_query
+
+logger = logging.getLogger(__name__)
+
+# Each step removes at most $batch items under a deleted root and is run
+# until it finds nothing left: like and timeline edges first, then replies,
+# then comments, so no transaction grows with the size of the subtree.
+PURGE_STEPS = (
+    (
+        "edges",
+        """
+        MATCH (root:{label} {{uuid: $uuid}})<-[:ON|REPLY_TO*0..2]-(n)
+        MATCH (n)<-[r:LIKES|TIMELINE]-()
+        WITH r LIMIT $batch
+        DELETE r
+        RETURN COUNT(*)
+        """,
+    ),
+    (
+        "nodes",
+        """
+        MATCH (root:{label} {{uuid: $uuid}})<-[:ON|REPLY_TO]-()
+            <-[:REPLY_TO]-(n:Comment)
+        WITH n LIMIT $batch
+        DETACH DELETE n
+        RETURN COUNT(*)
+        """,
+    ),
+    (
+        "nodes",
+        """
+        MATCH (root:{label} {{uuid: $uuid}})<-[:ON|REPLY_TO]-(n:Comment)
+        WITH n LIMIT $batch
+        DETACH DELETE n
+        RETURN COUNT(*)
+        """,
+    ),
+    (
+        "nodes",
+        """
+        MATCH (root:{label} {{uuid: $uuid}})
+        DETACH DELETE root
+        RETURN COUNT(*)
+        """,
+    ),
+)
+
+# Lease the oldest unleased root. The first SET takes the node's write
+# lock, so of two workers racing for one root the second re-reads the
+# lease after the first committed it and claims nothing.
+CLAIM_ROOT = """
+MATCH (root:DeletedPost|DeletedComment)
+WHERE coalesce(root.purge_lease, 0) < $now
+WITH root
+ORDER BY root.deleted_at
+LIMIT 1
+SET root.purge_claimed_at = $now
+WITH root
+WHERE coalesce(root.purge_lease, 0) < $now
+SET root.purge_lease = $now + $lease
+RETURN root.uuid, labels(root), root.deleted_at
+"""
+
+
+class Purger:
+    """
+    Background removal of soft-deleted posts and comments.
+
+    Delete endpoints only relabel the root node (``DeletedPost`` or
+    ``DeletedComment``), which hides it and its subtree from every read.
+    The labels are the work queue, so roots left over from a restart are
+    picked up again. Every worker runs a purger; each root is leased to one
+    of them for ``lease`` seconds, renewed while it works, so workers
+    purge different roots and a crashed worker's root is taken over once
+    its lease runs out.
+    """
+
+    def __init__(self, enabled=True, batch_size=500, interval=5, lease=300):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self._wake = Event()
+        self._lock = Lock()
+        self._thread = None
+        self._current = None
+        self._stats = {
+            "roots_purged": 0,
+            "nodes_deleted": 0,
+            "edges_deleted": 0,
+            "batches": 0,
+            "busy_seconds": 0.0,
+        }
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("PURGE_ENABLED", True)
+        self.batch_size = config.get("PURGE_BATCH_SIZE", 500)
+        self.interval = config.get("PURGE_INTERVAL", 5)
+        self.lease = config.get("PURGE_LEASE", 300)
+        app.extensions["purger"] = self
+        if self.enabled and self._thread is None:
+            self._thread = Thread(target=self._run, name="purge", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                while self.purge_next():
+                    pass
+            except Exception:
+                logger.exception("Purging deleted content failed")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def purge_next(self):
+        """
+        Claim and purge the oldest deleted root no other worker holds.
+        False when there is none.
+        """
+        results, _ = write_query(
+            CLAIM_ROOT, {"now": time.time(), "lease": self.lease}
+        )
+        if not results:
+            return False
+
+        uuid, labels, deleted_at = results[0]
+        label = "DeletedPost" if "DeletedPost" in labels else "DeletedComment"
+        self.purge(uuid, label, deleted_at)
+        return True
+
+    def purge(self, uuid, label, deleted_at=None):
+        with self._lock:
+            self._current = {
+                "uuid": uuid,
+                "kind": label,
+                "deleted_at": deleted_at,
+                "started_at": time.time(),
+                "nodes_deleted": 0,
+                "edges_deleted": 0,
+            }
+
+        renew_at = time.time() + self.lease / 2
+        for kind, query in PURGE_STEPS:
+            query = query.format(label=label)
+            while True:
+                if time.time() > renew_at:
+                    self._renew(uuid, label)
+                    renew_at = time.time() + self.lease / 2
+                started = time.perf_counter()
+                results, _ = write_query(
+                    query, {"uuid": uuid, "batch": self.batch_size}
+                )
+                removed = results[0][0] if results else 0
+                self._record(kind, removed, time.perf_counter() - started)
+                if removed < self.batch_size:
+                    break
+
+        with self._lock:
+            self._stats["roots_purged"] += 1
+            self._current = None
+
+    def _renew(self, uuid, label):
+        write_query(
+            f"""
+            MATCH (root:{label} {{uuid: $uuid}})
+            SET root.purge_lease = $now + $lease
+            """,
+            {"uuid": uuid, "now": time.time(), "lease": self.lease},
+        )
+
+    def _record(self, kind, removed, seconds):
+        with self._lock:
+            self._stats[f"{kind}_deleted"] += removed
+            self._stats["batches"] += 1
+            self._stats["busy_seconds"] += seconds
+            if self._current is not None:
+                self._current[f"{kind}_deleted"] += removed
+
+    def progress(self):
+        results, _ = read_query("""
+            MATCH (root:DeletedPost|DeletedComment)
+            RETURN COUNT(root)
+            """)
+        with self._lock:
+            stats = dict(self._stats)
+            current = dict(self._current) if self._current else None
+
+        busy_seconds = stats.pop("busy_seconds")
+        removed = stats["nodes_deleted"] + stats["edges_deleted"]
+        stats.update(
+            {
+                "enabled": self.enabled,
+                "batch_size": self.batch_size,
+                "roots_pending": results[0][0],
+                "busy_seconds": round(busy_seconds, 3),
+                "items_per_second": (
+                    round(removed / busy_seconds, 1) if busy_seconds else 0.0
+                ),
+                "current": current,
+            }
+        )
+        return stats
+
+
+purger = Purger()
@@ -0,0 +1,35 @@
+from .base import Repository
+
+
+class RepositoryExtension:
+    """
+    The configured ``Repository`` backend. ``REPOSITORY_BACKEND`` is
+    "neo4j" or "memory"; attribute access is forwarded to the backend.
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        backend = app.config.get("REPOSITORY_BACKEND", "neo4j")
+        if backend == "neo4j":
+            from .neo4j_repository import Neo4jRepository
+
+            self.backend = Neo4jRepository()
+        elif backend == "memory":
+            from .memory_repository import InMemoryRepository
+
+            self.backend = InMemoryRepository()
+        else:
+            raise ValueError(f"Unknown REPOSITORY_BACKEND '{backend}'")
+        app.extensions["repository"] = self
+
+    def __getattr__(self, name):
+        if self.backend is None:
+            raise RuntimeError("Repository used before init_app")
+        return getattr(self.backend, name)
+
+
+repository = RepositoryExtension()
+
+__all__ = ["Repository", "RepositoryExtension", "repository"]
@@ -0,0 +1,91 @@
+from abc import ABC, abstractmethod
+
+
+class Repository(ABC):
+    """
+    Data access used by the feed, list, follow and like endpoints.
+
+    Methods return the same shapes as the model methods they stand for:
+    model instances carrying ``_``-prefixed computed attributes, and pages
+    as ``{"page", "page_size", "total", "results"}`` dicts.
+    """
+
+    @abstractmethod
+    def find_user_by_email(self, email):
+        pass
+
+    @abstractmethod
+    def find_user_by_uuid(self, uuid):
+        pass
+
+    @abstractmethod
+    def follow(self, user, other):
+        """Make ``user`` follow ``other``. False if nothing changed."""
+
+    @abstractmethod
+    def unfollow(self, user, other):
+        """Make ``user`` stop following ``other``. False if nothing changed."""
+
+    @abstractmethod
+    def count_followers(self, user_uuid):
+        pass
+
+    @abstractmethod
+    def count_following(self, user_uuid):
+        pass
+
+    @abstractmethod
+    def get_followers(self, viewer, user_uuid, page=1, page_size=10):
+        pass
+
+    @abstractmethod
+    def get_following(self, viewer, user_uuid, page=1, page_size=10):
+        pass
+
+    @abstractmethod
+    def create_post(self, user, text, images):
+        pass
+
+    @abstractmethod
+    def find_post(self, post_uuid, viewer_uuid):
+        """The post card as seen by ``viewer_uuid``, or None."""
+
+    @abstractmethod
+    def like_post(self, user, post_uuid):
+        """
+        True if this created the like, False if ``user`` already liked the
+        post, None if there is no such post.
+        """
+
+    @abstractmethod
+    def unlike_post(self, user, post_uuid):
+        """
+        True if this removed a like, False if there was none, None if there
+        is no such post.
+        """
+
+    @abstractmethod
+    def get_user_posts(
+        self, user_uuid, viewer_uuid, page=1, page_size=10, fields=None
+    ):
+        pass
+
+    @abstractmethod
+    def get_following_posts(self, viewer, page=1, page_size=10, fields=None):
+        pass
+
+    @abstractmethod
+    def get_feed(self, viewer, page=1, page_size=10, fields=None):
+        pass
+
+    @abstractmethod
+    def get_comments(
+        self,
+        post_uuid,
+        viewer_uuid,
+        page=1,
+        page_size=10,
+        fields=None,
+        include_replies=0,
+    ):
+        pass
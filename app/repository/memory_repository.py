@@ -0,0 +1,351 @@
+import copy
+import heapq
+import time
+from bisect import insort
+from collections import defaultdict
+from itertools import islice
+from threading import RLock
+
+from app.models.comment import Comment, reply_cursor
+from app.models.post import Post
+from app.models.user import User
+
+from .base import Repository
+
+# Relationship scores of the ranked feed, as in ``User.get_feed``.
+SELF_SCORE = 99
+FOLLOWING_SCORE = 100
+SECOND_DEGREE_SCORE = 98
+
+
+def _page(items, total, page, page_size):
+    return {
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "results": items,
+    }
+
+
+class InMemoryRepository(Repository):
+    """
+    Process-local graph for tests and microbenchmarks.
+
+    Follow edges are kept as adjacency dicts in both directions (dicts keep
+    insertion order, standing in for Neo4j's storage order) and each
+    author's posts as a list sorted by creation time, so the following feed
+    is a k-way merge instead of a sort.
+
+    ``tests/test_repository_parity.py`` compares it with Neo4j on a small
+    seeded graph both model the same way, and only when ``NEO4J_TEST_URL``
+    points at a test database. Known differences:
+
+    - Following posts are every post of the followed authors, as in Neo4j
+      until the user's timeline is built. After that Neo4j reads the
+      TIMELINE, which holds a followed regular author's latest
+      ``TIMELINE_BACKFILL`` posts at follow time and everything after, plus
+      the ``CELEBRITY_RECENT_POSTS`` latest posts of celebrity authors.
+    - Nothing is soft-deleted, so nothing is hidden the way
+      ``VISIBLE_COMMENT`` and the ``Deleted*`` labels hide it in Neo4j.
+    - ``fields`` is ignored: cards always carry every computed attribute
+      and the routes pick the requested ones.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self.users = {}
+        self.users_by_email = {}
+        self.posts = {}
+        self.comments = {}
+        self.following = defaultdict(dict)
+        self.followers = defaultdict(dict)
+        self.author_posts = defaultdict(list)
+        self.post_author = {}
+        self.post_likes = defaultdict(set)
+        self.post_comments = defaultdict(list)
+        self.comment_author = {}
+        self.comment_likes = defaultdict(set)
+        self.comment_replies = defaultdict(set)
+
+    # Population helpers, not part of the Repository interface.
+
+    def add_user(self, **properties):
+        user = User(**properties)
+        with self._lock:
+            self.users[user.uuid] = user
+            self.users_by_email[user.email] = user
+        return user
+
+    def add_comment(self, user, post_uuid, text, created_at=None):
+        comment = Comment(text=text)
+        if created_at is not None:
+            comment.created_at = created_at
+        with self._lock:
+            self.comments[comment.uuid] = comment
+            self.comment_author[comment.uuid] = user.uuid
+            insort(
+                self.post_comments[post_uuid],
+                (comment.created_at.timestamp(), comment.uuid),
+            )
+        return comment
+
+    def add_reply(self, user, comment_uuid, text):
+        reply = Comment(text=text)
+        with self._lock:
+            self.comments[reply.uuid] = reply
+            self.comment_author[reply.uuid] = user.uuid
+            self.comment_replies[comment_uuid].add(reply.uuid)
+        return reply
+
+    def like_comment(self, user, comment_uuid):
+        with self._lock:
+            self.comment_likes[comment_uuid].add(user.uuid)
+
+    # Users and follows
+
+    def _creator_card(self, user_uuid):
+        user = self.users[user_uuid]
+        return {
+            "uuid": user.uuid,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "profile_image": user.profile_image,
+            "title": user.title,
+        }
+
+    def find_user_by_email(self, email):
+        return self.users_by_email.get(email)
+
+    def find_user_by_uuid(self, uuid):
+        return self.users.get(uuid)
+
+    def follow(self, user, other):
+        with self._lock:
+            if (
+                user.uuid == other.uuid
+                or other.uuid in self.following[user.uuid]
+            ):
+                return False
+            self.following[user.uuid][other.uuid] = True
+            self.followers[other.uuid][user.uuid] = True
+            return True
+
+    def unfollow(self, user, other):
+        with self._lock:
+            if other.uuid not in self.following[user.uuid]:
+                return False
+            del self.following[user.uuid][other.uuid]
+            del self.followers[other.uuid][user.uuid]
+            return True
+
+    def count_followers(self, user_uuid):
+        return len(self.followers.get(user_uuid, ()))
+
+    def count_following(self, user_uuid):
+        return len(self.following.get(user_uuid, ()))
+
+    def _follow_card(self, user_uuid, viewer_uuid):
+        user = copy.copy(self.users[user_uuid])
+        user._followers_count = self.count_followers(user_uuid)
+        user._following_count = self.count_following(user_uuid)
+        user._is_following = user_uuid in self.following.get(viewer_uuid, ())
+        user._follows_me = viewer_uuid in self.following.get(user_uuid, ())
+        return user
+
+    def _follow_page(self, adjacency, viewer, user_uuid, page, page_size):
+        with self._lock:
+            uuids = adjacency.get(user_uuid, {})
+            skip = (page - 1) * page_size
+            results = [
+                self._follow_card(uuid, viewer.uuid)
+                for uuid in islice(uuids, skip, skip + page_size)
+            ]
+            return _page(results, len(uuids), page, page_size)
+
+    def get_followers(self, viewer, user_uuid, page=1, page_size=10):
+        return self._follow_page(
+            self.followers, viewer, user_uuid, page, page_size
+        )
+
+    def get_following(self, viewer, user_uuid, page=1, page_size=10):
+        return self._follow_page(
+            self.following, viewer, user_uuid, page, page_size
+        )
+
+    # Posts and likes
+
+    def create_post(self, user, text, images, created_at=None):
+        post = Post(text=text, images=images)
+        if created_at is not None:
+            post.created_at = post.updated_at = created_at
+        with self._lock:
+            self.posts[post.uuid] = post
+            self.post_author[post.uuid] = user.uuid
+            insort(
+                self.author_posts[user.uuid],
+                (post.created_at.timestamp(), post.uuid),
+            )
+        return post
+
+    def _post_card(self, post_uuid, viewer_uuid):
+        post = copy.copy(self.posts[post_uuid])
+        post._creator = self._creator_card(self.post_author[post_uuid])
+        post._comments_count = len(self.post_comments.get(post_uuid, ()))
+        post._likes_count = len(self.post_likes.get(post_uuid, ()))
+        post._liked = viewer_uuid in self.post_likes.get(post_uuid, ())
+        return post
+
+    def find_post(self, post_uuid, viewer_uuid):
+        with self._lock:
+            if post_uuid not in self.posts:
+                return None
+            return self._post_card(post_uuid, viewer_uuid)
+
+    def like_post(self, user, post_uuid):
+        with self._lock:
+            if post_uuid not in self.posts:
+                return None
+            likes = self.post_likes[post_uuid]
+            if user.uuid in likes:
+                return False
+            likes.add(user.uuid)
+            return True
+
+    def unlike_post(self, user, post_uuid):
+        with self._lock:
+            if post_uuid not in self.posts:
+                return None
+            likes = self.post_likes[post_uuid]
+            if user.uuid not in likes:
+                return False
+            likes.discard(user.uuid)
+            return True
+
+    def _newest_first(self, author_uuids):
+        """Posts of ``author_uuids`` as one newest-first stream."""
+        return heapq.merge(
+            *(
+                reversed(self.author_posts.get(uuid, ()))
+                for uuid in author_uuids
+            ),
+            reverse=True,
+        )
+
+    def _post_page(self, entries, total, viewer_uuid, page, page_size):
+        skip = (page - 1) * page_size
+        results = [
+            self._post_card(entry[-1], viewer_uuid)
+            for entry in islice(entries, skip, skip + page_size)
+        ]
+        return _page(results, total, page, page_size)
+
+    def get_user_posts(
+        self, user_uuid, viewer_uuid, page=1, page_size=10, fields=None
+    ):
+        with self._lock:
+            return self._post_page(
+                self._newest_first([user_uuid]),
+                len(self.author_posts.get(user_uuid, ())),
+                viewer_uuid,
+                page,
+                page_size,
+            )
+
+    def get_following_posts(self, viewer, page=1, page_size=10, fields=None):
+        with self._lock:
+            authors = [viewer.uuid, *self.following.get(viewer.uuid, ())]
+            return self._post_page(
+                self._newest_first(authors),
+                sum(len(self.author_posts.get(uuid, ())) for uuid in authors),
+                viewer.uuid,
+                page,
+                page_size,
+            )
+
+    def _feed_scores(self, viewer_uuid):
+        following = self.following.get(viewer_uuid, {})
+        scores = {viewer_uuid: SELF_SCORE}
+        for uuid in following:
+            scores[uuid] = FOLLOWING_SCORE
+        for friend in following:
+            for uuid in self.following.get(friend, ()):
+                scores.setdefault(uuid, SECOND_DEGREE_SCORE)
+        return scores
+
+    def _ranked(self, author_uuid, score, now):
+        for created_at, post_uuid in reversed(
+            self.author_posts.get(author_uuid, ())
+        ):
+            yield score - (now - created_at) / 120.0, post_uuid
+
+    def get_feed(self, viewer, page=1, page_size=10, fields=None):
+        now = int(time.time())
+        with self._lock:
+            scores = self._feed_scores(viewer.uuid)
+            # Within one author priority falls with age, so each author's
+            # newest-first list is already in priority order.
+            streams = [
+                self._ranked(uuid, score, now)
+                for uuid, score in scores.items()
+            ]
+            total = sum(
+                len(self.author_posts.get(uuid, ())) for uuid in scores
+            )
+            skip = (page - 1) * page_size
+            results = []
+            for priority, post_uuid in islice(
+                heapq.merge(*streams, reverse=True), skip, skip + page_size
+            ):
+                post = self._post_card(post_uuid, viewer.uuid)
+                post._priority = priority
+                results.append(post)
+            return _page(results, total, page, page_size)
+
+    # Comments
+
+    def get_comments(
+        self,
+        post_uuid,
+        viewer_uuid,
+        page=1,
+        page_size=10,
+        fields=None,
+        include_replies=0,
+    ):
+        with self._lock:
+            entries = self.post_comments.get(post_uuid, [])
+            skip = (page - 1) * page_size
+            results = []
+            for _, comment_uuid in islice(
+                reversed(entries), skip, skip + page_size
+            ):
+                comment = self._comment_card(comment_uuid, viewer_uuid)
+                if include_replies:
+                    replies = sorted(
+                        self.comment_replies.get(comment_uuid, ()),
+                        key=lambda uuid: self.comments[uuid].created_at,
+                    )
+                    comment._replies = [
+                        self._comment_card(uuid, viewer_uuid)
+                        for uuid in replies[:include_replies]
+                    ]
+                    comment._replies_cursor = (
+                        reply_cursor(comment._replies[-1])
+                        if len(replies) > include_replies
+                        else None
+                    )
+                results.append(comment)
+            return _page(results, len(entries), page, page_size)
+
+    def _comment_card(self, comment_uuid, viewer_uuid):
+        comment = copy.copy(self.comments[comment_uuid])
+        comment._creator = self._creator_card(
+            self.comment_author[comment_uuid]
+        )
+        likes = self.comment_likes.get(comment_uuid, ())
+        comment._likes_count = len(likes)
+        comment._replies_count = len(
+            self.comment_replies.get(comment_uuid, ())
+        )
+        comment._liked = viewer_uuid in likes
+        return comment
@@ -0,0 +1,93 @@
+from app.db import read_query, write_transaction
+from app.models.comment import Comment
+from app.models.post import Post
+from app.models.user import User
+from app.timeline import timeline
+
+from .base import Repository
+
+
+class Neo4jRepository(Repository):
+    """The production backend, delegating to the neomodel models."""
+
+    def find_user_by_email(self, email):
+        return User.find_by_email(email)
+
+    def find_user_by_uuid(self, uuid):
+        return User.find_by_uuid(uuid)
+
+    def follow(self, user, other):
+        return user.follow(other)
+
+    def unfollow(self, user, other):
+        return user.unfollow(other)
+
+    def count_followers(self, user_uuid):
+        results, _ = read_query(
+            "MATCH (u:User {uuid: $uuid}) RETURN COUNT { (u)<-[:FOLLOWS]-() }",
+            {"uuid": user_uuid},
+        )
+        return results[0][0] if results else 0
+
+    def count_following(self, user_uuid):
+        results, _ = read_query(
+            "MATCH (u:User {uuid: $uuid}) RETURN COUNT { (u)-[:FOLLOWS]->() }",
+            {"uuid": user_uuid},
+        )
+        return results[0][0] if results else 0
+
+    def get_followers(self, viewer, user_uuid, page=1, page_size=10):
+        return viewer.get_followers(user_uuid, page=page, page_size=page_size)
+
+    def get_following(self, viewer, user_uuid, page=1, page_size=10):
+        return viewer.get_following(user_uuid, page=page, page_size=page_size)
+
+    def create_post(self, user, text, images):
+        with write_transaction():
+            post = Post(text=text, images=images)
+            post.save()
+            post.created_by.connect(user)
+        timeline.publish(post.uuid, user.uuid)
+        return post
+
+    def find_post(self, post_uuid, viewer_uuid):
+        return Post.find_by_uuid(post_uuid, viewer_uuid)
+
+    def like_post(self, user, post_uuid):
+        return Post.like(post_uuid, user.uuid)
+
+    def unlike_post(self, user, post_uuid):
+        return Post.unlike(post_uuid, user.uuid)
+
+    def get_user_posts(
+        self, user_uuid, viewer_uuid, page=1, page_size=10, fields=None
+    ):
+        return User.get_user_posts(
+            user_uuid, viewer_uuid, page, page_size, fields=fields
+        )
+
+    def get_following_posts(self, viewer, page=1, page_size=10, fields=None):
+        return viewer.get_posts_from_following(
+            page=page, page_size=page_size, fields=fields
+        )
+
+    def get_feed(self, viewer, page=1, page_size=10, fields=None):
+        return viewer.get_feed(page=page, page_size=page_size, fields=fields)
+
+    def get_comments(
+        self,
+        post_uuid,
+        viewer_uuid,
+        page=1,
+        page_size=10,
+        fields=None,
+        include_replies=0,
+    ):
+        return Comment.get_comments(
+            post_uuid=post_uuid,
+            current_user_uuid=viewer_uuid,
+            page=page,
+            page_size=page_size,
+            fields=fields,
+            include_replies=include_replies,
+        )
@@ -2,14 +2,54 @@ from flask import Response, json, request
 from flask_jwt_extended import get_jwt_identity
 from flask_restx import Namespace, Resource, fields
 
-from app.models.comment import Comment
+from app.cache import cache
+from app.conditional import make_etag, not_modified, with_etag
+from app.db import read_transaction, write_transaction
+from app.events import broker
+from app.fields import parse_fields
+from app.idempotency import idempotent
+from app.liked_cache import liked_cache
+from app.models.comment import REPLY_CARD_FIELDS, Comment
 from app.models.post import Post
 from app.models.user import User
+from app.notifications import notifications
+from app.pagination import pagination_args, parse_cursor
 from app.permissions import jwt_guard
+from app.purge import purger
 
 comment_nc = Namespace("comments", description="Comment-related operations")
 
 
+def comment_card_to_dict(comment, fields):
+    card = {}
+    for field in fields:
+        if field == "created_by":
+            creator = comment._creator
+            card["created_by"] = {
+                "uuid": creator["uuid"],
+                "name": f"{creator['first_name']} {creator['last_name']}",
+                "profile_image": creator.get("profile_image"),
+                "title": creator.get("title"),
+            }
+        elif field == "created_at":
+            card["created_at"] = str(comment.created_at)
+        elif field == "liked":
+            card["liked"] = getattr(comment, "_liked", False)
+        elif field in ("likes_count", "replies_count"):
+            card[field] = getattr(comment, f"_{field}", 0)
+        else:
+            card[field] = getattr(comment, field)
+    if hasattr(comment, "_replies"):
+        reply_fields = [f for f in fields if f in REPLY_CARD_FIELDS]
+        card["replies"] = [
+            comment_card_to_dict(reply, reply_fields)
+            for reply in comment._replies
+        ]
+        cursor = comment._replies_cursor
+        card["replies_cursor"] = None if cursor is None else str(cursor)
+    return card
+
+
 comment_create_model = comment_nc.model(
     "CreateComment",
     {
@@ -23,6 +63,7 @@ comment_create_model = comment_nc.model(
 @comment_nc.route("/")
 class CommentList(Resource):
     @jwt_guard
+    @idempotent
     @comment_nc.expect(comment_create_model)
     def post(self):
         current_user: User = User.find_by_email(get_jwt_identity())
@@ -46,26 +87,25 @@ class CommentList(Resource):
                 status=400,
             )
 
-        comment: Comment = Comment(text=text).save()
-        comment.created_by.connect(current_user)
-
+        post = parent = None
         if post_uuid:
             post = Post.find_by_uuid(post_uuid, current_user.uuid)
             if not post:
                 return Response(
                     json.dumps({"error": "Post not found"}), status=404
                 )
-            comment.on_post.connect(post)
 
         if comment_uuid:
-            parent = Comment.nodes.get_or_none(uuid=comment_uuid)
+            with read_transaction():
+                parent = Comment.get_visible(comment_uuid)
+                is_reply = bool(parent and parent.reply_to)
             if not parent:
                 return Response(
                     json.dumps({"error": "Parent comment not found"}),
                     status=404,
                 )
 
-            if parent.reply_to:
+            if is_reply:
                 return Response(
                     json.dumps(
                         {
@@ -75,7 +115,29 @@ class CommentList(Resource):
                     status=400,
                 )
 
-            comment.reply_to.connect(parent)
+        with write_transaction():
+            comment: Comment = Comment(text=text).save()
+            comment.created_by.connect(current_user)
+            if post:
+                comment.on_post.connect(post)
+            if parent:
+                comment.reply_to.connect(parent)
+
+        if post:
+            cache.invalidate(f"comments:{post_uuid}", f"post:{post_uuid}")
+            notifications.notify(
+                "comment", current_user.uuid, post_uuid, post_uuid
+            )
+            broker.publish(
+                "post.comments",
+                {"uuid": post_uuid, "delta": 1, "comment_uuid": comment.uuid},
+                f"post:{post_uuid}",
+            )
+        else:
+            cache.invalidate(
+                f"replies:{comment_uuid}", f"comment:{comment_uuid}"
+            )
+            notifications.notify("reply", current_user.uuid, comment_uuid)
 
         return Response(
             json.dumps(
@@ -102,61 +164,80 @@ class CommentList(Resource):
 class CommentDetail(Resource):
     @jwt_guard
     def get(self, comment_uuid):
-        comment: Comment = Comment.nodes.get_or_none(uuid=comment_uuid)
-        if not comment:
+        stamp = Comment.get_version_stamp(comment_uuid, get_jwt_identity())
+        if stamp is None:
             return Response(
                 json.dumps({"error": "Comment not found"}), status=404
             )
 
-        user = comment.created_by.all()[0]
-        parent = comment.reply_to.all()
-        on_post = comment.on_post.all()
-
-        parent_info = None
-        if parent:
-            parent = parent[0]
-            parent_info = {"uuid": parent.uuid, "text": parent.text}
+        etag = make_etag(stamp)
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        post_info = None
-        if on_post:
-            post = on_post[0]
-            post_info = {"uuid": post.uuid, "text": post.text}
+        current_user: User = User.find_by_email(get_jwt_identity())
+        comment = Comment.find_by_uuid(
+            comment_uuid, current_user.uuid, version=etag
+        )
+        if not comment:
+            return Response(
+                json.dumps({"error": "Comment not found"}), status=404
+            )
 
-        likes_count = comment.get_likes_count()
-        return Response(
+        user = comment._creator
+        response = Response(
             json.dumps(
                 {
                     "uuid": comment.uuid,
                     "text": comment.text,
                     "created_at": str(comment.created_at),
                     "created_by": {
-                        "uuid": user.uuid,
-                        "name": f"{user.first_name} {user.last_name}",
-                        "profile_image": user.profile_image,
+                        "uuid": user["uuid"],
+                        "name": f"{user['first_name']} {user['last_name']}",
+                        "profile_image": user["profile_image"],
                     },
-                    "parent_comment": parent_info,
-                    "post": post_info,
-                    "likes_count": likes_count,
+                    "parent_comment": comment._parent,
+                    "post": comment._post,
+                    "likes_count": comment._likes_count,
+                    "replies_count": comment._replies_count,
+                    "liked": comment._liked,
                 }
             ),
             status=200,
         )
+        return with_etag(response, etag)
 
     @jwt_guard
     def delete(self, comment_uuid):
         user = User.find_by_email(get_jwt_identity())
-        comment = Comment.nodes.get_or_none(uuid=comment_uuid)
-        if not comment:
-            return Response(
-                json.dumps({"error": "Comment not found"}), status=404
-            )
+        with write_transaction():
+            comment = Comment.get_visible(comment_uuid)
+            if not comment:
+                return Response(
+                    json.dumps({"error": "Comment not found"}), status=404
+                )
 
-        if not comment.created_by.is_connected(user):
-            return Response(
-                json.dumps({"error": "Not authorized"}), status=403
-            )
+            if not comment.created_by.is_connected(user):
+                return Response(
+                    json.dumps({"error": "Not authorized"}), status=403
+                )
 
-        comment.delete()
+            tags = [f"comment:{comment_uuid}", f"replies:{comment_uuid}"]
+            post_uuids = [post.uuid for post in comment.on_post.all()]
+            for post_uuid in post_uuids:
+                tags += [f"comments:{post_uuid}", f"post:{post_uuid}"]
+            for parent in comment.reply_to.all():
+                tags += [f"replies:{parent.uuid}", f"comment:{parent.uuid}"]
+
+            Comment.mark_deleted(comment_uuid)
+        purger.wake()
+        cache.invalidate(*tags)
+        for post_uuid in post_uuids:
+            broker.publish(
+                "post.comments",
+                {"uuid": post_uuid, "delta": -1, "comment_uuid": comment_uuid},
+                f"post:{post_uuid}",
+            )
         return Response(json.dumps({"message": "Comment deleted"}), status=200)
 
 
@@ -165,51 +246,66 @@ class CommentDetail(Resource):
     params={
         "page": "Page number (default 1)",
         "page_size": "Number of replies per page (default 10)",
+        "fields": "Comma-separated fields to return (uuid is always included)",
+        "cursor": (
+            "replies_cursor of a comment or next_cursor of a previous page:"
+            " the replies after it. Replaces page."
+        ),
     }
 )
 class CommentReplies(Resource):
     @jwt_guard
     def get(self, comment_uuid):
-        comment: Comment = Comment.nodes.get_or_none(uuid=comment_uuid)
-        if not comment:
+        if not Comment.is_visible(comment_uuid):
             return Response(
                 json.dumps({"error": "Comment not found"}), status=404
             )
 
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"), REPLY_CARD_FIELDS
+            )
+            cursor = request.args.get("cursor")
+            cursor = parse_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return Response(json.dumps({"error": str(e)}), status=400)
+
         current_user: User = User.find_by_email(get_jwt_identity())
 
-        replies = comment.get_replies(
+        replies = Comment.get_replies(
+            comment_uuid,
             current_user_uuid=current_user.uuid,
             page=page,
             page_size=page_size,
+            fields=fields,
+            after=cursor,
         )
-
-        replies_list = []
-        for reply in replies["results"]:
-            creator = reply._creator
-            replies_list.append(
-                {
-                    "uuid": reply.uuid,
-                    "text": reply.text,
-                    "created_at": str(reply.created_at),
-                    "likes_count": getattr(reply, "_likes_count", 0),
-                    "liked": getattr(reply, "_liked", False),
-                    "created_by": {
-                        "uuid": creator["uuid"],
-                        "name": f"{creator['first_name']} {creator['last_name']}",
-                        "profile_image": creator.get("profile_image"),
-                        "title": creator.get("title"),
-                    },
-                }
+        if cursor is not None:
+            next_cursor = replies["next_cursor"]
+            return Response(
+                json.dumps(
+                    {
+                        "results": [
+                            comment_card_to_dict(reply, fields)
+                            for reply in replies["results"]
+                        ],
+                        "next_cursor": (
+                            None if next_cursor is None else str(next_cursor)
+                        ),
+                    }
+                ),
+                status=200,
             )
 
         response = {
             "page": page,
             "page_size": page_size,
             "total": replies["total"],
-            "results": replies_list,
+            "results": [
+                comment_card_to_dict(reply, fields)
+                for reply in replies["results"]
+            ],
         }
 
         return Response(json.dumps(response), status=200)
@@ -218,36 +314,48 @@ class CommentReplies(Resource):
 @comment_nc.route("/<comment_uuid>/like")
 class CommentLike(Resource):
     @jwt_guard
+    @idempotent
     def post(self, comment_uuid):
         user = User.find_by_email(get_jwt_identity())
-        comment = Comment.nodes.get_or_none(uuid=comment_uuid)
-        if not comment:
+        if not Comment.is_visible(comment_uuid):
             return Response(
                 json.dumps({"error": "Comment not found"}), status=404
             )
 
-        if user.likes_comment.is_connected(comment):
-            user.likes_comment.disconnect(comment)
+        created = Comment.like(comment_uuid, user.uuid)
+        if created is None:
             return Response(
-                json.dumps({"message": "Comment unliked"}), status=200
+                json.dumps({"error": "Comment not found"}), status=404
             )
-        else:
-            user.likes_comment.connect(comment)
+        if not created:
             return Response(
-                json.dumps({"message": "Comment liked"}), status=201
+                json.dumps({"message": "You have already liked this comment"}),
+                status=200,
             )
+        liked_cache.record(user.uuid, comment_uuid, True)
+        cache.invalidate(f"comment:{comment_uuid}")
+        notifications.notify("comment_like", user.uuid, comment_uuid)
+        return Response(json.dumps({"message": "Comment liked"}), status=201)
 
     @jwt_guard
     def delete(self, comment_uuid):
         """Unlike a comment"""
         user = User.find_by_email(get_jwt_identity())
-        comment = Comment.nodes.get_or_none(uuid=comment_uuid)
-        if not comment:
+        if not Comment.is_visible(comment_uuid):
             return Response(
                 json.dumps({"error": "Comment not found"}), status=404
             )
 
-        if user.likes_comment.is_connected(comment):
-            user.likes_comment.disconnect(comment)
-
+        removed = Comment.unlike(comment_uuid, user.uuid)
+        if removed is None:
+            return Response(
+                json.dumps({"error": "Comment not found"}), status=404
+            )
+        if not removed:
+            return Response(
+                json.dumps({"message": "You haven't liked this comment yet"}),
+                status=200,
+            )
+        liked_cache.record(user.uuid, comment_uuid, False)
+        cache.invalidate(f"comment:{comment_uuid}")
         return Response(json.dumps({"message": "Comment unliked"}), status=200)
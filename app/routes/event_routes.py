@@ -0,0 +1,65 @@
+from flask import Response, current_app, json, request
+from flask_jwt_extended import get_jwt_identity
+from flask_restx import Namespace, Resource
+
+from app.events import TooManySubscribers, broker
+from app.models.user import User
+from app.permissions import jwt_guard
+
+events_nc = Namespace("events", description="Server-sent event stream")
+
+
+@events_nc.route("")
+@events_nc.doc(
+    description=(
+        "text/event-stream of post.created events from followed creators"
+        " and post.likes / post.comments count deltas for watched posts."
+        " A resync event means events were dropped and should be refetched."
+    ),
+    params={"posts": "Comma-separated UUIDs of the posts on screen"},
+    responses={
+        200: "Event stream",
+        400: "Too many watched posts",
+        503: "Stream limit reached on this worker",
+    },
+)
+class EventStream(Resource):
+    @jwt_guard
+    def get(self):
+        user: User = User.find_by_email(get_jwt_identity())
+        post_uuids = {
+            post_uuid.strip()
+            for post_uuid in request.args.get("posts", "").split(",")
+            if post_uuid.strip()
+        }
+        max_posts = current_app.config.get("EVENTS_MAX_WATCHED_POSTS", 50)
+        if len(post_uuids) > max_posts:
+            return Response(
+                json.dumps(
+                    {"error": f"At most {max_posts} posts can be watched"}
+                ),
+                status=400,
+            )
+
+        topics = [f"author:{uuid}" for uuid in user.get_following_uuids()]
+        topics += [f"post:{uuid}" for uuid in post_uuids]
+        try:
+            subscription = broker.subscribe(topics)
+        except TooManySubscribers as e:
+            return Response(
+                json.dumps({"error": str(e)}),
+                status=503,
+                headers={"Retry-After": str(broker.heartbeat)},
+            )
+
+        response = Response(
+            broker.stream(subscription),
+            status=200,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # The stream's own cleanup only runs once it has been iterated; a
+        # client gone before the first chunk, or a HEAD request, must still
+        # give its slot back.
+        response.call_on_close(lambda: broker.unsubscribe(subscription))
+        return response
@@ -0,0 +1,88 @@
+from flask import Response, json, request
+from flask_jwt_extended import get_jwt_identity
+from flask_restx import Namespace, Resource, fields
+
+from app.models.notification import Notification, notification_to_dict
+from app.models.user import User
+from app.pagination import pagination_args, parse_cursor
+from app.permissions import jwt_guard
+
+notifications_nc = Namespace(
+    "notifications", description="Activity on the user's content"
+)
+
+mark_read_model = notifications_nc.model(
+    "MarkNotificationsRead",
+    {"uuids": fields.List(fields.String, required=False)},
+)
+
+
+@notifications_nc.route("")
+@notifications_nc.doc(
+    description=(
+        "Likes, comments, replies and follows, newest activity first."
+        " Repeated activity on one target is one entry with a count while"
+        " it is unread."
+    ),
+    params={
+        "cursor": "next_cursor of the previous page (omit for the newest)",
+        "page_size": "Number of notifications per page (default 20)",
+    },
+)
+class NotificationList(Resource):
+    @jwt_guard
+    def get(self):
+        user: User = User.find_by_email(get_jwt_identity())
+        _, page_size = pagination_args(default_page_size=20)
+        try:
+            cursor = request.args.get("cursor")
+            cursor = parse_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return Response(json.dumps({"error": str(e)}), status=400)
+
+        results, next_cursor = Notification.get_page(
+            user.uuid, before=cursor, limit=page_size
+        )
+        return Response(
+            json.dumps(
+                {
+                    "unread_count": Notification.get_unread_count(user.uuid),
+                    "results": [notification_to_dict(n) for n in results],
+                    "next_cursor": (
+                        None if next_cursor is None else str(next_cursor)
+                    ),
+                }
+            ),
+            status=200,
+        )
+
+
+@notifications_nc.route("/unread-count")
+class UnreadCount(Resource):
+    @jwt_guard
+    def get(self):
+        user: User = User.find_by_email(get_jwt_identity())
+        return Response(
+            json.dumps(
+                {"unread_count": Notification.get_unread_count(user.uuid)}
+            ),
+            status=200,
+        )
+
+
+@notifications_nc.route("/read")
+class MarkRead(Resource):
+    @jwt_guard
+    @notifications_nc.expect(mark_read_model)
+    def post(self):
+        """Mark the given notifications, or all of them, read"""
+        user: User = User.find_by_email(get_jwt_identity())
+        data = request.get_json(silent=True) or {}
+        uuids = data.get("uuids")
+        if uuids is not None and not isinstance(uuids, list):
+            return Response(
+                json.dumps({"error": "'uuids' must be a list"}), status=400
+            )
+
+        marked = Notification.mark_read(user.uuid, uuids)
+        return Response(json.dumps({"marked": marked}), status=200)
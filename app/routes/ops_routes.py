@@ -0,0 +1,32 @@
+from flask import Response, json
+from flask_restx import Namespace, Resource
+
+from app.cache import cache
+from app.permissions import jwt_guard
+from app.purge import purger
+
+ops_nc = Namespace("ops", description="Operational endpoints")
+
+
+@ops_nc.route("/cache")
+class CacheStats(Resource):
+    @jwt_guard
+    @ops_nc.doc(
+        description="Result cache hit ratio and staleness of served entries",
+        responses={200: "Cache statistics for this worker"},
+    )
+    def get(self):
+        """Get result cache statistics"""
+        return Response(json.dumps(cache.stats()), status=200)
+
+
+@ops_nc.route("/purge")
+class PurgeProgress(Resource):
+    @jwt_guard
+    @ops_nc.doc(
+        description="Progress and throughput of the deleted content purge",
+        responses={200: "Purge statistics for this worker"},
+    )
+    def get(self):
+        """Get purge progress"""
+        return Response(json.dumps(purger.progress()), status=200)
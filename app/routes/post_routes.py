@@ -4,9 +4,30 @@ from flask import Response, json, request
 from flask_jwt_extended import get_jwt_identity
 from flask_restx import Namespace, Resource, fields
 
-from app.models.post import Post
+from app.cache import cache
+from app.conditional import make_etag, not_modified, with_etag
+from app.db import write_transaction
+from app.events import broker
+from app.explore import explore
+from app.fields import parse_fields
+from app.idempotency import idempotent
+from app.like_buffer import like_buffer
+from app.liked_cache import liked_cache
+from app.models.comment import COMMENT_CARD_FIELDS
+from app.models.post import POST_CARD_FIELDS, Post
 from app.models.user import User
+from app.notifications import notifications
+from app.pagination import (
+    format_post_cursor,
+    pagination_args,
+    parse_post_cursor,
+    parse_since,
+)
 from app.permissions import jwt_guard
+from app.purge import purger
+from app.repository import repository
+from app.routes.comment_routes import comment_card_to_dict
+from app.trending import trending
 
 post_nc = Namespace("posts", description="Post-related operations")
 
@@ -42,14 +63,89 @@ paginated_posts_model = post_nc.model(
     },
 )
 
+POST_LIST_FIELDS = tuple(f for f in POST_CARD_FIELDS if f != "updated_at")
+MAX_INCLUDED_REPLIES = 10
+FIELDS_PARAM = "Comma-separated fields to return (uuid is always included)"
+
+
+def post_card_to_dict(post, fields):
+    card = {}
+    for field in fields:
+        if field == "created_by":
+            creator = post._creator
+            card["created_by"] = {
+                "uuid": creator["uuid"],
+                "name": f"{creator['first_name']} {creator['last_name']}",
+                "profile_image": creator.get("profile_image"),
+                "title": creator.get("title"),
+            }
+        elif field in ("created_at", "updated_at"):
+            card[field] = str(getattr(post, field))
+        elif field == "liked":
+            card["liked"] = getattr(post, "_liked", False)
+        elif field in ("comments_count", "likes_count"):
+            card[field] = getattr(post, f"_{field}", 0)
+        elif field == "priority":
+            card["priority"] = round(getattr(post, "_priority", 0), 2)
+        elif field == "score":
+            card["score"] = round(getattr(post, "_score", 0), 2)
+        else:
+            card[field] = getattr(post, field)
+    return card
+
+
+def paginated_posts_response(data, fields, **kwargs):
+    return Response(
+        json.dumps(
+            {
+                "page": data["page"],
+                "page_size": data["page_size"],
+                "total": data["total"],
+                "results": [
+                    post_card_to_dict(post, fields) for post in data["results"]
+                ],
+            }
+        ),
+        status=200,
+        **kwargs,
+    )
+
+
+SINCE_PARAM = (
+    "Only return posts after this watermark (from a previous response)"
+    " or time (epoch seconds or an ISO 8601 timestamp). Replaces page."
+)
+
+
+def posts_since_response(data, fields, since):
+    """``since`` is the raw parameter, kept as watermark on an empty page."""
+    return Response(
+        json.dumps(
+            {
+                "since": since,
+                "watermark": format_post_cursor(data["watermark"]) or since,
+                "has_more": data["has_more"],
+                "results": [
+                    post_card_to_dict(post, fields) for post in data["results"]
+                ],
+            }
+        ),
+        status=200,
+    )
+
+
+def fields_error(error):
+    return Response(json.dumps({"error": str(error)}), status=400)
+
 
 @post_nc.route("")
 class PostList(Resource):
     @jwt_guard
+    @idempotent
     @post_nc.expect(post_model)
     def post(self):
         """Create a new post"""
-        user: User = User.find_by_email(get_jwt_identity())
+        user: User = repository.find_user_by_email(get_jwt_identity())
         data = request.get_json()
         text = data.get("text", "")
         images = data.get("images", [])
@@ -60,9 +156,18 @@ class PostList(Resource):
                 status=400,
             )
 
-        new_post = Post(text=text, images=images)
-        new_post.save()
-        relation = new_post.created_by.connect(user)
+        new_post = repository.create_post(user, text, images)
+        cache.invalidate(f"posts:{user.uuid}")
+        explore.add(new_post, user)
+        broker.publish(
+            "post.created",
+            {
+                "uuid": new_post.uuid,
+                "creator_uuid": user.uuid,
+                "created_at": new_post.created_at.timestamp(),
+            },
+            f"author:{user.uuid}",
+        )
         response = json.dumps(
             {
                 "uuid": new_post.uuid,
@@ -89,8 +194,21 @@ class PostList(Resource):
 class PostDetail(Resource):
     @jwt_guard
     def get(self, post_uuid):
+        stamp = Post.get_version_stamp(post_uuid, get_jwt_identity())
+        if stamp is None:
+            return Response(
+                json.dumps({"error": "Post not found"}), status=404
+            )
+
+        etag = make_etag(stamp)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
         current_user = User.find_by_email(get_jwt_identity())
-        post: Post = Post.find_by_uuid(post_uuid, current_user.uuid)
+        post: Post = Post.find_by_uuid(
+            post_uuid, current_user.uuid, version=etag
+        )
         if not post:
             return Response(
                 json.dumps({"error": "Post not found"}), status=404
@@ -104,18 +222,18 @@ class PostDetail(Resource):
             "created_at": post.created_at,
             "updated_at": post.updated_at,
             "created_by": {
-                "uuid": creator.uuid,
-                "name": f"{creator.first_name} {creator.last_name}",
-                "profile_image": creator.profile_image,
-                "title": creator.title,
+                "uuid": creator["uuid"],
+                "name": f"{creator['first_name']} {creator['last_name']}",
+                "profile_image": creator["profile_image"],
+                "title": creator["title"],
             }
             if creator
             else None,
-            "comments_count": getattr(post, "comments_count", 0),
-            "likes_count": getattr(post, "likes_count", 0),
-            "liked": getattr(post, "liked", False),
+            "comments_count": getattr(post, "_comments_count", 0),
+            "likes_count": getattr(post, "_likes_count", 0),
+            "liked": getattr(post, "_liked", False),
         }
-        return Response(json.dumps(post_data), status=200)
+        return with_etag(Response(json.dumps(post_data), status=200), etag)
 
     @jwt_guard
     @post_nc.expect(post_model)
@@ -127,7 +245,7 @@ class PostDetail(Resource):
                 json.dumps({"error": "Post not found"}), status=404
             )
 
-        if current_user.uuid != (post.created_by.all()[0]).uuid:
+        if current_user.uuid != post._creator["uuid"]:
             return Response(json.dumps({"error": "Not allowed"}), status=403)
 
         data = request.get_json()
@@ -142,13 +260,18 @@ class PostDetail(Resource):
                 status=400,
             )
 
-        if new_text is not None:
-            post.text = new_text
-        if new_images is not None:
-            post.images = new_images
-
-        post.updated_at = datetime.utcnow()
-        post.save()
+        with write_transaction():
+            # Mutate a fresh node, the looked-up one may be a shared
+            # cache entry.
+            post = Post.nodes.get(uuid=post_uuid)
+            if new_text is not None:
+                post.text = new_text
+            if new_images is not None:
+                post.images = new_images
+            post.updated_at = datetime.utcnow()
+            post.save()
+        cache.invalidate(f"post:{post_uuid}")
+        explore.update(post)
 
         updated_post: Post = Post.find_by_uuid(post_uuid, current_user.uuid)
         if not updated_post:
@@ -193,10 +316,19 @@ class PostDetail(Resource):
                 json.dumps({"error": "Post not found"}), status=404
             )
 
-        if current_user.uuid != (post.created_by.all()[0]).uuid:
+        if current_user.uuid != post._creator["uuid"]:
             return Response(json.dumps({"error": "Not allowed"}), status=403)
 
-        post.delete()
+        Post.mark_deleted(post_uuid)
+        purger.wake()
+        cache.invalidate(
+            f"post:{post_uuid}",
+            f"posts:{current_user.uuid}",
+            f"comments:{post_uuid}",
+        )
+        broker.publish(
+            "post.deleted", {"uuid": post_uuid}, f"post:{post_uuid}"
+        )
         return Response(
             json.dumps({"message": "Post deleted successfully"}), status=200
         )
@@ -207,55 +339,55 @@ class PostDetail(Resource):
     params={
         "page": "Page number (default 1)",
         "page_size": "Number of comments per page (default 10)",
+        "fields": FIELDS_PARAM,
+        "include_replies": (
+            "Embed the first N replies of every comment, with a"
+            f" replies_cursor for the rest (max {MAX_INCLUDED_REPLIES})"
+        ),
     }
 )
 class PostComments(Resource):
     @jwt_guard
     def get(self, post_uuid):
-        current_user: User = User.find_by_email(get_jwt_identity())
-        post = Post.find_by_uuid(post_uuid, current_user.uuid)
+        current_user: User = repository.find_user_by_email(
+            get_jwt_identity()
+        )
+        post = repository.find_post(post_uuid, current_user.uuid)
         if not post:
             return Response(
                 json.dumps({"error": "Post not found"}), status=404
             )
 
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
-
-        from app.models.comment import Comment
-
-        data = Comment.get_comments(
-            post_uuid=post_uuid,
-            current_user_uuid=current_user.uuid,
-            page=page,
-            page_size=page_size,
-        )
-
-        comments_list = []
-        for comment in data["results"]:
-            creator = comment._creator
-            comments_list.append(
-                {
-                    "uuid": comment.uuid,
-                    "text": comment.text,
-                    "created_at": str(comment.created_at),
-                    "likes_count": getattr(comment, "_likes_count", 0),
-                    "replies_count": getattr(comment, "_replies_count", 0),
-                    "liked": getattr(comment, "_liked", False),
-                    "created_by": {
-                        "uuid": creator["uuid"],
-                        "name": f"{creator['first_name']} {creator['last_name']}",
-                        "profile_image": creator.get("profile_image"),
-                        "title": creator.get("title"),
-                    },
-                }
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"), COMMENT_CARD_FIELDS
             )
+        except ValueError as e:
+            return fields_error(e)
+        try:
+            include_replies = int(request.args.get("include_replies", 0))
+        except ValueError:
+            include_replies = 0
+        include_replies = min(max(include_replies, 0), MAX_INCLUDED_REPLIES)
+
+        data = repository.get_comments(
+            post_uuid,
+            current_user.uuid,
+            page,
+            page_size,
+            fields=fields,
+            include_replies=include_replies,
+        )
 
         response = {
             "page": page,
             "page_size": page_size,
             "total": data["total"],
-            "results": comments_list,
+            "results": [
+                comment_card_to_dict(comment, fields)
+                for comment in data["results"]
+            ],
         }
 
         return Response(json.dumps(response), status=200)
@@ -264,43 +396,67 @@ class PostComments(Resource):
 @post_nc.route("/<post_uuid>/like")
 class PostLike(Resource):
     @jwt_guard
+    @idempotent
     def post(self, post_uuid):
-        current_user: User = User.find_by_email(get_jwt_identity())
-        post = Post.find_by_uuid(post_uuid, current_user.uuid)
-        if not post:
+        current_user: User = repository.find_user_by_email(
+            get_jwt_identity()
+        )
+        if like_buffer.enabled:
+            # Recorded in the liked cache when the buffer flushes.
+            liked = like_buffer.set_like(current_user.uuid, post_uuid, True)
+        else:
+            liked = repository.like_post(current_user, post_uuid)
+            if liked:
+                cache.invalidate(f"post:{post_uuid}")
+                liked_cache.record(current_user.uuid, post_uuid, True)
+
+        if liked is None:
             return Response(
                 json.dumps({"error": "Post not found."}), status=404
             )
-
-        if current_user.likes.is_connected(post):
+        if not liked:
             return Response(
                 json.dumps({"message": "You have already liked this post."}),
                 status=200,
             )
-        else:
-            current_user.likes.connect(post)
-            return Response(
-                json.dumps({"message": "Post liked successfully."}), status=201
-            )
+
+        notifications.notify(
+            "post_like", current_user.uuid, post_uuid, post_uuid
+        )
+        broker.publish(
+            "post.likes", {"uuid": post_uuid, "delta": 1}, f"post:{post_uuid}"
+        )
+        return Response(
+            json.dumps({"message": "Post liked successfully."}), status=201
+        )
 
     @jwt_guard
     def delete(self, post_uuid):
         """Unlike a post"""
-        current_user: User = User.find_by_email(get_jwt_identity())
-        post = Post.find_by_uuid(post_uuid, current_user.uuid)
-        if not post:
+        current_user: User = repository.find_user_by_email(
+            get_jwt_identity()
+        )
+        if like_buffer.enabled:
+            unliked = like_buffer.set_like(current_user.uuid, post_uuid, False)
+        else:
+            unliked = repository.unlike_post(current_user, post_uuid)
+            if unliked:
+                cache.invalidate(f"post:{post_uuid}")
+                liked_cache.record(current_user.uuid, post_uuid, False)
+
+        if unliked is None:
             return Response(
                 json.dumps({"error": "Post not found."}), status=404
             )
-
-        if not current_user.likes.is_connected(post):
+        if not unliked:
             return Response(
                 json.dumps({"message": "You haven't liked this post yet."}),
                 status=200,
             )
 
-        if current_user.likes.is_connected(post):
-            current_user.likes.disconnect(post)
+        broker.publish(
+            "post.likes", {"uuid": post_uuid, "delta": -1}, f"post:{post_uuid}"
+        )
 
         return Response(
             json.dumps({"message": "Post unliked successfully."}), status=200
@@ -312,6 +468,7 @@ class PostLike(Resource):
     params={
         "page": "Page number (default 1)",
         "page_size": "Number of comments per page (default 10)",
+        "fields": FIELDS_PARAM,
     },
     responses={
         200: ("Success", paginated_posts_model),
@@ -321,89 +478,61 @@ class PostLike(Resource):
 class MyPosts(Resource):
     @jwt_guard
     def get(self):
-        user = User.find_by_email(get_jwt_identity())
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
-
-        data = User.get_user_posts(user.uuid, user.uuid, page, page_size)
-
-        posts_list = []
-        for post in data["results"]:
-            creator = post._creator
-            posts_list.append(
-                {
-                    "uuid": post.uuid,
-                    "text": post.text,
-                    "images": post.images,
-                    "created_at": str(post.created_at),
-                    "created_by": {
-                        "uuid": creator["uuid"],
-                        "name": f"{creator['first_name']} {creator['last_name']}",
-                        "profile_image": creator.get("profile_image"),
-                        "title": creator.get("title"),
-                    },
-                    "comments_count": getattr(post, "_comments_count", 0),
-                    "likes_count": getattr(post, "_likes_count", 0),
-                    "liked": getattr(post, "_liked", False),
-                }
+        user = repository.find_user_by_email(get_jwt_identity())
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"), POST_CARD_FIELDS, POST_LIST_FIELDS
             )
+        except ValueError as e:
+            return fields_error(e)
 
-        return Response(
-            json.dumps(
-                {
-                    "page": data["page"],
-                    "page_size": data["page_size"],
-                    "total": data["total"],
-                    "results": posts_list,
-                }
-            ),
-            status=200,
+        data = repository.get_user_posts(
+            user.uuid, user.uuid, page, page_size, fields=fields
         )
+        return paginated_posts_response(data, fields)
 
 
 @post_nc.route("/following-posts")
+@post_nc.doc(
+    description=(
+        "Your posts and those of the users you follow, newest first. Posts"
+        " a user made before you followed them are limited to their latest"
+        " TIMELINE_BACKFILL (see the config)."
+    ),
+    params={
+        "page": "Page number (default 1)",
+        "page_size": "Number of posts per page (default 10)",
+        "fields": FIELDS_PARAM,
+        "since": SINCE_PARAM,
+    }
+)
 class FollowingPosts(Resource):
     @jwt_guard
     def get(self):
-        user: User = User.find_by_email(get_jwt_identity())
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
-
-        data = user.get_posts_from_following(page=page, page_size=page_size)
-        posts: list[Post] = data["results"]
-
-        posts_list = []
-        for post in posts:
-            creator = post._creator
-            posts_list.append(
-                {
-                    "uuid": post.uuid,
-                    "text": post.text,
-                    "images": post.images,
-                    "created_at": str(post.created_at),
-                    "created_by": {
-                        "uuid": creator["uuid"],
-                        "name": f"{creator['first_name']} {creator['last_name']}",
-                        "profile_image": creator.get("profile_image"),
-                        "title": creator.get("title"),
-                    },
-                    "comments_count": getattr(post, "_comments_count", 0),
-                    "likes_count": getattr(post, "_likes_count", 0),
-                    "liked": getattr(post, "_liked", False),
-                }
+        user: User = repository.find_user_by_email(get_jwt_identity())
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"), POST_CARD_FIELDS, POST_LIST_FIELDS
             )
+        except ValueError as e:
+            return fields_error(e)
+
+        if "since" in request.args:
+            try:
+                since = parse_since(request.args["since"])
+            except ValueError as e:
+                return fields_error(e)
+            data = user.get_posts_from_following_since(
+                since, limit=page_size, fields=fields
+            )
+            return posts_since_response(data, fields, request.args["since"])
 
-        return Response(
-            json.dumps(
-                {
-                    "page": data["page"],
-                    "page_size": data["page_size"],
-                    "total": data["total"],
-                    "results": posts_list,
-                }
-            ),
-            status=200,
+        data = repository.get_following_posts(
+            user, page=page, page_size=page_size, fields=fields
         )
+        return paginated_posts_response(data, fields)
 
 
 @post_nc.route("/suggested")
@@ -416,6 +545,7 @@ class FollowingPosts(Resource):
     params={
         "page": "Page number for pagination (default: 1)",
         "page_size": "Number of items per page (default: 10)",
+        "fields": FIELDS_PARAM,
     },
 )
 class Suggested(Resource):
@@ -423,89 +553,148 @@ class Suggested(Resource):
     def get(self):
         user = User.find_by_email(get_jwt_identity())
 
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(request.args.get("fields"), POST_CARD_FIELDS)
+        except ValueError as e:
+            return fields_error(e)
 
         data = user.get_posts_from_second_degree_connections(
-            page=page, page_size=page_size
+            page=page, page_size=page_size, fields=fields
         )
-
-        posts_list = []
-        for post in data["results"]:
-            creator = post._creator
-            posts_list.append(
-                {
-                    "uuid": post.uuid,
-                    "text": post.text,
-                    "images": post.images,
-                    "created_at": str(post.created_at),
-                    "updated_at": str(post.updated_at),
-                    "created_by": {
-                        "uuid": creator["uuid"],
-                        "name": f"{creator['first_name']} {creator['last_name']}",
-                        "profile_image": creator.get("profile_image"),
-                        "title": creator.get("title"),
-                    },
-                    "comments_count": getattr(post, "_comments_count", 0),
-                    "likes_count": getattr(post, "_likes_count", 0),
-                    "liked": getattr(post, "_liked", False),
-                }
-            )
-
-        return Response(
-            json.dumps(
-                {
-                    "page": data["page"],
-                    "page_size": data["page_size"],
-                    "total": data["total"],
-                    "results": posts_list,
-                }
-            ),
-            status=200,
-            mimetype="application/json",
+        return paginated_posts_response(
+            data, fields, mimetype="application/json"
         )
 
 
 @post_nc.route("/feed")
+@post_nc.doc(
+    params={
+        "page": "Page number (default 1)",
+        "page_size": "Number of posts per page (default 10)",
+        "fields": FIELDS_PARAM,
+        "since": SINCE_PARAM,
+    }
+)
 class Feed(Resource):
     @jwt_guard
     def get(self):
-        user: User = User.find_by_email(get_jwt_identity())
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        user: User = repository.find_user_by_email(get_jwt_identity())
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"),
+                POST_CARD_FIELDS + ("priority",),
+                POST_LIST_FIELDS + ("priority",),
+            )
+        except ValueError as e:
+            return fields_error(e)
+
+        if "since" in request.args:
+            try:
+                since = parse_since(request.args["since"])
+            except ValueError as e:
+                return fields_error(e)
+            data = user.get_feed_since(since, limit=page_size, fields=fields)
+            return posts_since_response(data, fields, request.args["since"])
+
+        data = repository.get_feed(
+            user, page=page, page_size=page_size, fields=fields
+        )
+        return paginated_posts_response(data, fields)
+
 
-        data = user.get_feed(page=page, page_size=page_size)
-        posts: list[Post] = data["results"]
+@post_nc.route("/trending")
+@post_nc.doc(
+    description=(
+        "Posts ranked by recent likes and comments, decayed over time."
+        " Served from an in-memory ranking of the top posts. total counts"
+        " the ranked posts; ranked posts found deleted are dropped from"
+        " the ranking."
+    ),
+    params={
+        "page": "Page number (default 1)",
+        "page_size": "Number of posts per page (default 10)",
+        "fields": FIELDS_PARAM,
+    },
+)
+class Trending(Resource):
+    @jwt_guard
+    def get(self):
+        user: User = repository.find_user_by_email(get_jwt_identity())
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"),
+                POST_CARD_FIELDS + ("score",),
+                POST_LIST_FIELDS + ("score",),
+            )
+        except ValueError as e:
+            return fields_error(e)
 
-        posts_list = []
+        ranked = trending.top()
+        skip = (page - 1) * page_size
+        scores = dict(ranked[skip : skip + page_size])
+        posts = Post.find_cards(list(scores), user.uuid, fields=fields)
         for post in posts:
-            creator = post._creator
-            posts_list.append(
-                {
-                    "uuid": post.uuid,
-                    "text": post.text,
-                    "images": post.images,
-                    "created_at": str(post.created_at),
-                    "created_by": {
-                        "uuid": creator["uuid"],
-                        "name": f"{creator['first_name']} {creator['last_name']}",
-                        "profile_image": creator.get("profile_image"),
-                        "title": creator.get("title"),
-                    },
-                    "comments_count": getattr(post, "_comments_count", 0),
-                    "likes_count": getattr(post, "_likes_count", 0),
-                    "liked": getattr(post, "_liked", False),
-                    "priority": round(getattr(post, "_priority", 0), 2),
-                }
+            post._score = scores.pop(post.uuid)
+        # Left over: deleted, possibly through another worker, whose
+        # scorer got the event.
+        for post_uuid in scores:
+            trending.remove(post_uuid)
+
+        data = {
+            "page": page,
+            "page_size": page_size,
+            "total": len(ranked) - len(scores),
+            "results": posts,
+        }
+        return paginated_posts_response(data, fields)
+
+
+@post_nc.route("/explore")
+@post_nc.doc(
+    description=(
+        "Latest posts across the network, newest first. Cards limited to"
+        " uuid, text, images, created_at, updated_at and created_by are"
+        " served from memory; counts and liked are loaded for the page."
+        " The buffer is per worker and holds the latest"
+        " EXPLORE_BUFFER_SIZE posts it saw, so pages can differ slightly"
+        " between workers; cursors work on any worker."
+    ),
+    params={
+        "cursor": "next_cursor of the previous page (omit for the newest)",
+        "page_size": "Number of posts per page (default 10)",
+        "fields": FIELDS_PARAM,
+    },
+)
+class Explore(Resource):
+    @jwt_guard
+    def get(self):
+        _, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"), POST_CARD_FIELDS, POST_LIST_FIELDS
+            )
+            cursor = request.args.get("cursor")
+            cursor = parse_post_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return fields_error(e)
+
+        posts, next_cursor = explore.page(cursor, page_size)
+        if posts and {"comments_count", "likes_count", "liked"} & set(fields):
+            user = repository.find_user_by_email(get_jwt_identity())
+            posts = Post.find_cards(
+                [post.uuid for post in posts], user.uuid, fields=fields
             )
 
         return Response(
             json.dumps(
                 {
-                    "page": data["page"],
-                    "page_size": data["page_size"],
-                    "total": data["total"],
-                    "results": posts_list,
+                    "results": [
+                        post_card_to_dict(post, fields) for post in posts
+                    ],
+                    "next_cursor": format_post_cursor(next_cursor),
                 }
             ),
             status=200,
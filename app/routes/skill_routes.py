@@ -0,0 +1,35 @@
+from flask import Response, json, request
+from flask_restx import Namespace, Resource
+
+from app.permissions import jwt_guard
+from app.skills import skill_catalog
+
+skills_nc = Namespace("skills", description="Skill catalog")
+
+MAX_SKILL_SUGGESTIONS = 50
+
+
+@skills_nc.route("")
+@skills_nc.doc(
+    params={
+        "prefix": "Start of the skill name, case-insensitive",
+        "limit": (
+            "Suggestions to return"
+            f" (default 10, max {MAX_SKILL_SUGGESTIONS})"
+        ),
+    },
+    responses={200: "Matching skills, most used first"},
+)
+class SkillTypeahead(Resource):
+    @jwt_guard
+    def get(self):
+        """Suggest skills by name prefix"""
+        prefix = request.args.get("prefix", "")
+        try:
+            limit = int(request.args.get("limit", 10))
+        except ValueError:
+            limit = 10
+        limit = min(max(limit, 1), MAX_SKILL_SUGGESTIONS)
+
+        results = skill_catalog.search(prefix, limit) if prefix.strip() else []
+        return Response(json.dumps({"results": results}), status=200)
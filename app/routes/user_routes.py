@@ -1,4 +1,6 @@
-from flask import Response, json, request
+from datetime import datetime
+
+from flask import Response, current_app, json, request
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
@@ -7,12 +9,49 @@ from flask_jwt_extended import (
 from flask_restx import Namespace, Resource, fields
 from passlib.hash import pbkdf2_sha256
 
-from app.models.user import Skill, User, user_to_dict
+from app.cache import cache
+from app.conditional import make_etag, not_modified, with_etag
+from app.db import write_transaction
+from app.explore import explore
+from app.facets import facet_index
+from app.notifications import notifications
+from app.models.user import USER_CARD_FIELDS, Skill, User, user_to_dict
 from app.permissions import jwt_guard, jwt_refresh_guard
-from app.routes.post_routes import paginated_posts_model
+from app.fields import parse_fields
+from app.pagination import pagination_args
+from app.repository import repository
+from app.streaming import ndjson_response
+from app.timeline import timeline
+from app.typeahead import user_typeahead
+from app.models.post import POST_CARD_FIELDS
+from app.routes.post_routes import (
+    FIELDS_PARAM,
+    POST_LIST_FIELDS,
+    fields_error,
+    paginated_posts_model,
+    paginated_posts_response,
+    post_card_to_dict,
+)
 
 user_nc = Namespace("users", description="User-related operations")
 
+MAX_TYPEAHEAD_RESULTS = 20
+
+
+def follow_card_to_dict(user):
+    return {
+        "uuid": user.uuid,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "profile_image": user.profile_image,
+        "title": user.title,
+        "followers_count": user._followers_count,
+        "following_count": user._following_count,
+        "is_following": user._is_following,
+        "follows_me": user._follows_me,
+    }
+
 register_model = user_nc.model(
     "User",
     {
@@ -84,7 +123,12 @@ class UserRegistration(Resource):
             email=email,
             password=hashed_password,
         )
-        new_user.save()
+        with write_transaction():
+            new_user.save()
+        timeline.mark_built(new_user.uuid)
+        cache.invalidate("user_search")
+        facet_index.invalidate()
+        user_typeahead.update(new_user)
 
         access_token = create_access_token(identity=new_user.email)
         refresh_token = create_refresh_token(identity=new_user.email)
@@ -211,7 +255,13 @@ class UserMe(Resource):
             updated = True
 
         if updated:
-            current_user.save()
+            current_user.updated_at = datetime.utcnow()
+            with write_transaction():
+                current_user.save()
+            cache.invalidate(f"user:{current_user.uuid}", "user_search")
+            facet_index.invalidate()
+            user_typeahead.update(current_user)
+            explore.update_creator(current_user)
             return Response(
                 json.dumps(
                     {
@@ -244,15 +294,21 @@ class MeSkill(Resource):
                 json.dumps({"error": "Skill name is required"}), status=400
             )
 
-        skill = Skill.nodes.first_or_none(name=skill_name)
-        if skill:
-            return Response(
-                json.dumps({"error": f"Skill '{skill_name}' already exists"}),
-                status=400,
-            )
-
-        skill = Skill(name=skill_name).save()
-        current_user.skills.connect(skill)
+        skill = Skill.ensure(skill_name)
+        with write_transaction():
+            if current_user.skills.is_connected(skill):
+                return Response(
+                    json.dumps(
+                        {"error": f"Skill '{skill.name}' already added"}
+                    ),
+                    status=400,
+                )
+
+            current_user.skills.connect(skill)
+            current_user.updated_at = datetime.utcnow()
+            current_user.save()
+        cache.invalidate(f"user:{current_user.uuid}", "user_search")
+        facet_index.invalidate()
         return Response(
             json.dumps({"message": f"Skill '{skill_name}' added"}), status=200
         )
@@ -274,15 +330,23 @@ class MeSkill(Resource):
                 json.dumps({"error": "Skill name is required"}), status=400
             )
 
-        skill = Skill.nodes.first_or_none(name=skill_name)
-        if not skill:
-            return Response(
-                json.dumps({"error": f"Skill '{skill_name}' not found"}),
-                status=404,
-            )
-
-        if current_user.skills.is_connected(skill):
-            current_user.skills.disconnect(skill)
+        with write_transaction():
+            skill = Skill.find_by_name(skill_name)
+            if not skill:
+                return Response(
+                    json.dumps({"error": f"Skill '{skill_name}' not found"}),
+                    status=404,
+                )
+
+            connected = current_user.skills.is_connected(skill)
+            if connected:
+                current_user.skills.disconnect(skill)
+                current_user.updated_at = datetime.utcnow()
+                current_user.save()
+
+        if connected:
+            cache.invalidate(f"user:{current_user.uuid}", "user_search")
+            facet_index.invalidate()
             return Response(
                 json.dumps({"message": f"Skill '{skill_name}' removed"}),
                 status=200,
@@ -308,17 +372,18 @@ class MeFollowersFollowing(Resource):
     @jwt_guard
     def get(self, action):
         """Get followers/following of the authenticated user (paginated)"""
-        current_user: User = User.find_by_email(get_jwt_identity())
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        current_user: User = repository.find_user_by_email(
+            get_jwt_identity()
+        )
+        page, page_size = pagination_args()
 
         if action == "followers":
-            data = current_user.get_followers(
-                current_user.uuid, page=page, page_size=page_size
+            data = repository.get_followers(
+                current_user, current_user.uuid, page=page, page_size=page_size
             )
         elif action == "following":
-            data = current_user.get_following(
-                current_user.uuid, page=page, page_size=page_size
+            data = repository.get_following(
+                current_user, current_user.uuid, page=page, page_size=page_size
             )
         else:
             return Response(
@@ -330,29 +395,7 @@ class MeFollowersFollowing(Resource):
                 status=400,
             )
 
-        results = [
-            {
-                "uuid": user.uuid,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "email": user.email,
-                "profile_image": user.profile_image,
-                "title": user.title,
-                "followers_count": getattr(
-                    user, "_followers_count", user.get_followers_count()
-                ),
-                "following_count": getattr(
-                    user, "_following_count", user.get_following_count()
-                ),
-                "is_following": getattr(
-                    user, "_is_following", current_user.is_following(user)
-                ),
-                "follows_me": getattr(
-                    user, "_follows_me", user.is_following(current_user)
-                ),
-            }
-            for user in data["results"]
-        ]
+        results = [follow_card_to_dict(user) for user in data["results"]]
 
         return Response(
             json.dumps(
@@ -378,13 +421,14 @@ class MeFollowersFollowing(Resource):
         "q": "Smart search matching name, title, or skills",
         "sort_by": "Sort field (first_name, last_name, title, created_at)",
         "sort_dir": "Sort direction (asc or desc)",
+        "facets": "true to add top skill and title keyword counts",
+        "fields": FIELDS_PARAM,
     }
 )
 class UserList(Resource):
     @jwt_guard
     def get(self):
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        page, page_size = pagination_args()
         title = request.args.get("title")
         name = request.args.get("name")
         q = request.args.get("q")
@@ -396,6 +440,11 @@ class UserList(Resource):
 
         sort_by = request.args.get("sort_by", "first_name")
         sort_dir = request.args.get("sort_dir", "asc")
+        facets = request.args.get("facets", "").lower() in ("1", "true")
+        try:
+            fields = parse_fields(request.args.get("fields"), USER_CARD_FIELDS)
+        except ValueError as e:
+            return fields_error(e)
 
         current_user: User = User.find_by_email(get_jwt_identity())
         data = current_user.get_users_list(
@@ -407,6 +456,8 @@ class UserList(Resource):
             skills=skills,
             sort_by=sort_by,
             sort_dir=sort_dir,
+            fields=fields,
+            facets=facets,
         )
         return Response(json.dumps(data), status=200)
 
@@ -416,6 +467,17 @@ class UserDetail(Resource):
     @jwt_guard
     def get(self, user_uuid):
         """Get a specific user by UUID"""
+        stamp = User.get_version_stamp(user_uuid, get_jwt_identity())
+        if stamp is None:
+            return Response(
+                json.dumps({"error": "User not found"}), status=404
+            )
+
+        etag = make_etag(stamp)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
         current_user: User = User.find_by_email(get_jwt_identity())
         user: User = User.find_by_uuid(user_uuid)
         if not user:
@@ -423,24 +485,8 @@ class UserDetail(Resource):
                 json.dumps({"error": "User not found"}), status=404
             )
 
-        skills = [skill.name for skill in user.skills.all()]
-        degree = current_user.get_connection_degree(user.uuid)
-
-        user_data = {
-            "uuid": user.uuid,
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "email": user.email,
-            "profile_image": user.profile_image,
-            "title": user.title,
-            "followers_count": user.get_followers_count(),
-            "following_count": user.get_following_count(),
-            "is_following": current_user.is_following(user),
-            "follows_me": user.is_following(current_user),
-            "skills": skills,
-            "degree": degree,
-        }
-        return Response(json.dumps(user_data), status=200)
+        user_data = user.get_profile(current_user, version=etag)
+        return with_etag(Response(json.dumps(user_data), status=200), etag)
 
 
 @user_nc.route("/<user_uuid>/follow")
@@ -448,10 +494,13 @@ class FollowUserAPI(Resource):
     @jwt_guard
     def post(self, user_uuid):
         """Follow a user"""
-        current_user = User.find_by_email(get_jwt_identity())
-        user_to_follow = User.find_by_uuid(user_uuid)
-        followed_successful = current_user.follow(user_to_follow)
+        current_user = repository.find_user_by_email(get_jwt_identity())
+        user_to_follow = repository.find_user_by_uuid(user_uuid)
+        followed_successful = user_to_follow is not None and repository.follow(
+            current_user, user_to_follow
+        )
         if followed_successful:
+            notifications.notify("follow", current_user.uuid, user_uuid)
             return Response(
                 json.dumps({"message": "Follow created successfully"}),
                 status=201,
@@ -464,9 +513,12 @@ class FollowUserAPI(Resource):
     @jwt_guard
     def delete(self, user_uuid):
         """Unfollow a user"""
-        current_user = User.find_by_email(get_jwt_identity())
-        user_to_unfollow = User.find_by_uuid(user_uuid)
-        unfollowed_successful = current_user.unfollow(user_to_unfollow)
+        current_user = repository.find_user_by_email(get_jwt_identity())
+        user_to_unfollow = repository.find_user_by_uuid(user_uuid)
+        unfollowed_successful = (
+            user_to_unfollow is not None
+            and repository.unfollow(current_user, user_to_unfollow)
+        )
         if unfollowed_successful:
             return Response(
                 json.dumps({"message": "Unfollowed successfully"}), status=200
@@ -477,6 +529,31 @@ class FollowUserAPI(Resource):
             )
 
 
+@user_nc.route("/<user_uuid>/followers/export")
+@user_nc.doc(
+    description="Stream every follower of a user as newline delimited JSON.",
+    params={"user_uuid": "User UUID"},
+    responses={200: "application/x-ndjson stream", 404: "User not found"},
+)
+class FollowersExport(Resource):
+    @jwt_guard
+    def get(self, user_uuid):
+        user = User.find_by_uuid(user_uuid)
+        if not user:
+            return Response(
+                json.dumps({"error": "User not found"}), status=404
+            )
+
+        current_user = User.find_by_email(get_jwt_identity())
+        followers = current_user.export_followers(
+            user.uuid, fetch_size=current_app.config["EXPORT_FETCH_SIZE"]
+        )
+        return ndjson_response(
+            (follow_card_to_dict(follower) for follower in followers),
+            filename=f"{user.uuid}-followers.ndjson",
+        )
+
+
 @user_nc.route("/<user_uuid>/<action>")
 @user_nc.doc(
     params={
@@ -490,23 +567,24 @@ class FollowAPI(Resource):
     @jwt_guard
     def get(self, user_uuid, action):
         """Get followers/following of a user by UUID (paginated)"""
-        current_user: User = User.find_by_email(get_jwt_identity())
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        current_user: User = repository.find_user_by_email(
+            get_jwt_identity()
+        )
+        page, page_size = pagination_args()
 
-        user: User = User.find_by_uuid(user_uuid)
+        user: User = repository.find_user_by_uuid(user_uuid)
         if not user:
             return Response(
                 json.dumps({"error": "User not found"}), status=404
             )
 
         if action == "followers":
-            data = user.get_followers(
-                user.uuid, page=page, page_size=page_size
+            data = repository.get_followers(
+                current_user, user.uuid, page=page, page_size=page_size
             )
         elif action == "following":
-            data = user.get_following(
-                user.uuid, page=page, page_size=page_size
+            data = repository.get_following(
+                current_user, user.uuid, page=page, page_size=page_size
             )
         else:
             return Response(
@@ -526,18 +604,10 @@ class FollowAPI(Resource):
                 "email": user.email,
                 "profile_image": user.profile_image,
                 "title": user.title,
-                "followers_count": getattr(
-                    user, "_followers_count", user.get_followers_count()
-                ),
-                "following_count": getattr(
-                    user, "_following_count", user.get_following_count()
-                ),
-                "is_following": getattr(
-                    user, "_is_following", current_user.is_following(user)
-                ),
-                "follows_me": getattr(
-                    user, "_follows_me", user.is_following(current_user)
-                ),
+                "followers_count": user._followers_count,
+                "following_count": user._following_count,
+                "is_following": user._is_following,
+                "follows_me": user._follows_me,
             }
             for user in data["results"]
         ]
@@ -555,6 +625,39 @@ class FollowAPI(Resource):
         )
 
 
+@user_nc.route("/typeahead")
+@user_nc.doc(
+    params={
+        "q": "Start of the first, last or full name, case-insensitive",
+        "limit": f"Users to return (default 10, max {MAX_TYPEAHEAD_RESULTS})",
+    },
+    responses={
+        200: "Matching users, followed users first",
+        401: "Unauthorized - JWT token required",
+    },
+)
+class UserTypeahead(Resource):
+    @jwt_guard
+    def get(self):
+        """Suggest users by name prefix"""
+        q = request.args.get("q", "")
+        try:
+            limit = int(request.args.get("limit", 10))
+        except ValueError:
+            limit = 10
+        limit = min(max(limit, 1), MAX_TYPEAHEAD_RESULTS)
+
+        results = []
+        if q.strip():
+            user = User.find_by_email(get_jwt_identity())
+            results = user.get_typeahead(q, limit)
+        return Response(
+            json.dumps({"results": results}),
+            status=200,
+            mimetype="application/json",
+        )
+
+
 @user_nc.route("/suggested")
 @user_nc.doc(
     description="Get paginated suggested users to follow (+2, +3 level connections).",
@@ -572,8 +675,7 @@ class Suggested(Resource):
     def get(self):
         user: User = User.find_by_email(get_jwt_identity())
 
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        page, page_size = pagination_args()
 
         data = user.get_suggested_friends(page=page, page_size=page_size)
 
@@ -608,6 +710,7 @@ class Suggested(Resource):
     params={
         "page": "Page number (default 1)",
         "page_size": "Number of comments per page (default 10)",
+        "fields": FIELDS_PARAM,
     },
     responses={
         200: ("Success", paginated_posts_model),
@@ -617,50 +720,58 @@ class Suggested(Resource):
 class UserPosts(Resource):
     @jwt_guard
     def get(self, user_uuid):
-        page = int(request.args.get("page", 1))
-        page_size = int(request.args.get("page_size", 10))
+        page, page_size = pagination_args()
+        try:
+            fields = parse_fields(
+                request.args.get("fields"), POST_CARD_FIELDS, POST_LIST_FIELDS
+            )
+        except ValueError as e:
+            return fields_error(e)
 
-        user = User.find_by_uuid(user_uuid)
+        user = repository.find_user_by_uuid(user_uuid)
         if not user:
             return Response(
                 json.dumps({"error": "User not found"}), status=404
             )
 
-        current_user = User.find_by_email(get_jwt_identity())
+        current_user = repository.find_user_by_email(get_jwt_identity())
 
-        data = User.get_user_posts(
-            user.uuid, current_user.uuid, page, page_size
+        data = repository.get_user_posts(
+            user.uuid, current_user.uuid, page, page_size, fields=fields
         )
+        return paginated_posts_response(data, fields)
 
-        posts_list = []
-        for post in data["results"]:
-            creator = post._creator
-            posts_list.append(
-                {
-                    "uuid": post.uuid,
-                    "text": post.text,
-                    "images": post.images,
-                    "created_at": str(post.created_at),
-                    "created_by": {
-                        "uuid": creator["uuid"],
-                        "name": f"{creator['first_name']} {creator['last_name']}",
-                        "profile_image": creator.get("profile_image"),
-                        "title": creator.get("title"),
-                    },
-                    "comments_count": getattr(post, "_comments_count", 0),
-                    "likes_count": getattr(post, "_likes_count", 0),
-                    "liked": getattr(post, "_liked", False),
-                }
+
+@user_nc.route("/<user_uuid>/posts/export")
+@user_nc.doc(
+    description="Stream every post of a user as newline delimited JSON.",
+    params={"user_uuid": "User UUID", "fields": FIELDS_PARAM},
+    responses={200: "application/x-ndjson stream", 404: "User not found"},
+)
+class UserPostsExport(Resource):
+    @jwt_guard
+    def get(self, user_uuid):
+        try:
+            fields = parse_fields(
+                request.args.get("fields"), POST_CARD_FIELDS, POST_LIST_FIELDS
             )
+        except ValueError as e:
+            return fields_error(e)
 
-        return Response(
-            json.dumps(
-                {
-                    "page": data["page"],
-                    "page_size": data["page_size"],
-                    "total": data["total"],
-                    "results": posts_list,
-                }
-            ),
-            status=200,
+        user = User.find_by_uuid(user_uuid)
+        if not user:
+            return Response(
+                json.dumps({"error": "User not found"}), status=404
+            )
+
+        current_user = User.find_by_email(get_jwt_identity())
+        posts = User.export_posts(
+            user.uuid,
+            current_user.uuid,
+            fields=fields,
+            fetch_size=current_app.config["EXPORT_FETCH_SIZE"],
+        )
+        return ndjson_response(
+            (post_card_to_dict(post, fields) for post in posts),
+            filename=f"{user.uuid}-posts.ndjson",
         )
@@ -10,6 +10,7 @@ from passlib.hash import pbkdf2_sha256
 from app.models.comment import Comment
 from app.models.post import Post
 from app.models.user import Skill, User
+from app.timeline import timeline
 
 faker = Faker()
 Faker.seed(0)
@@ -262,9 +263,7 @@ def seed():
 
         user_skills = sample(SKILLS, k=faker.random_int(min=1, max=10))
         for skill_name in user_skills:
-            skill = Skill.nodes.first_or_none(name=skill_name)
-            if not skill:
-                skill = Skill(name=skill_name).save()
+            skill = Skill.ensure(skill_name)
             user.skills.connect(skill)
 
     for i, user in enumerate(users):
@@ -304,9 +303,7 @@ def seed():
 
         test_user_skills = sample(SKILLS, k=faker.random_int(min=10, max=20))
         for skill_name in test_user_skills:
-            skill = Skill.nodes.first_or_none(name=skill_name)
-            if not skill:
-                skill = Skill(name=skill_name).save()
+            skill = Skill.ensure(skill_name)
             test_user.skills.connect(skill)
 
     test_user_targets = sample([u for u in users if u != test_user], 5)
@@ -397,4 +394,6 @@ def seed():
             liker.likes_comment.connect(comment)
 
     print("comments and likes created")
+    print("building timelines...")
+    timeline.rebuild()
     print("seeding complete.")
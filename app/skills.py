@@ -0,0 +1,160 @@
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+from app.db import read_query, write_query
+
+
+def normalize_skill(name):
+    """The catalog key of a skill name: case-folded, single spaced."""
+    return re.sub(r"\s+", " ", name).strip().casefold()
+
+
+class SkillCatalog:
+    """
+    In-process dictionary of every skill, as an array sorted by normalized
+    key so prefix lookups are a bisect plus a scan of the matches.
+
+    Skill writes on this worker call ``invalidate`` and the next lookup
+    reloads; other workers pick up new skills after ``ttl`` seconds, and
+    ``resolve`` looks up the names it misses in the key index meanwhile.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        # (keys, entries, by_key), replaced as a whole so lookups never
+        # see the arrays of two different loads.
+        self._snapshot = ([], [], {})
+        self._loaded_at = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get("SKILL_CATALOG_TTL", 300)
+        app.extensions["skill_catalog"] = self
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _current(self):
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.time() - loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._loaded_at is loaded_at:
+                self._load()
+
+    def refresh(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        now = time.time()
+        results, _ = read_query("""
+            MATCH (s:Skill)
+            WHERE s.key IS NOT NULL
+            RETURN s.key, s.name, elementId(s), COUNT { (s)<-[:HAS_SKILL]-() }
+            ORDER BY s.key
+            """)
+        entries = [
+            {"key": key, "name": name, "id": element_id, "users": users}
+            for key, name, element_id, users in results
+        ]
+        self._snapshot = (
+            [entry["key"] for entry in entries],
+            entries,
+            {entry["key"]: entry for entry in entries},
+        )
+        self._loaded_at = now
+
+    def search(self, prefix, limit=10, scan_limit=1000):
+        """Skills whose key starts with ``prefix``, most used first."""
+        self._current()
+        keys, entries, _ = self._snapshot
+        prefix = normalize_skill(prefix)
+        start = bisect_left(keys, prefix)
+        matches = []
+        for i in range(start, min(start + scan_limit, len(keys))):
+            if not keys[i].startswith(prefix):
+                break
+            matches.append(entries[i])
+        matches.sort(key=lambda entry: (-entry["users"], entry["key"]))
+        return [
+            {"name": entry["name"], "users": entry["users"]}
+            for entry in matches[:limit]
+        ]
+
+    def resolve(self, names):
+        """
+        Element ids of the known skills among ``names``. Names missing from
+        the catalog may be skills added on another worker since it loaded,
+        so they are looked up by key.
+        """
+        self._current()
+        by_key = self._snapshot[2]
+        ids, missing = [], []
+        for name in names:
+            key = normalize_skill(name)
+            entry = by_key.get(key)
+            if entry is not None:
+                ids.append(entry["id"])
+            else:
+                missing.append(key)
+        if missing:
+            results, _ = read_query(
+                "MATCH (s:Skill) WHERE s.key IN $keys RETURN elementId(s)",
+                {"keys": missing},
+            )
+            ids.extend(element_id for (element_id,) in results)
+        return ids
+
+
+def migrate_skill_keys():
+    """
+    Give every skill without a ``key`` its normalized key, merging skills
+    whose names only differ in case or spacing into the one with the most
+    users. Safe to run repeatedly; returns the number of skills merged away.
+    """
+    results, _ = read_query("""
+        MATCH (s:Skill)
+        RETURN s.uuid, s.name, s.key, COUNT { (s)<-[:HAS_SKILL]-() } AS users
+        ORDER BY s.key IS NULL, users DESC
+        """)
+    groups = defaultdict(list)
+    for uuid, name, key, _ in results:
+        groups[key or normalize_skill(name)].append((uuid, key))
+
+    merged = 0
+    for key, skills in groups.items():
+        if all(existing is not None for _, existing in skills):
+            continue
+        keeper, duplicates = skills[0][0], [uuid for uuid, _ in skills[1:]]
+        write_query(
+            """
+            MATCH (keeper:Skill {uuid: $keeper})
+            SET keeper.key = $key
+            WITH keeper
+            UNWIND $duplicates AS duplicate_uuid
+            MATCH (duplicate:Skill {uuid: duplicate_uuid})
+            CALL {
+                WITH keeper, duplicate
+                MATCH (u:User)-[r:HAS_SKILL]->(duplicate)
+                MERGE (u)-[kept:HAS_SKILL]->(keeper)
+                ON CREATE SET kept.created_at = r.created_at
+            }
+            DETACH DELETE duplicate
+            """,
+            {"keeper": keeper, "key": key, "duplicates": duplicates},
+        )
+        merged += len(duplicates)
+    return merged
+
+
+skill_catalog = SkillCatalog()
+
+
+if __name__ == "__main__":
+    from app.config import Config  # noqa: F401  (configures neomodel)
+
+    print(f"merged {migrate_skill_keys()} duplicate skills")
@@ -0,0 +1,22 @@
+from flask import Response, json, stream_with_context
+
+
+def ndjson_response(items, filename=None):
+    """
+    Stream ``items`` as newline delimited JSON, one object per line, while
+    they are still being pulled from the database.
+    """
+
+    def lines():
+        for item in items:
+            yield json.dumps(item) + "\n"
+
+    headers = {}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return Response(
+        stream_with_context(lines()),
+        status=200,
+        mimetype="application/x-ndjson",
+        headers=headers,
+    )
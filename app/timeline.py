@@ -0,0 +1,290 @@
+import atexit
+import logging
+import queue
+import time
+from threading import Thread
+
+from app.cache import cache
+from app.db import read_query, write_query
+
+logger = logging.getLogger(__name__)
+
+# Latest posts of `author` copied into timelines that start following them.
+BACKFILL_POSTS = """
+CALL {
+    WITH author
+    MATCH (author)-[:CREATED_POST]->(post:Post)
+    RETURN post
+    ORDER BY post.created_at DESC
+    LIMIT $backfill
+}
+"""
+
+
+class FeedTimeline:
+    """
+    Hybrid push/pull home timeline.
+
+    Posts of regular authors are pushed to their followers when they are
+    created, as ``(follower)-[:TIMELINE]->(post)`` relationships. Authors
+    with at least ``celebrity_threshold`` followers carry the ``Celebrity``
+    label and are never fanned out: their latest posts are kept in a
+    per-author recent-post index and merged into the feed at read time.
+
+    Fan-out runs on a background thread after the post is committed, in
+    transactions of at most ``fanout_batch`` followers, so creating a post
+    does not hold a write transaction open over every follower. Followers
+    see the post once its fan-out has run.
+
+    A timeline is bounded by design: following a regular author copies in
+    their latest ``backfill`` posts and everything they post afterwards.
+    Older posts stay on the author's profile.
+    """
+
+    # An author only loses the label well below the threshold, so one
+    # follow/unfollow at the boundary does not flip the fan-out mode.
+    demote_ratio = 0.9
+
+    def __init__(
+        self,
+        celebrity_threshold=10000,
+        recent_posts=100,
+        backfill=50,
+        fanout_batch=1000,
+    ):
+        self.celebrity_threshold = celebrity_threshold
+        self.recent_posts = recent_posts
+        self.backfill = backfill
+        self.fanout_batch = fanout_batch
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def init_app(self, app):
+        config = app.config
+        self.celebrity_threshold = config.get(
+            "CELEBRITY_FOLLOWER_THRESHOLD", 10000
+        )
+        self.recent_posts = config.get("CELEBRITY_RECENT_POSTS", 100)
+        self.backfill = config.get("TIMELINE_BACKFILL", 50)
+        self.fanout_batch = config.get("TIMELINE_FANOUT_BATCH", 1000)
+        app.extensions["feed_timeline"] = self
+        if self._thread is None:
+            self._thread = Thread(
+                target=self._run, name="timeline", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def publish(self, post_uuid, author_uuid):
+        """
+        Queue a committed post for fan-out to the author's followers. Runs
+        it right away when there is no background thread.
+        """
+        if self._thread is None:
+            self.fan_out(post_uuid, author_uuid)
+        else:
+            self._queue.put((post_uuid, author_uuid))
+
+    def _run(self):
+        while True:
+            post_uuid, author_uuid = self._queue.get()
+            try:
+                self.fan_out(post_uuid, author_uuid)
+            except Exception:
+                logger.exception("Fanning out post %s failed", post_uuid)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Fan out every queued post on the calling thread."""
+        while True:
+            try:
+                post_uuid, author_uuid = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.fan_out(post_uuid, author_uuid)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until every post queued so far has been fanned out."""
+        self._queue.join()
+
+    def fan_out(self, post_uuid, author_uuid):
+        """Push a post to the author's followers, unless a celebrity."""
+        query = """
+        MATCH (author:User {uuid: $author_uuid})
+            -[:CREATED_POST]->(post:Post {uuid: $post_uuid})
+        WHERE NOT author:Celebrity
+        MATCH (author)<-[:FOLLOWS]-(follower:User)
+        WHERE NOT EXISTS { (follower)-[:TIMELINE]->(post) }
+        WITH post, follower
+        LIMIT $batch
+        CREATE (follower)-[:TIMELINE]->(post)
+        RETURN count(*)
+        """
+        params = {
+            "post_uuid": post_uuid,
+            "author_uuid": author_uuid,
+            "batch": self.fanout_batch,
+        }
+        while True:
+            results, _ = write_query(query, params)
+            if results[0][0] < self.fanout_batch:
+                return
+
+    def on_follow(self, follower_uuid, author_uuid):
+        """
+        Promote the author once they cross the threshold, otherwise copy
+        their recent posts into the new follower's timeline.
+        """
+        query = f"""
+        MATCH (author:User {{uuid: $author_uuid}})
+        WITH author, COUNT {{ (author)<-[:FOLLOWS]-() }} >= $threshold
+            AS celebrity
+        FOREACH (_ IN CASE WHEN celebrity THEN [1] ELSE [] END |
+            SET author:Celebrity)
+        WITH author
+        WHERE NOT author:Celebrity
+        MATCH (follower:User {{uuid: $follower_uuid}})
+        {BACKFILL_POSTS}
+        MERGE (follower)-[:TIMELINE]->(post)
+        """
+        write_query(
+            query,
+            {
+                "follower_uuid": follower_uuid,
+                "author_uuid": author_uuid,
+                "threshold": self.celebrity_threshold,
+                "backfill": self.backfill,
+            },
+        )
+
+    def on_unfollow(self, follower_uuid, author_uuid):
+        """
+        Drop the author's posts from the former follower's timeline and
+        demote the author, pushing their recent posts to every remaining
+        follower, once they fall clearly below the threshold.
+        """
+        write_query(
+            """
+            MATCH (:User {uuid: $follower_uuid})-[t:TIMELINE]->(:Post)
+                <-[:CREATED_POST]-(:User {uuid: $author_uuid})
+            DELETE t
+            """,
+            {"follower_uuid": follower_uuid, "author_uuid": author_uuid},
+        )
+        write_query(
+            f"""
+            MATCH (author:Celebrity {{uuid: $author_uuid}})
+            WHERE COUNT {{ (author)<-[:FOLLOWS]-() }} < $threshold
+            REMOVE author:Celebrity
+            WITH author
+            MATCH (author)<-[:FOLLOWS]-(follower:User)
+            {BACKFILL_POSTS}
+            MERGE (follower)-[:TIMELINE]->(post)
+            """,
+            {
+                "author_uuid": author_uuid,
+                "threshold": int(self.celebrity_threshold * self.demote_ratio),
+                "backfill": self.backfill,
+            },
+        )
+
+    def recent_post_uuids(self, author_uuid):
+        """The per-author recent-post index, newest first."""
+        return cache.get_or_load(
+            f"recent_posts:{author_uuid}",
+            lambda: self._query_recent_posts(author_uuid),
+            tags=[f"posts:{author_uuid}"],
+        )
+
+    def _query_recent_posts(self, author_uuid):
+        query = """
+        MATCH (:User {uuid: $author_uuid})-[:CREATED_POST]->(post:Post)
+        RETURN post.uuid
+        ORDER BY post.created_at DESC
+        LIMIT $limit
+        """
+        results, _ = read_query(
+            query, {"author_uuid": author_uuid, "limit": self.recent_posts}
+        )
+        return [row[0] for row in results]
+
+    def pulled_post_uuids(self, user_uuid):
+        """Recent posts of every celebrity ``user_uuid`` follows."""
+        results, _ = read_query(
+            """
+            MATCH (:User {uuid: $uuid})-[:FOLLOWS]->(author:Celebrity)
+            RETURN author.uuid
+            """,
+            {"uuid": user_uuid},
+        )
+        return [
+            post_uuid
+            for (author_uuid,) in results
+            for post_uuid in self.recent_post_uuids(author_uuid)
+        ]
+
+    def mark_built(self, user_uuid):
+        """
+        Serve the user's following feed from their timeline, for a user
+        whose timeline is complete, like a new one that follows nobody.
+        """
+        write_query(
+            """
+            MATCH (u:User {uuid: $uuid})
+            SET u.timeline_built_at = $now
+            """,
+            {"uuid": user_uuid, "now": time.time()},
+        )
+
+    def rebuild(self):
+        """
+        Recompute every ``Celebrity`` label and refill all timelines from the
+        follow graph, for data written without going through the models,
+        then mark every timeline built. Until a user's timeline is marked
+        their following feed is pulled from the followed authors' posts.
+        """
+        write_query("MATCH ()-[t:TIMELINE]->() DELETE t")
+        write_query(
+            """
+            MATCH (author:User)
+            WITH author, COUNT { (author)<-[:FOLLOWS]-() } >= $threshold
+                AS celebrity
+            FOREACH (_ IN CASE WHEN celebrity THEN [1] ELSE [] END |
+                SET author:Celebrity)
+            FOREACH (_ IN CASE WHEN celebrity THEN [] ELSE [1] END |
+                REMOVE author:Celebrity)
+            """,
+            {"threshold": self.celebrity_threshold},
+        )
+        write_query(
+            f"""
+            MATCH (author:User)
+            WHERE NOT author:Celebrity
+            {BACKFILL_POSTS}
+            MATCH (author)<-[:FOLLOWS]-(follower:User)
+            MERGE (follower)-[:TIMELINE]->(post)
+            """,
+            {"backfill": self.backfill},
+        )
+        write_query(
+            "MATCH (u:User) SET u.timeline_built_at = $now",
+            {"now": time.time()},
+        )
+
+
+timeline = FeedTimeline()
+
+
+if __name__ == "__main__":
+    from app.config import Config
+
+    # Run once on a database from before timelines, then again whenever
+    # users or follows were written without going through the models.
+    timeline.celebrity_threshold = Config.CELEBRITY_FOLLOWER_THRESHOLD
+    timeline.backfill = Config.TIMELINE_BACKFILL
+    timeline.rebuild()
+    print("timelines rebuilt")
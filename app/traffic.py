@@ -0,0 +1,151 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from threading import Lock
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+logger = logging.getLogger(__name__)
+
+SECRET_FIELDS = frozenset(
+    {
+        "password",
+        "old_password",
+        "new_password",
+        "access_token",
+        "refresh_token",
+    }
+)
+
+# Query parameters that carry what the user typed, e.g. a search box.
+FREE_TEXT_ARGS = frozenset({"q", "name", "title"})
+
+
+class TrafficRecorder:
+    """
+    Appends one JSON line per handled request to ``TRAFFIC_RECORD_PATH`` for
+    ``benchmarks.replay``. Traces keep the route template, uuid path
+    parameters, query string and timing, but not the request content: the
+    auth subject and emails become pseudonyms keyed by
+    ``TRAFFIC_PSEUDONYM_KEY``, secrets are dropped and other body strings,
+    path parameters and free-text query parameters are replaced by
+    placeholders of the same length.
+    """
+
+    def __init__(self, path=None, sample_rate=1.0, exclude=()):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.exclude = tuple(exclude)
+        self._key = b""
+        self._file = None
+        self._pid = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def init_app(self, app):
+        config = app.config
+        self.path = config.get("TRAFFIC_RECORD_PATH")
+        self.sample_rate = config.get("TRAFFIC_SAMPLE_RATE", 1.0)
+        self.exclude = tuple(config.get("TRAFFIC_RECORD_EXCLUDE", ()))
+        key = config.get("TRAFFIC_PSEUDONYM_KEY")
+        self._key = key.encode() if key else b""
+        app.extensions["traffic_recorder"] = self
+        if self.enabled:
+            if not key:
+                raise ValueError(
+                    "TRAFFIC_PSEUDONYM_KEY is required to record traffic"
+                )
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+
+    def pseudonym(self, value):
+        digest = hmac.new(self._key, value.encode(), hashlib.sha256)
+        return digest.hexdigest()[:32]
+
+    def _before_request(self):
+        g.traffic_started = time.perf_counter()
+        g.traffic_sampled = random.random() < self.sample_rate
+
+    def _after_request(self, response):
+        if not g.get("traffic_sampled") or request.url_rule is None:
+            return response
+        route = request.url_rule.rule
+        if route.startswith(self.exclude):
+            return response
+
+        try:
+            self._write(
+                {
+                    "t": time.time(),
+                    "method": request.method,
+                    "route": route,
+                    "view_args": self._sanitize(
+                        request.view_args or {}, placeholders=True
+                    ),
+                    "args": self._sanitize(
+                        request.args.to_dict(flat=False),
+                        free_text=FREE_TEXT_ARGS,
+                    ),
+                    "json": self._sanitize(
+                        request.get_json(silent=True), placeholders=True
+                    ),
+                    "subject": self._subject(),
+                    "status": response.status_code,
+                    "ms": round(
+                        (time.perf_counter() - g.traffic_started) * 1000, 3
+                    ),
+                }
+            )
+        except Exception:
+            logger.exception("Recording request trace failed")
+        return response
+
+    def _subject(self):
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            return None
+        return self.pseudonym(identity) if identity else None
+
+    def _sanitize(self, value, key=None, placeholders=False, free_text=()):
+        if isinstance(value, dict):
+            return {
+                k: self._sanitize(v, k, placeholders, free_text)
+                for k, v in value.items()
+                if k not in SECRET_FIELDS
+            }
+        if isinstance(value, list):
+            return [
+                self._sanitize(v, key, placeholders, free_text) for v in value
+            ]
+        if not isinstance(value, str):
+            return value
+        if key == "email":
+            return self.pseudonym(value)
+        if key in free_text or (
+            placeholders and not (key or "").endswith("uuid")
+        ):
+            return "x" * len(value)
+        return value
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._pid != os.getpid():
+                # Reopen after a fork so each worker has its own handle.
+                path = self.path.format(pid=os.getpid())
+                self._file = open(path, "a", buffering=1)
+                self._pid = os.getpid()
+            self._file.write(line)
+
+
+recorder = TrafficRecorder()
@@ -0,0 +1,254 @@
+import glob
+import heapq
+import json
+import logging
+import os
+import time
+from threading import Lock, Thread
+
+from app.events import broker
+
+logger = logging.getLogger(__name__)
+
+
+class TrendingScorer:
+    """
+    Time-decayed engagement velocity of posts, for ``/posts/trending``.
+
+    Likes and comments add their weight to a post's score, and scores halve
+    every ``half_life`` seconds. Scores are stored scaled to a fixed epoch,
+    ``weight * 2 ** ((t - epoch) / half_life)``, so an event only touches its
+    own post and the ranking does not change as time passes; the decayed
+    value is recovered when serving. The best ``top_k`` posts are kept in a
+    min-heap with lazy deletion, so a request reads the ranking without
+    touching the database.
+
+    Scores are fed from the event broker and are per worker. With
+    ``checkpoint_path`` set each worker writes the engagement it saw to
+    ``{checkpoint_path}.{pid}`` every ``checkpoint_interval`` seconds, and
+    on start every worker loads the sum of all those files, so the ranking
+    covers the engagement seen by all workers before the restart. Files
+    older than ``expire_half_lives`` half-lives are deleted on restore.
+    """
+
+    # Re-scale stored scores to a new epoch before they overflow.
+    max_exponent = 64
+    expire_half_lives = 16
+
+    def __init__(
+        self,
+        half_life=21600,
+        top_k=200,
+        max_tracked=10000,
+        like_weight=1.0,
+        comment_weight=2.0,
+    ):
+        self.half_life = half_life
+        self.top_k = top_k
+        self.max_tracked = max_tracked
+        self.like_weight = like_weight
+        self.comment_weight = comment_weight
+        self.checkpoint_path = None
+        self.checkpoint_interval = 60
+        self._epoch = time.time()
+        self._scores = {}
+        # The part of ``_scores`` this worker saw, which it checkpoints.
+        self._own = {}
+        self._top = {}
+        self._heap = []
+        self._lock = Lock()
+        self._thread = None
+
+    def init_app(self, app):
+        config = app.config
+        self.half_life = config.get("TRENDING_HALF_LIFE", 21600)
+        self.top_k = config.get("TRENDING_TOP_K", 200)
+        self.max_tracked = config.get("TRENDING_MAX_TRACKED", 10000)
+        self.like_weight = config.get("TRENDING_LIKE_WEIGHT", 1.0)
+        self.comment_weight = config.get("TRENDING_COMMENT_WEIGHT", 2.0)
+        self.checkpoint_path = config.get("TRENDING_CHECKPOINT_PATH")
+        self.checkpoint_interval = config.get(
+            "TRENDING_CHECKPOINT_INTERVAL", 60
+        )
+        app.extensions["trending"] = self
+
+        broker.listen(self._on_event)
+        if self.checkpoint_path and self._thread is None:
+            self.restore()
+            self._thread = Thread(
+                target=self._run, name="trending", daemon=True
+            )
+            self._thread.start()
+
+    def _on_event(self, event, data):
+        if event == "post.likes":
+            self.add(data["uuid"], self.like_weight * data["delta"])
+        elif event == "post.comments":
+            self.add(data["uuid"], self.comment_weight * data["delta"])
+        elif event == "post.deleted":
+            self.remove(data["uuid"])
+
+    # Scoring
+
+    def add(self, post_uuid, weight, now=None):
+        """Add ``weight`` of engagement with ``post_uuid`` at ``now``."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if (now - self._epoch) / self.half_life > self.max_exponent:
+                self._rebase(now)
+            scale = 2 ** ((now - self._epoch) / self.half_life)
+            score = self._scores.get(post_uuid, 0.0) + weight * scale
+            if score <= 0:
+                self._forget(post_uuid)
+                return
+            self._scores[post_uuid] = score
+            self._own[post_uuid] = self._own.get(post_uuid, 0.0) + (
+                weight * scale
+            )
+            self._rank(post_uuid, score)
+            if len(self._scores) > self.max_tracked:
+                self._prune()
+
+    def remove(self, post_uuid):
+        with self._lock:
+            self._forget(post_uuid)
+
+    def _forget(self, post_uuid):
+        self._scores.pop(post_uuid, None)
+        self._own.pop(post_uuid, None)
+        if self._top.pop(post_uuid, None) is not None:
+            self._rebuild_heap()
+
+    def _rank(self, post_uuid, score):
+        heap, top = self._heap, self._top
+        if post_uuid in top:
+            top[post_uuid] = score
+            heapq.heappush(heap, (score, post_uuid))
+        else:
+            self._drop_stale()
+            if len(top) >= self.top_k:
+                if not heap or score <= heap[0][0]:
+                    return
+                _, evicted = heapq.heappop(heap)
+                del top[evicted]
+            top[post_uuid] = score
+            heapq.heappush(heap, (score, post_uuid))
+        if len(heap) > 4 * self.top_k:
+            self._rebuild_heap()
+
+    def _drop_stale(self):
+        heap, top = self._heap, self._top
+        while heap and top.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _rebuild_heap(self):
+        self._heap = [(score, uuid) for uuid, score in self._top.items()]
+        heapq.heapify(self._heap)
+
+    def _prune(self):
+        keep = heapq.nlargest(
+            self.max_tracked * 3 // 4,
+            self._scores.items(),
+            key=lambda item: item[1],
+        )
+        self._scores = dict(keep)
+        self._scores.update(self._top)
+        self._own = {
+            uuid: score
+            for uuid, score in self._own.items()
+            if uuid in self._scores
+        }
+
+    def _rebase(self, now):
+        factor = 2 ** (-(now - self._epoch) / self.half_life)
+        self._scores = {
+            uuid: score * factor for uuid, score in self._scores.items()
+        }
+        self._own = {uuid: score * factor for uuid, score in self._own.items()}
+        self._top = {uuid: score * factor for uuid, score in self._top.items()}
+        self._rebuild_heap()
+        self._epoch = now
+
+    def top(self, limit=None, now=None):
+        """``(post_uuid, score)`` of the trending posts, best first."""
+        now = time.time() if now is None else now
+        with self._lock:
+            ranked = sorted(
+                self._top.items(), key=lambda item: item[1], reverse=True
+            )
+            factor = 2 ** (-(now - self._epoch) / self.half_life)
+        return [(uuid, score * factor) for uuid, score in ranked[:limit]]
+
+    # Checkpoints
+
+    def _run(self):
+        while True:
+            time.sleep(self.checkpoint_interval)
+            try:
+                self.checkpoint()
+            except Exception:
+                logger.exception("Writing trending checkpoint failed")
+
+    def checkpoint(self):
+        now = time.time()
+        with self._lock:
+            factor = 2 ** (-(now - self._epoch) / self.half_life)
+            scores = {
+                uuid: score * factor for uuid, score in self._own.items()
+            }
+        path = f"{self.checkpoint_path}.{os.getpid()}"
+        with open(f"{path}.tmp", "w") as out:
+            json.dump({"saved_at": now, "scores": scores}, out)
+        os.replace(f"{path}.tmp", path)
+
+    def _checkpoints(self):
+        """``(path, pid)`` of the workers' checkpoint files."""
+        prefix = f"{self.checkpoint_path}."
+        for path in glob.glob(glob.escape(prefix) + "*"):
+            pid = path[len(prefix) :]
+            if pid.isdigit():
+                yield path, int(pid)
+
+    def restore(self):
+        """
+        Load the sum of the workers' checkpoints, each decayed from its
+        ``saved_at``. The file of a worker with this worker's pid is
+        continued by this worker.
+        """
+        now = time.time()
+        scores, own = {}, {}
+        for path, pid in self._checkpoints():
+            try:
+                with open(path) as checkpoint_file:
+                    checkpoint = json.load(checkpoint_file)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                logger.exception("Reading trending checkpoint failed")
+                continue
+            age = (now - checkpoint["saved_at"]) / self.half_life
+            if age > self.expire_half_lives:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            factor = 2 ** (-age)
+            for uuid, score in checkpoint["scores"].items():
+                if score <= 0:
+                    continue
+                scores[uuid] = scores.get(uuid, 0.0) + score * factor
+                if pid == os.getpid():
+                    own[uuid] = own.get(uuid, 0.0) + score * factor
+        with self._lock:
+            self._epoch = now
+            self._scores = {}
+            self._own = own
+            self._top = {}
+            self._heap = []
+            for uuid, score in scores.items():
+                self._scores[uuid] = score
+                self._rank(uuid, score)
+
+
+trending = TrendingScorer()
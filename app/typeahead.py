@@ -0,0 +1,211 @@
+import logging
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Lock, Thread
+
+from app.db import read_query
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_name(text):
+    """Case-folded, accent-free and single spaced, for prefix matching."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def name_tokens(first_name, last_name):
+    """Index keys of a user: first name, last name and full name."""
+    first = normalize_name(first_name)
+    last = normalize_name(last_name)
+    full = f"{first} {last}".strip()
+    return tuple(
+        dict.fromkeys(token for token in (first, last, full) if token)
+    )
+
+
+class UserTypeahead:
+    """
+    In-memory prefix index over user names for autocomplete.
+
+    Keys are kept in one sorted list with the user ordinal of each key in a
+    parallel array, so a prefix is a bisect and a scan of at most ``limit``
+    matches. The users the caller follows are checked first. The index is
+    loaded in the background on first use (lookups find nothing until it
+    is ready), updated by registration and profile edits on this worker,
+    and rebuilt in the background every ``ttl`` seconds to pick up changes
+    made through other workers. Updates made while a build runs are
+    replayed onto the new index before it is swapped in.
+    """
+
+    def __init__(self, ttl=600, scan_limit=200):
+        self.ttl = ttl
+        self.scan_limit = scan_limit
+        self._keys = []
+        self._ordinals = array("I")
+        self._users = []
+        self._by_uuid = {}
+        self._built_at = None
+        self._rebuilding = False
+        self._replay = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.ttl = config.get("TYPEAHEAD_TTL", 600)
+        self.scan_limit = config.get("TYPEAHEAD_SCAN_LIMIT", 200)
+        app.extensions["user_typeahead"] = self
+
+    def build(self):
+        started = time.time()
+        with self._lock:
+            self._replay = []
+        try:
+            results, _ = read_query("""
+                MATCH (u:User)
+                RETURN u.uuid, u.first_name, u.last_name, u.profile_image,
+                       u.title
+                """)
+            users = [(*row, name_tokens(row[1], row[2])) for row in results]
+            entries = sorted(
+                (token, ordinal)
+                for ordinal, user in enumerate(users)
+                for token in user[5]
+            )
+            with self._lock:
+                self._users = users
+                self._by_uuid = {user[0]: i for i, user in enumerate(users)}
+                self._keys = [token for token, _ in entries]
+                self._ordinals = array(
+                    "I", (ordinal for _, ordinal in entries)
+                )
+                # The query may have missed these: re-apply them.
+                for row in self._replay:
+                    self._apply(row)
+                self._built_at = started
+        finally:
+            with self._lock:
+                self._replay = None
+
+    def _ensure_current(self):
+        if (
+            self._built_at is not None
+            and time.time() - self._built_at < self.ttl
+        ):
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        Thread(target=self._rebuild, name="typeahead", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Rebuilding the typeahead index failed")
+        finally:
+            self._rebuilding = False
+
+    def update(self, user):
+        """Add ``user`` to the index or re-index their changed name."""
+        row = (
+            user.uuid,
+            user.first_name,
+            user.last_name,
+            user.profile_image,
+            user.title,
+            name_tokens(user.first_name, user.last_name),
+        )
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(row)
+            if self._built_at is not None:
+                self._apply(row)
+
+    def _apply(self, row):
+        # Idempotent, so a row both replayed and applied is harmless.
+        uuid, new_tokens = row[0], row[5]
+        ordinal = self._by_uuid.get(uuid)
+        if ordinal is None:
+            ordinal = len(self._users)
+            self._users.append(row)
+            self._by_uuid[uuid] = ordinal
+            old_tokens = ()
+        else:
+            old_tokens = self._users[ordinal][5]
+            self._users[ordinal] = row
+
+        for token in set(old_tokens) - set(new_tokens):
+            lo = bisect_left(self._keys, token)
+            hi = bisect_right(self._keys, token, lo)
+            for i in range(lo, hi):
+                if self._ordinals[i] == ordinal:
+                    del self._keys[i]
+                    del self._ordinals[i]
+                    break
+        for token in set(new_tokens) - set(old_tokens):
+            i = bisect_right(self._keys, token)
+            self._keys.insert(i, token)
+            self._ordinals.insert(i, ordinal)
+
+    def search(self, q, viewer_uuid, following_uuids=(), limit=10):
+        """
+        Users whose first, last or full name starts with ``q``: users
+        ``viewer_uuid`` follows first, then everyone else by name.
+        """
+        prefix = normalize_name(q)
+        if not prefix:
+            return []
+        self._ensure_current()
+        with self._lock:
+            users, by_uuid = self._users, self._by_uuid
+            keys, ordinals = self._keys, self._ordinals
+
+            results = []
+            seen = {by_uuid.get(viewer_uuid)}
+            for uuid in following_uuids:
+                ordinal = by_uuid.get(uuid)
+                if ordinal is None or ordinal in seen:
+                    continue
+                user = users[ordinal]
+                if any(token.startswith(prefix) for token in user[5]):
+                    seen.add(ordinal)
+                    results.append((user, True))
+            results.sort(key=lambda item: min(item[0][5]))
+            del results[limit:]
+
+            start = bisect_left(keys, prefix)
+            end = min(start + self.scan_limit, len(keys))
+            for i in range(start, end):
+                if len(results) >= limit or not keys[i].startswith(prefix):
+                    break
+                ordinal = ordinals[i]
+                if ordinal not in seen:
+                    seen.add(ordinal)
+                    results.append((users[ordinal], False))
+
+        return [
+            {
+                "uuid": uuid,
+                "first_name": first_name,
+                "last_name": last_name,
+                "profile_image": profile_image,
+                "title": title,
+                "is_following": is_following,
+            }
+            for (
+                uuid,
+                first_name,
+                last_name,
+                profile_image,
+                title,
+                _,
+            ), is_following in results
+        ]
+
+
+user_typeahead = UserTypeahead()
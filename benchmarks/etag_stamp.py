@@ -0,0 +1,97 @@
+"""
+Compare the version-stamp lookup behind conditional GETs with the full
+detail reads it lets us skip.
+
+Run against a seeded database (``python run.py`` seeds one):
+
+    python -m benchmarks.etag_stamp --rounds 200
+"""
+
+import argparse
+import statistics
+import time
+
+from app.cache import cache
+from app.config import Config  # noqa: F401  (configures neomodel)
+from app.db import read_query
+from app.models.comment import Comment
+from app.models.post import Post
+from app.models.user import User
+
+
+def _time(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples),
+    }
+
+
+def _report(name, stamp, full):
+    print(
+        f"{name:<10} stamp p50={stamp['p50']:.2f}ms p95={stamp['p95']:.2f}ms"
+        f" | full p50={full['p50']:.2f}ms p95={full['p95']:.2f}ms"
+        f" | speed-up x{full['mean'] / stamp['mean']:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--email", default="test@test.com")
+    args = parser.parse_args()
+    cache.enabled = False
+
+    viewer = User.find_by_email(args.email)
+    if not viewer:
+        raise SystemExit(f"No user {args.email}, seed the database first")
+
+    query = """
+    MATCH (u:User)-[:CREATED_POST]->(p:Post)<-[:ON]-(c:Comment)
+    RETURN u.uuid, p.uuid, c.uuid
+    ORDER BY COUNT { (p)<-[:LIKES]-() } DESC
+    LIMIT 1
+    """
+    rows, _ = read_query(query)
+    user_uuid, post_uuid, comment_uuid = rows[0]
+    user = User.find_by_uuid(user_uuid)
+
+    _report(
+        "post",
+        _time(
+            lambda: Post.get_version_stamp(post_uuid, viewer.email),
+            args.rounds,
+        ),
+        _time(
+            lambda: Post._query_by_uuid(post_uuid, viewer.uuid), args.rounds
+        ),
+    )
+    _report(
+        "comment",
+        _time(
+            lambda: Comment.get_version_stamp(comment_uuid, viewer.email),
+            args.rounds,
+        ),
+        _time(
+            lambda: Comment._query_by_uuid(comment_uuid, viewer.uuid),
+            args.rounds,
+        ),
+    )
+    _report(
+        "user",
+        _time(
+            lambda: User.get_version_stamp(user_uuid, viewer.email),
+            args.rounds,
+        ),
+        _time(lambda: user._query_profile(viewer), args.rounds),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+Replay recorded traffic, or a synthetic workload mix, and report per-route
+throughput, latency percentiles and error rates.
+
+Record traces by setting ``TRAFFIC_RECORD_PATH`` on a running app, then
+replay them against a seeded database (``python run.py`` seeds one):
+
+    python -m benchmarks.replay --trace traffic.jsonl --speed 4
+    python -m benchmarks.replay --mix feed --rate 100 --duration 60
+    python -m benchmarks.replay --mix write --url http://localhost:5000
+
+Requests are sent open-loop at their recorded (or generated) times divided
+by ``--speed``. Latency is measured from that scheduled time, so time spent
+queued behind a saturated server counts against it. Recorded user, post and
+comment ids that do not exist locally are mapped to random local ones, the
+same recorded id always to the same local one, and pseudonymous subjects to
+local users; tokens are minted with the app's JWT secret.
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.config import Config
+from app.db import read_query
+
+PARAM = re.compile(r"<(?:[^:<>]+:)?([^<>]+)>")
+
+SEARCH_TERMS = ["a", "an", "jo", "mar", "eng", "dev", "sen", "python"]
+
+
+def _hot(rng, prefix, size):
+    """A recorded id from a skewed distribution, so some are hot."""
+    return f"{prefix}{min(int(rng.paretovariate(1.16)) - 1, size - 1)}"
+
+
+def _post_uuid(rng):
+    return {"post_uuid": _hot(rng, "post", 1000)}
+
+
+def _user_uuid(rng):
+    return {"user_uuid": _hot(rng, "user", 200)}
+
+
+def _text(rng):
+    return {"text": "x" * rng.randint(20, 400), "images": []}
+
+
+# name: [(weight, method, route, view args, query args, json body)]
+MIXES = {
+    "feed": [
+        (45, "GET", "/posts/feed", None, None, None),
+        (20, "GET", "/posts/following-posts", None, None, None),
+        (15, "GET", "/posts/<post_uuid>", _post_uuid, None, None),
+        (10, "GET", "/posts/<post_uuid>/comments", _post_uuid, None, None),
+        (5, "POST", "/posts/<post_uuid>/like", _post_uuid, None, None),
+        (5, "GET", "/users/<user_uuid>", _user_uuid, None, None),
+    ],
+    "search": [
+        (
+            60,
+            "GET",
+            "/users/",
+            None,
+            lambda rng: {"q": [rng.choice(SEARCH_TERMS)]},
+            None,
+        ),
+        (10, "GET", "/users/suggested", None, None, None),
+        (15, "GET", "/users/<user_uuid>", _user_uuid, None, None),
+        (
+            15,
+            "GET",
+            "/users/<user_uuid>/<action>",
+            lambda rng: {**_user_uuid(rng), "action": "followers"},
+            None,
+            None,
+        ),
+    ],
+    "write": [
+        (30, "POST", "/posts", None, None, _text),
+        (25, "POST", "/posts/<post_uuid>/like", _post_uuid, None, None),
+        (10, "DELETE", "/posts/<post_uuid>/like", _post_uuid, None, None),
+        (
+            20,
+            "POST",
+            "/comments/",
+            None,
+            None,
+            lambda rng: {"text": _text(rng)["text"], **_post_uuid(rng)},
+        ),
+        (10, "POST", "/users/<user_uuid>/follow", _user_uuid, None, None),
+        (5, "DELETE", "/users/<user_uuid>/follow", _user_uuid, None, None),
+    ],
+}
+
+
+def load_trace(path):
+    with open(path) as trace:
+        entries = [json.loads(line) for line in trace if line.strip()]
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def synthetic(mix, rate, duration, seed=0):
+    """Poisson arrivals at ``rate`` per second drawn from ``MIXES[mix]``."""
+    rng = random.Random(seed)
+    choices = MIXES[mix]
+    weights = [choice[0] for choice in choices]
+    entries = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            return entries
+        _, method, route, view_args, args, body = rng.choices(
+            choices, weights
+        )[0]
+        entries.append(
+            {
+                "t": t,
+                "method": method,
+                "route": route,
+                "view_args": view_args(rng) if view_args else {},
+                "args": args(rng) if args else {},
+                "json": body(rng) if body else None,
+                "subject": _hot(rng, "subject", 200),
+            }
+        )
+
+
+class LocalIds:
+    """Maps recorded ids and subjects onto entities of the local database."""
+
+    KINDS = {
+        "user_uuid": "users",
+        "post_uuid": "posts",
+        "comment_uuid": "comments",
+    }
+
+    def __init__(self, seed=0, limit=10000):
+        self._rng = random.Random(seed)
+        self._mapped = defaultdict(dict)
+        self._lock = threading.Lock()
+        self.pools = {}
+        for kind, query in (
+            ("users", "MATCH (n:User) RETURN n.uuid, n.email"),
+            ("posts", "MATCH (n:Post) RETURN n.uuid, null"),
+            ("comments", "MATCH (n:Comment) RETURN n.uuid, null"),
+        ):
+            rows, _ = read_query(f"{query} LIMIT $limit", {"limit": limit})
+            self.pools[kind] = dict(rows)
+        if not self.pools["users"]:
+            raise SystemExit("No users found, seed the database first")
+
+    def _map(self, kind, value):
+        pool = self.pools[kind]
+        if value in pool or not pool:
+            return value
+        with self._lock:
+            mapped = self._mapped[kind]
+            if value not in mapped:
+                mapped[value] = self._rng.choice(list(pool))
+            return mapped[value]
+
+    def resolve(self, key, value):
+        kind = self.KINDS.get(key)
+        if kind is None or not isinstance(value, str):
+            return value
+        return self._map(kind, value)
+
+    def email(self, subject):
+        return self.pools["users"][self._map("users", subject)]
+
+    def body(self, value, key=None):
+        if isinstance(value, dict):
+            return {k: self.body(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.body(v, key) for v in value]
+        if key == "email":
+            return self.email(value)
+        return self.resolve(key, value)
+
+
+class InProcessTarget:
+    """Sends requests through a Flask test client, one per thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, method, path, args, body, headers):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(
+            path,
+            method=method,
+            query_string=args,
+            json=body,
+            headers=headers,
+        )
+        response.get_data()
+        return response.status_code
+
+
+class HttpTarget:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def send(self, method, path, args, body, headers):
+        url = self.base_url + path
+        if args:
+            url += "?" + urlencode(args, doseq=True)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers = {**headers, "Content-Type": "application/json"}
+        request = urllib.request.Request(
+            url, data=data, headers=headers, method=method
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                r.read()
+                return r.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class Replay:
+    def __init__(self, app, target, ids, password, concurrency):
+        self.app = app
+        self.target = target
+        self.ids = ids
+        self.password = password
+        self.concurrency = concurrency
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def _token(self, email):
+        with self._lock:
+            if email not in self._tokens:
+                with self.app.app_context():
+                    self._tokens[email] = create_access_token(identity=email)
+            return self._tokens[email]
+
+    def _request(self, entry):
+        view_args = {
+            key: self.ids.resolve(key, value)
+            for key, value in entry.get("view_args", {}).items()
+        }
+        path = PARAM.sub(
+            lambda m: quote(str(view_args[m.group(1)]), safe=""),
+            entry["route"],
+        )
+        args = {
+            key: [self.ids.resolve(key, value) for value in values]
+            for key, values in (entry.get("args") or {}).items()
+        }
+        body = entry.get("json")
+        if body is not None:
+            body = self.ids.body(body)
+            if isinstance(body, dict) and entry["route"].endswith(
+                ("/login", "/register")
+            ):
+                body["password"] = self.password
+        headers = {}
+        if entry.get("subject"):
+            email = self.ids.email(entry["subject"])
+            headers["Authorization"] = f"Bearer {self._token(email)}"
+        return path, args, body, headers
+
+    def _run(self, entry, due):
+        key = f"{entry['method']} {entry['route']}"
+        try:
+            status = self.target.send(entry["method"], *self._request(entry))
+        except Exception:
+            status = "exception"
+        latency = (time.perf_counter() - due) * 1000
+        with self._lock:
+            self.latencies[key].append(latency)
+            self.statuses[key][status] += 1
+
+    def run(self, entries, speed=1.0):
+        if not entries:
+            raise SystemExit("Nothing to replay")
+        t0 = entries[0]["t"]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            start = time.perf_counter()
+            for entry in entries:
+                due = start + (entry["t"] - t0) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._run, entry, due)
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        routes = {}
+        for key, samples in sorted(self.latencies.items()):
+            samples.sort()
+            statuses = self.statuses[key]
+            count = len(samples)
+            errors = sum(
+                n
+                for status, n in statuses.items()
+                if status == "exception" or status >= 500
+            )
+            client_errors = sum(
+                n
+                for status, n in statuses.items()
+                if status != "exception" and 400 <= status < 500
+            )
+            routes[key] = {
+                "count": count,
+                "rps": round(count / elapsed, 2),
+                "p50_ms": round(_percentile(samples, 0.50), 2),
+                "p95_ms": round(_percentile(samples, 0.95), 2),
+                "p99_ms": round(_percentile(samples, 0.99), 2),
+                "error_rate": round(errors / count, 4),
+                "client_error_rate": round(client_errors / count, 4),
+                "statuses": {str(s): n for s, n in statuses.items()},
+            }
+        return {"elapsed_s": round(elapsed, 2), "routes": routes}
+
+
+def _percentile(samples, p):
+    """Nearest-rank percentile of sorted ``samples``."""
+    return samples[max(math.ceil(p * len(samples)) - 1, 0)]
+
+
+def _print_report(report):
+    print(
+        f"{'route':<42} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8}"
+        f" {'p99':>8} {'5xx':>7} {'4xx':>7}"
+    )
+    for key, row in report["routes"].items():
+        print(
+            f"{key:<42} {row['count']:>7} {row['rps']:>8.1f}"
+            f" {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}"
+            f" {row['p99_ms']:>8.1f} {row['error_rate']:>7.2%}"
+            f" {row['client_error_rate']:>7.2%}"
+        )
+    print(f"elapsed {report['elapsed_s']}s (latencies in ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="recorded JSON lines file")
+    source.add_argument("--mix", choices=sorted(MIXES))
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--rate", type=float, default=50.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--limit", type=int, help="replay at most N requests")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--url", help="send over HTTP instead of in-process")
+    parser.add_argument("--password", default="defaultpassword123")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.trace:
+        entries = load_trace(args.trace)
+    else:
+        entries = synthetic(args.mix, args.rate, args.duration, args.seed)
+    if args.limit:
+        entries = entries[: args.limit]
+
+    app = create_app(Config)
+    target = HttpTarget(args.url) if args.url else InProcessTarget(app)
+    replay = Replay(
+        app, target, LocalIds(args.seed), args.password, args.concurrency
+    )
+    report = replay.report(replay.run(entries, args.speed))
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(report, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from neomodel import config as neomodel_config
+
+from app.config import Config
+
+# Models install their constraints when imported unless told otherwise, and
+# the in-memory tests have no database to install them in.
+neomodel_config.AUTO_INSTALL_LABELS = False
+
+from app import create_app  # noqa: E402
+from app.cache import cache  # noqa: E402
+from app.repository import repository  # noqa: E402
+from app.repository.memory_repository import InMemoryRepository  # noqa: E402
+
+
+class TestConfig(Config):
+    TESTING = True
+    REPOSITORY_BACKEND = "memory"
+    CACHE_ENABLED = False
+    LIKED_CACHE_ENABLED = False
+    PURGE_ENABLED = False
+    EXPLORE_LOAD_ON_START = False
+    NOTIFICATIONS_ENABLED = False
+    METRICS_ENABLED = False
+
+
+@pytest.fixture(scope="session")
+def app():
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def graph(app):
+    """A fresh in-memory graph behind ``repository`` for each test."""
+    repository.backend = InMemoryRepository()
+    cache.clear()
+    return repository.backend
+
+
+@pytest.fixture
+def client(app, graph):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(app):
+    """Authorization headers for a user of the test graph."""
+
+    def headers(user):
+        with app.app_context():
+            token = create_access_token(identity=user.email)
+        return {"Authorization": f"Bearer {token}"}
+
+    return headers
+
+
+def add_user(graph, name):
+    return graph.add_user(
+        first_name=name,
+        last_name="Test",
+        email=f"{name.lower()}@example.com",
+        password="secret",
+    )
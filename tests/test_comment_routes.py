@@ -0,0 +1,37 @@
+import pytest
+
+from app.models.comment import Comment
+from app.models.user import User
+from tests.conftest import add_user
+
+
+@pytest.fixture
+def alice(graph, monkeypatch):
+    alice = add_user(graph, "Alice")
+    monkeypatch.setattr(User, "find_by_email", classmethod(lambda c, e: alice))
+    monkeypatch.setattr(Comment, "is_visible", classmethod(lambda c, u: True))
+    return alice
+
+
+@pytest.mark.parametrize(
+    "created, status", [(True, 201), (False, 200), (None, 404)]
+)
+def test_like_answers_from_the_write(
+    client, auth, monkeypatch, alice, created, status
+):
+    # None: the comment is gone by the time the write runs.
+    monkeypatch.setattr(Comment, "like", classmethod(lambda c, *a: created))
+
+    response = client.post("/comments/c1/like", headers=auth(alice))
+
+    assert response.status_code == status
+
+
+def test_unlike_without_a_like(client, auth, monkeypatch, alice):
+    monkeypatch.setattr(Comment, "unlike", classmethod(lambda c, *a: False))
+
+    response = client.delete("/comments/c1/like", headers=auth(alice))
+
+    assert response.get_json(force=True) == {
+        "message": "You haven't liked this comment yet"
+    }
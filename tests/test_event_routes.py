@@ -0,0 +1,29 @@
+import pytest
+
+from app.events import broker
+from app.models.user import User
+from tests.conftest import add_user
+
+
+@pytest.fixture
+def alice(graph, monkeypatch):
+    alice = add_user(graph, "Alice")
+    monkeypatch.setattr(User, "find_by_email", classmethod(lambda c, e: alice))
+    monkeypatch.setattr(User, "get_following_uuids", lambda self: [])
+    return alice
+
+
+def test_unread_stream_releases_its_subscription(client, auth, alice):
+    response = client.get("/events?posts=p1", headers=auth(alice))
+
+    assert response.status_code == 200
+    assert broker.subscriber_count() == 1
+    response.close()
+    assert broker.subscriber_count() == 0
+
+
+def test_head_request_releases_its_subscription(client, auth, alice):
+    response = client.head("/events", headers=auth(alice))
+    response.close()
+
+    assert broker.subscriber_count() == 0
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+from app.explore import ExploreBuffer
+from app.models.post import Post
+from app.models.user import User
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def posts_at(*minutes):
+    posts = []
+    for minute in minutes:
+        post = Post(text=f"at {minute}", images=[])
+        post.created_at = START + timedelta(minutes=minute)
+        posts.append(post)
+    return posts
+
+
+def texts(posts):
+    return [post.text for post in posts]
+
+
+def test_cursor_pages_the_same_posts_on_another_worker():
+    alice = User(first_name="Alice", last_name="Test", email="a@example.com")
+    posts = posts_at(1, 2, 3, 4)
+    first, second = ExploreBuffer(size=10), ExploreBuffer(size=10)
+    for post in posts:
+        first.add(post, alice)
+    # Another worker saw a post the first one did not, and in another order.
+    for post in [*posts_at(5), *posts[::-1]]:
+        second.add(post, alice)
+
+    page, cursor = first.page(limit=2)
+    rest, end = second.page(cursor, limit=2)
+
+    assert texts(page) == ["at 4", "at 3"]
+    assert texts(rest) == ["at 2", "at 1"]
+    assert end is None
@@ -0,0 +1,38 @@
+import pytest
+
+from app.cache import MemoryBackend, SqliteBackend
+from app.idempotency import PENDING, IdempotencyStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return lambda: MemoryBackend()
+    path = str(tmp_path / "idempotency.sqlite3")
+    return lambda: SqliteBackend(path)
+
+
+def test_add_only_sets_absent_or_expired_keys(backend):
+    store = backend()
+
+    assert store.add("k", 1, ttl=60)
+    assert not store.add("k", 2, ttl=60)
+    assert store.get("k") == 1
+    store.set("k", 3, ttl=-1)
+    assert store.add("k", 4, ttl=60)
+    assert store.get("k") == 4
+
+
+def test_a_claim_holds_until_it_is_finished(tmp_path):
+    path = str(tmp_path / "idempotency.sqlite3")
+    # Two workers of one host.
+    first = IdempotencyStore(backend=SqliteBackend(path))
+    second = IdempotencyStore(backend=SqliteBackend(path))
+
+    assert first.begin("k") is None
+    assert second.begin("k") == PENDING
+
+    first.finish("k", None)
+    assert second.begin("k") is None
+    second.finish("k", {"status": 201})
+    assert first.begin("k") == {"status": 201}
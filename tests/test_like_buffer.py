@@ -0,0 +1,55 @@
+import sys
+
+import pytest
+
+from app.like_buffer import LikeBuffer
+from app.liked_cache import LikedSet, liked_cache
+
+# ``app.like_buffer`` as an attribute is the LikeBuffer instance.
+like_buffer_module = sys.modules["app.like_buffer"]
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """The committed likes, as (user, post) pairs, of post "p1"."""
+    likes = set()
+
+    def read_query(query, params):
+        if params["post"] != "p1":
+            return [], None
+        return [[(params["user"], params["post"]) in likes]], None
+
+    def write_query(query, params):
+        for row in params["likes"]:
+            likes.add((row["user"], row["post"]))
+        for row in params["unlikes"]:
+            likes.discard((row["user"], row["post"]))
+        return [], None
+
+    monkeypatch.setattr(like_buffer_module, "read_query", read_query)
+    monkeypatch.setattr(like_buffer_module, "write_query", write_query)
+    return likes
+
+
+def test_set_like_decides_from_buffered_and_committed_state(stored):
+    buffer = LikeBuffer(enabled=True)
+    stored.add(("u1", "p1"))
+
+    assert buffer.set_like("u1", "p1", True) is False
+    assert buffer.set_like("u1", "p1", False) is True
+    assert buffer.set_like("u1", "p1", False) is False
+    assert buffer.set_like("u1", "p1", True) is True
+    assert buffer.set_like("u1", "missing", True) is None
+
+
+def test_liked_cache_learns_of_likes_when_they_flush(stored, monkeypatch):
+    monkeypatch.setattr(liked_cache, "enabled", True)
+    monkeypatch.setitem(liked_cache._users, "u1", LikedSet([], 1e18))
+    buffer = LikeBuffer(enabled=True)
+
+    buffer.set_like("u1", "p1", True)
+    assert "p1" not in liked_cache._users["u1"]
+
+    buffer.flush()
+    assert stored == {("u1", "p1")}
+    assert "p1" in liked_cache._users["u1"]
@@ -0,0 +1,10 @@
+from app.liked_cache import LikedSetCache
+
+
+def test_likes_by_many_users_stay_within_max_users():
+    cache = LikedSetCache(max_users=10)
+
+    for i in range(100):
+        cache.record(f"user-{i}", "post", True)
+
+    assert len(cache._users) <= 10
@@ -0,0 +1,142 @@
+"""
+Behaviour of ``InMemoryRepository`` on its own. These tests do not touch
+Neo4j; ``tests/test_repository_parity.py`` compares the two backends when
+a test database is configured.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from tests.conftest import add_user
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def at(minutes):
+    return START + timedelta(minutes=minutes)
+
+
+def texts(page):
+    return [item.text for item in page["results"]]
+
+
+def test_follow_is_idempotent_and_counted_both_ways(graph):
+    alice, bob = add_user(graph, "Alice"), add_user(graph, "Bob")
+
+    assert graph.follow(alice, bob)
+    assert not graph.follow(alice, bob)
+    assert not graph.follow(alice, alice)
+    assert graph.count_following(alice.uuid) == 1
+    assert graph.count_followers(bob.uuid) == 1
+
+    assert graph.unfollow(alice, bob)
+    assert not graph.unfollow(alice, bob)
+    assert graph.count_followers(bob.uuid) == 0
+
+
+def test_follower_pages_keep_follow_order(graph):
+    alice = add_user(graph, "Alice")
+    followers = [add_user(graph, f"F{i}") for i in range(5)]
+    for follower in followers:
+        graph.follow(follower, alice)
+    graph.follow(alice, followers[0])
+
+    page = graph.get_followers(alice, alice.uuid, page=2, page_size=2)
+
+    assert page["total"] == 5
+    assert [u.uuid for u in page["results"]] == [
+        followers[2].uuid,
+        followers[3].uuid,
+    ]
+    first = graph.get_followers(alice, alice.uuid, page=1, page_size=1)
+    assert first["results"][0]._is_following
+    assert first["results"][0]._follows_me
+
+
+def test_following_posts_merge_authors_newest_first(graph):
+    alice, bob, carol = (add_user(graph, n) for n in ("Alice", "Bob", "Carol"))
+    graph.follow(alice, bob)
+    graph.create_post(bob, "bob 1", [], created_at=at(1))
+    graph.create_post(alice, "alice 1", [], created_at=at(2))
+    graph.create_post(bob, "bob 2", [], created_at=at(3))
+    graph.create_post(carol, "carol 1", [], created_at=at(4))
+
+    page = graph.get_following_posts(alice, page=1, page_size=2)
+
+    assert page["total"] == 3
+    assert texts(page) == ["bob 2", "alice 1"]
+    assert texts(graph.get_following_posts(alice, page=2, page_size=2)) == [
+        "bob 1"
+    ]
+
+
+def test_post_card_counts_and_liked(graph):
+    alice, bob = add_user(graph, "Alice"), add_user(graph, "Bob")
+    post = graph.create_post(alice, "hello", [])
+    graph.like_post(bob, post.uuid)
+    graph.add_comment(bob, post.uuid, "nice")
+
+    card = graph.find_post(post.uuid, bob.uuid)
+
+    assert card._likes_count == 1
+    assert card._comments_count == 1
+    assert card._liked
+    assert not graph.find_post(post.uuid, alice.uuid)._liked
+    assert card._creator["uuid"] == alice.uuid
+
+    graph.unlike_post(bob, post.uuid)
+    assert not graph.find_post(post.uuid, bob.uuid)._liked
+
+
+def test_feed_ranks_followed_authors_above_own_and_second_degree(graph):
+    alice, bob, carol = (add_user(graph, n) for n in ("Alice", "Bob", "Carol"))
+    graph.follow(alice, bob)
+    graph.follow(bob, carol)
+    now = datetime.now(timezone.utc)
+    graph.create_post(carol, "carol", [], created_at=now)
+    graph.create_post(alice, "alice", [], created_at=now)
+    graph.create_post(bob, "bob", [], created_at=now)
+
+    page = graph.get_feed(alice, page=1, page_size=10)
+
+    assert page["total"] == 3
+    assert texts(page) == ["bob", "alice", "carol"]
+
+
+def test_comments_newest_first_with_first_replies(graph):
+    alice, bob = add_user(graph, "Alice"), add_user(graph, "Bob")
+    post = graph.create_post(alice, "hello", [])
+    first = graph.add_comment(bob, post.uuid, "first", created_at=at(1))
+    graph.add_comment(bob, post.uuid, "second", created_at=at(2))
+    for i in range(3):
+        graph.add_reply(alice, first.uuid, f"reply {i}")
+    graph.like_comment(alice, first.uuid)
+
+    page = graph.get_comments(post.uuid, alice.uuid, include_replies=2)
+
+    assert page["total"] == 2
+    assert texts(page) == ["second", "first"]
+    comment = page["results"][1]
+    assert comment._likes_count == 1
+    assert comment._liked
+    assert comment._replies_count == 3
+    assert [reply.text for reply in comment._replies] == [
+        "reply 0",
+        "reply 1",
+    ]
+    assert comment._replies_cursor is not None
+    assert page["results"][0]._replies_cursor is None
+
+
+def test_following_posts_endpoint_uses_the_repository(client, graph, auth):
+    alice, bob = add_user(graph, "Alice"), add_user(graph, "Bob")
+    graph.follow(alice, bob)
+    graph.create_post(bob, "bob 1", [], created_at=at(1))
+
+    response = client.get(
+        "/posts/following-posts?fields=uuid,text", headers=auth(alice)
+    )
+
+    assert response.status_code == 200
+    body = response.get_json(force=True)
+    assert body["total"] == 1
+    assert [post["text"] for post in body["results"]] == ["bob 1"]
@@ -0,0 +1,25 @@
+import sys
+
+from app.notifications import NotificationQueue
+
+notifications_module = sys.modules["app.notifications"]
+
+
+def test_an_actor_is_sent_once_per_target(monkeypatch):
+    sent = []
+
+    def write_query(query, params):
+        sent.append(params)
+        return [], None
+
+    monkeypatch.setattr(notifications_module, "write_query", write_query)
+    queue = NotificationQueue(enabled=True)
+    # Like, unlike (no notification) and like again, next to another like.
+    queue.notify("post_like", "bob", "p1")
+    queue.notify("post_like", "carol", "p1")
+    queue.notify("post_like", "bob", "p1")
+
+    queue.flush()
+
+    ((row,),) = [params["rows0"] for params in sent]
+    assert row["actors"] == ["bob", "carol"]
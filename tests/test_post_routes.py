@@ -0,0 +1,119 @@
+import pytest
+
+from app.models import user as user_model
+from tests.conftest import add_user
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Cypher sent by the user model, answered with no rows."""
+    sent = []
+
+    def read_query(query, params=None):
+        sent.append((query, params))
+        return [], None
+
+    monkeypatch.setattr(user_model, "read_query", read_query)
+    return sent
+
+
+@pytest.mark.parametrize("path", ["/posts/feed", "/posts/following-posts"])
+def test_since_returns_a_watermark_page(client, graph, auth, queries, path):
+    alice = add_user(graph, "Alice")
+
+    response = client.get(
+        f"{path}?since=1700000000&page_size=5", headers=auth(alice)
+    )
+
+    assert response.status_code == 200
+    assert response.get_json(force=True) == {
+        "since": "1700000000",
+        "watermark": "1700000000",
+        "has_more": False,
+        "results": [],
+    }
+    ((query, params),) = queries
+    assert "USING INDEX" not in query
+    assert params["since"] == 1700000000000000
+    assert params["since_uuid"] is None
+    assert params["limit"] == 6
+
+
+@pytest.mark.parametrize("path", ["/posts/feed", "/posts/following-posts"])
+def test_since_resumes_from_a_watermark(client, graph, auth, queries, path):
+    alice = add_user(graph, "Alice")
+
+    client.get(f"{path}?since=1700000000000001_p2", headers=auth(alice))
+
+    ((_, params),) = queries
+    assert (params["since"], params["since_uuid"]) == (1700000000000001, "p2")
+
+
+@pytest.mark.parametrize("path", ["/posts/feed", "/posts/following-posts"])
+def test_since_rejects_a_bad_watermark(client, graph, auth, queries, path):
+    alice = add_user(graph, "Alice")
+
+    response = client.get(f"{path}?since=yesterday", headers=auth(alice))
+
+    assert response.status_code == 400
+    assert not queries
+
+
+def test_like_is_decided_by_the_write(client, graph, auth):
+    alice, bob = add_user(graph, "Alice"), add_user(graph, "Bob")
+    post = graph.create_post(alice, "hello", [])
+    url = f"/posts/{post.uuid}/like"
+    # A like made without going through this endpoint.
+    graph.like_post(bob, post.uuid)
+
+    assert client.post(url, headers=auth(bob)).status_code == 200
+    assert client.delete(url, headers=auth(bob)).status_code == 200
+    assert client.delete(url, headers=auth(bob)).get_json(force=True) == {
+        "message": "You haven't liked this post yet."
+    }
+    assert client.post(url, headers=auth(bob)).status_code == 201
+    assert graph.find_post(post.uuid, bob.uuid)._likes_count == 1
+
+
+def test_like_of_a_missing_post(client, graph, auth):
+    alice = add_user(graph, "Alice")
+
+    response = client.post("/posts/missing/like", headers=auth(alice))
+
+    assert response.status_code == 404
+
+
+def test_post_detail_reloads_a_cached_post_when_its_stamp_changes(
+    client, graph, auth, monkeypatch
+):
+    from app.cache import cache
+    from app.models.post import Post
+    from app.models.user import User
+
+    alice = add_user(graph, "Alice")
+    stored = {"text": "first", "stamp": [1]}
+
+    def query_by_uuid(post_uuid, current_user_uuid):
+        post = Post(uuid=post_uuid, text=stored["text"], images=[])
+        post._creator = graph._creator_card(alice.uuid)
+        post._liked = False
+        return post
+
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(User, "find_by_email", classmethod(lambda c, e: alice))
+    monkeypatch.setattr(
+        Post, "get_version_stamp", classmethod(lambda c, *a: stored["stamp"])
+    )
+    monkeypatch.setattr(Post, "_query_by_uuid", staticmethod(query_by_uuid))
+
+    first = client.get("/posts/p1", headers=auth(alice))
+    # Edited through another worker: this worker's cache was not told.
+    stored.update(text="edited", stamp=[2])
+    second = client.get(
+        "/posts/p1",
+        headers={**auth(alice), "If-None-Match": first.headers["ETag"]},
+    )
+
+    assert second.status_code == 200
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert second.get_json(force=True)["text"] == "edited"
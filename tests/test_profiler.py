@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+from app.profiler import Profile
+
+
+def _frame(module, name, back=None):
+    return SimpleNamespace(
+        f_globals={"__name__": module},
+        f_code=SimpleNamespace(co_name=name),
+        f_back=back,
+    )
+
+
+def test_socket_read_under_the_driver_counts_as_db_wait():
+    route = _frame("app.routes.post_routes", "get")
+    driver = _frame("neo4j._sync.io._bolt", "fetch_message", route)
+    read = _frame("socket", "recv_into", _frame("ssl", "recv_into", driver))
+    profile = Profile()
+
+    profile.add(read)
+
+    assert (profile.db, profile.cpu) == (1, 0)
+    [stack] = profile.stacks
+    assert stack.startswith("db-wait;app.routes.post_routes:get;")
+
+
+def test_socket_read_outside_the_driver_counts_as_cpu():
+    read = _frame("socket", "recv_into", _frame("app.search", "query"))
+    profile = Profile()
+
+    profile.add(read)
+
+    assert (profile.db, profile.cpu) == (0, 1)
@@ -0,0 +1,18 @@
+from app import skills
+from app.skills import SkillCatalog
+
+
+def test_resolve_looks_up_skills_the_catalog_has_not_loaded(monkeypatch):
+    sent = []
+
+    def read_query(query, params=None):
+        sent.append(params)
+        if params is None:
+            return [["python", "Python", "s1", 3]], None
+        return [["s2"]], None
+
+    monkeypatch.setattr(skills, "read_query", read_query)
+    catalog = SkillCatalog()
+
+    assert catalog.resolve(["Python", " Rust "]) == ["s1", "s2"]
+    assert sent == [None, {"keys": ["rust"]}]
@@ -0,0 +1,57 @@
+import pytest
+
+from app.traffic import FREE_TEXT_ARGS, TrafficRecorder
+
+
+@pytest.fixture
+def recorder():
+    recorder = TrafficRecorder()
+    recorder._key = b"pseudonym key"
+    return recorder
+
+
+def test_free_text_query_args_become_placeholders(recorder):
+    args = recorder._sanitize(
+        {"q": ["Ann Smith"], "title": ["CTO"], "page": ["2"]},
+        free_text=FREE_TEXT_ARGS,
+    )
+
+    assert args == {"q": ["xxxxxxxxx"], "title": ["xxx"], "page": ["2"]}
+
+
+def test_body_secrets_are_dropped_and_emails_pseudonymized(recorder):
+    body = recorder._sanitize(
+        {
+            "email": "ann@example.com",
+            "password": "hunter2",
+            "refresh_token": "token",
+            "text": "hello",
+            "post_uuid": "p1",
+        },
+        placeholders=True,
+    )
+
+    assert body == {
+        "email": recorder.pseudonym("ann@example.com"),
+        "text": "xxxxx",
+        "post_uuid": "p1",
+    }
+    assert "ann" not in body["email"]
+
+
+def test_only_uuid_path_parameters_are_kept(recorder):
+    view_args = recorder._sanitize(
+        {"user_uuid": "u1", "name": "Ann"}, placeholders=True
+    )
+
+    assert view_args == {"user_uuid": "u1", "name": "xxx"}
+
+
+def test_recording_needs_a_pseudonym_key(app):
+    recorder = TrafficRecorder()
+    app.config["TRAFFIC_RECORD_PATH"] = "/tmp/trace.jsonl"
+    try:
+        with pytest.raises(ValueError):
+            recorder.init_app(app)
+    finally:
+        app.config["TRAFFIC_RECORD_PATH"] = None
@@ -0,0 +1,44 @@
+import json
+import os
+import time
+
+from app.trending import TrendingScorer
+
+
+def write(path, scores):
+    path.write_text(json.dumps({"saved_at": time.time(), "scores": scores}))
+
+
+def scorer(path):
+    scorer = TrendingScorer()
+    scorer.checkpoint_path = str(path)
+    return scorer
+
+
+def test_restore_sums_the_workers_checkpoints(tmp_path):
+    path = tmp_path / "trending"
+    write(tmp_path / "trending.1", {"a": 1.0, "b": 2.0})
+    write(tmp_path / "trending.2", {"a": 3.0})
+    worker = scorer(path)
+
+    worker.restore()
+
+    assert [(uuid, round(score, 6)) for uuid, score in worker.top()] == [
+        ("a", 4.0),
+        ("b", 2.0),
+    ]
+
+
+def test_checkpoint_holds_only_what_this_worker_saw(tmp_path):
+    path = tmp_path / "trending"
+    write(tmp_path / "trending.1", {"a": 1.0})
+    worker = scorer(path)
+    worker.restore()
+    worker.add("b", 1.0)
+
+    worker.checkpoint()
+    worker.restore()
+
+    assert os.path.exists(f"{path}.{os.getpid()}")
+    assert {uuid for uuid, _ in worker.top()} == {"a", "b"}
+    assert round(dict(worker.top())["a"], 6) == 1.0
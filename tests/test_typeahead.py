@@ -0,0 +1,77 @@
+import sys
+import time
+from threading import Event
+from types import SimpleNamespace
+
+from app.typeahead import UserTypeahead
+
+typeahead_module = sys.modules["app.typeahead"]
+
+
+def _user(uuid, first_name, last_name="Test"):
+    return SimpleNamespace(
+        uuid=uuid,
+        first_name=first_name,
+        last_name=last_name,
+        profile_image=None,
+        title=None,
+    )
+
+
+def _wait_for_rebuild(index):
+    deadline = time.monotonic() + 5
+    while index._rebuilding and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def _names(results):
+    return [user["first_name"] for user in results]
+
+
+def test_first_lookup_builds_in_the_background(monkeypatch):
+    release = Event()
+
+    def read_query(query):
+        release.wait(5)
+        return [("u1", "Alice", "Test", None, None)], None
+
+    monkeypatch.setattr(typeahead_module, "read_query", read_query)
+    index = UserTypeahead()
+
+    assert index.search("al", "viewer") == []
+
+    release.set()
+    _wait_for_rebuild(index)
+    assert _names(index.search("al", "viewer")) == ["Alice"]
+
+
+def test_updates_during_a_rebuild_survive_the_swap(monkeypatch):
+    started, release = Event(), Event()
+    rows = [("u1", "Alice", "Test", None, None)]
+
+    def read_query(query):
+        started.set()
+        release.wait(5)
+        return rows, None
+
+    monkeypatch.setattr(typeahead_module, "read_query", read_query)
+    index = UserTypeahead(ttl=0)
+    release.set()
+    index.build()
+    started.clear()
+    release.clear()
+
+    index.search("al", "viewer")
+    started.wait(5)
+    # Registered and renamed after the rebuild read the users.
+    index.update(_user("u2", "Alfred"))
+    index.update(_user("u1", "Alicia"))
+    release.set()
+    _wait_for_rebuild(index)
+
+    index.ttl = 600
+    assert sorted(_names(index.search("al", "viewer"))) == [
+        "Alfred",
+        "Alicia",
+    ]
+    assert index.search("alice", "viewer") == []